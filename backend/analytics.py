@@ -0,0 +1,297 @@
+import atexit
+import os
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+from models import *
+
+ROLLUP_DIMENSIONS = ('all', 'service', 'category', 'pincode', 'professional')
+ROLLUP_COUNTS = ('requested', 'accepted', 'rejected', 'cancelled', 'completed')
+ROLLUP_COUNTERS = ROLLUP_COUNTS + ('revenue', 'rating_sum', 'rating_count', 'accept_seconds', 'complete_seconds')
+
+class RollupBuffer:
+    """Request events summed in memory and added to daily_rollups in batches.
+
+    Handlers record (day, service, pincode, professional) deltas, which
+    cost a dict update. A per-process writer thread adds them to the
+    rollup rows every flush_interval seconds, expanding each one into the
+    all/service/category/pincode/professional rows it counts towards.
+
+    Deltas not yet written are lost if the process dies; the
+    rollup-analytics command rebuilds any range from the requests.
+    """
+
+    def __init__(self, flush_interval=30):
+        self.flush_interval = flush_interval
+        self.app = None
+        self._deltas = {}  # (day, service_id, pincode, professional_id) -> Counter
+        self._lock = threading.Lock()
+        self.writing = threading.RLock()  # held while deltas are written or rollups rebuilt
+        self._thread = None
+        self._thread_pid = None
+
+    def record(self, service_id, pincode, professional_id, at=None, **counters):
+        key = ((at or datetime.utcnow()).date(), service_id, pincode, professional_id)
+        with self._lock:
+            self._deltas.setdefault(key, Counter()).update(counters)
+        self._ensure_writer()
+
+    def _ensure_writer(self):
+        # Started on first use so each forked worker gets its own thread
+        with self._lock:
+            if self._thread is None or self._thread_pid != os.getpid() or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='analytics', daemon=True)
+                self._thread_pid = os.getpid()
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error writing analytics rollups: {e}")
+
+    def _take(self):
+        with self._lock:
+            deltas, self._deltas = self._deltas, {}
+        return deltas
+
+    def _restore(self, deltas):
+        with self._lock:
+            for key, counters in deltas.items():
+                self._deltas.setdefault(key, Counter()).update(counters)
+
+    def flush(self):
+        """Add everything recorded so far to daily_rollups"""
+        if self.app is None:
+            return
+        with self.writing:
+            self._write(self._take())
+
+    def _write(self, deltas):
+        if not deltas:
+            return
+        with self.app.app_context():
+            try:
+                add_to_rollups(expand_deltas(deltas))
+                db.session.commit()
+            except IntegrityError:
+                # Another worker inserted one of the same rows first; retry next time
+                db.session.rollback()
+                self._restore(deltas)
+            except Exception:
+                db.session.rollback()
+                self._restore(deltas)
+                raise
+
+rollup_buffer = RollupBuffer()
+
+def init_analytics(app):
+    # Write what a previous app recorded into its own database first
+    rollup_buffer.flush()
+    rollup_buffer.app = app
+    rollup_buffer.flush_interval = app.config['ANALYTICS_FLUSH_SECONDS']
+
+atexit.register(rollup_buffer.flush)
+
+def expand_deltas(deltas):
+    """{(day, service_id, pincode, professional_id): Counter} ->
+    {(day, dimension, key): Counter}, with categories looked up in one query"""
+    service_ids = {service_id for _, service_id, _, _ in deltas}
+    categories = dict(
+        db.session.query(Service.id, Service.category_id).filter(Service.id.in_(service_ids))
+    ) if service_ids else {}
+
+    rows = {}
+    for (day, service_id, pincode, professional_id), counters in deltas.items():
+        keys = {
+            'all': '',
+            'service': service_id,
+            'category': categories.get(service_id),
+            'pincode': pincode,
+            'professional': professional_id
+        }
+        for dimension, key in keys.items():
+            if key is None:
+                continue
+            rows.setdefault((day, dimension, str(key)), Counter()).update(counters)
+    return rows
+
+def add_to_rollups(rows):
+    """Add counters to existing rollup rows, inserting the missing ones"""
+    for (day, dimension, key), counters in rows.items():
+        counters = {name: value for name, value in counters.items() if value}
+        if not counters:
+            continue
+        updated = db.session.execute(
+            db.update(DailyRollup).where(
+                DailyRollup.day == day, DailyRollup.dimension == dimension, DailyRollup.key == key
+            ).values({name: getattr(DailyRollup, name) + value for name, value in counters.items()})
+        ).rowcount
+        if not updated:
+            db.session.add(DailyRollup(day=day, dimension=dimension, key=key, **counters))
+            db.session.flush()
+
+def record_request_event(kind, row, at=None):
+    """Count a request transition; row is a RETURNING row or ServiceRequest.
+
+    kind is the new status ('requested' for a new request). Accepted and
+    completed requests also add the time since they were requested, and
+    completed ones their total_amount as revenue.
+    """
+    at = at or datetime.utcnow()
+    counters = {kind: 1}
+    if kind == 'accepted':
+        counters['accept_seconds'] = (at - row.request_date).total_seconds()
+    elif kind == 'completed':
+        counters['complete_seconds'] = (at - row.request_date).total_seconds()
+        counters['revenue'] = row.total_amount or 0
+    rollup_buffer.record(row.service_id, row.location_pin, row.professional_id, at, **counters)
+
+def record_rating(service_request, rating_delta, count_delta):
+    rollup_buffer.record(
+        service_request.service_id, service_request.location_pin, service_request.professional_id,
+        rating_sum=rating_delta, rating_count=count_delta
+    )
+
+def rebuild_rollups(start_day, end_day):
+    """Recompute daily_rollups for [start_day, end_day) from the requests.
+
+    Each event is dated by its own column: request_date, accepted_at,
+    completion_date, and status_changed_at for rejections and
+    cancellations. Reviews count on the day they were written.
+    Returns the number of rollup rows written.
+
+    This process's buffered deltas are written first and the buffer stays
+    locked until the rows are replaced, so nothing it counted is added on
+    top of the rebuilt rows. Other workers' buffers are not reached: they
+    can still add the events of the last few seconds twice, which is why
+    rollup-analytics leaves today to the live counters.
+    """
+    with rollup_buffer.writing:
+        rollup_buffer.flush()
+        return _rebuild_rollups(start_day, end_day)
+
+def _rebuild_rollups(start_day, end_day):
+    start = datetime.combine(start_day, datetime.min.time())
+    end = datetime.combine(end_day, datetime.min.time())
+
+    def within(column):
+        return db.and_(column >= start, column < end)
+
+    deltas = {}
+    def add(at, row, professional_id, **counters):
+        key = (at.date(), row.service_id, row.location_pin, professional_id)
+        deltas.setdefault(key, Counter()).update(counters)
+
+    requests = db.session.query(
+        ServiceRequest.service_id, ServiceRequest.location_pin, ServiceRequest.professional_id,
+        ServiceRequest.status, ServiceRequest.request_date, ServiceRequest.accepted_at,
+        ServiceRequest.completion_date, ServiceRequest.status_changed_at, ServiceRequest.total_amount
+    ).filter(db.or_(
+        within(ServiceRequest.request_date),
+        within(ServiceRequest.accepted_at),
+        within(ServiceRequest.completion_date),
+        within(ServiceRequest.status_changed_at)
+    ))
+    for row in requests:
+        if row.request_date and start <= row.request_date < end:
+            # Nobody is assigned yet when a request is made
+            add(row.request_date, row, None, requested=1)
+        if row.accepted_at and start <= row.accepted_at < end:
+            add(row.accepted_at, row, row.professional_id, accepted=1,
+                accept_seconds=(row.accepted_at - row.request_date).total_seconds())
+        if row.status == 'completed' and row.completion_date and start <= row.completion_date < end:
+            add(row.completion_date, row, row.professional_id, completed=1, revenue=row.total_amount or 0,
+                complete_seconds=(row.completion_date - row.request_date).total_seconds())
+        if row.status in ('rejected', 'cancelled') and row.status_changed_at and start <= row.status_changed_at < end:
+            add(row.status_changed_at, row, row.professional_id, **{row.status: 1})
+
+    reviews = db.session.query(
+        Review.date_created, Review.rating, ServiceRequest.service_id,
+        ServiceRequest.location_pin, ServiceRequest.professional_id
+    ).join(
+        ServiceRequest, ServiceRequest.id == Review.service_request_id
+    ).filter(within(Review.date_created))
+    for row in reviews:
+        add(row.date_created, row, row.professional_id, rating_sum=row.rating, rating_count=1)
+
+    rows = expand_deltas(deltas)
+    db.session.execute(db.delete(DailyRollup).where(DailyRollup.day >= start_day, DailyRollup.day < end_day))
+    db.session.add_all(
+        DailyRollup(day=day, dimension=dimension, key=key, **counters)
+        for (day, dimension, key), counters in rows.items()
+    )
+    db.session.commit()
+    return len(rows)
+
+def rollup_backfill_range():
+    """(first day, day after the last) with a request event or review, or None"""
+    firsts = db.session.query(
+        db.func.min(ServiceRequest.request_date), db.func.min(Review.date_created)
+    ).select_from(ServiceRequest).outerjoin(Review, Review.service_request_id == ServiceRequest.id).one()
+    lasts = db.session.query(
+        db.func.max(ServiceRequest.request_date), db.func.max(ServiceRequest.accepted_at),
+        db.func.max(ServiceRequest.completion_date), db.func.max(ServiceRequest.status_changed_at),
+        db.func.max(Review.date_created)
+    ).select_from(ServiceRequest).outerjoin(Review, Review.service_request_id == ServiceRequest.id).one()
+    firsts = [moment for moment in firsts if moment is not None]
+    lasts = [moment for moment in lasts if moment is not None]
+    if not firsts:
+        return None
+    return min(firsts).date(), max(lasts).date() + timedelta(days=1)
+
+def rollup_stats(dimension, start_day, end_day, interval='total'):
+    """Summed rollups for [start_day, end_day) per key, per day/month/total.
+
+    Reads only daily_rollups (one row per day and key), so the cost
+    follows the date range, not the number of requests.
+    """
+    rows = db.session.query(
+        DailyRollup.key, DailyRollup.day, *[getattr(DailyRollup, name) for name in ROLLUP_COUNTERS]
+    ).filter(
+        DailyRollup.dimension == dimension,
+        DailyRollup.day >= start_day,
+        DailyRollup.day < end_day
+    ).order_by(DailyRollup.day, DailyRollup.key)
+
+    totals = {}
+    for row in rows:
+        if interval == 'day':
+            period = row.day.isoformat()
+        elif interval == 'month':
+            period = row.day.strftime('%Y-%m')
+        else:
+            period = None
+        counters = totals.setdefault((period, row.key), Counter())
+        counters.update({name: getattr(row, name) or 0 for name in ROLLUP_COUNTERS})
+
+    stats = []
+    for (period, key), counters in totals.items():
+        entry = {'key': key, 'period': period}
+        entry.update({name: counters[name] for name in ROLLUP_COUNTS})
+        entry['revenue'] = round(counters['revenue'], 2)
+        entry['completion_rate'] = ratio(counters['completed'], counters['requested'], 4)
+        entry['average_rating'] = ratio(counters['rating_sum'], counters['rating_count'], 2)
+        entry['average_accept_minutes'] = ratio(counters['accept_seconds'] / 60, counters['accepted'], 1)
+        entry['average_complete_minutes'] = ratio(counters['complete_seconds'] / 60, counters['completed'], 1)
+        stats.append(entry)
+    return stats
+
+def ratio(total, count, digits):
+    return round(total / count, digits) if count else None
+
+def rollup_labels(dimension, keys):
+    """Display names for rollup keys of a dimension, in one query"""
+    if dimension == 'service':
+        query = db.session.query(Service.id, Service.name).filter(Service.id.in_([int(k) for k in keys]))
+    elif dimension == 'category':
+        query = db.session.query(ServiceCategory.id, ServiceCategory.name).filter(ServiceCategory.id.in_([int(k) for k in keys]))
+    elif dimension == 'professional':
+        query = db.session.query(User.id, User.username).filter(User.id.in_([int(k) for k in keys]))
+    else:
+        return {key: key for key in keys}
+    return {str(id): name for id, name in query} if keys else {}
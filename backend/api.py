@@ -1,11 +1,43 @@
 from models import *
-from flask import Flask,jsonify,request,session,send_from_directory
+from instrumentation import *
+from metrics import *
+from catalog import *
+from dispatch import *
+from hashing import HashingBusy,password_hasher
+from identity import *
+from storage import *
+from images import *
+from notifications import *
+from events import *
+from scheduling import *
+from analytics import *
+from exports import *
+from imports import *
+from flask import Blueprint,current_app,jsonify,request,session
 from functools import wraps
 from werkzeug.utils import secure_filename
-import os,secrets
-import uuid
+from werkzeug.exceptions import RequestEntityTooLarge
+from sqlalchemy.exc import IntegrityError,SQLAlchemyError
+import os
+import base64,binascii
+from datetime import date,datetime,timedelta
 
-@app.before_request
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+bp = Blueprint('api', __name__)
+
+@bp.errorhandler(HashingBusy)
+def hashing_busy(e):
+    response = jsonify({'message': 'Server is busy, please try again shortly'})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+@bp.errorhandler(RequestEntityTooLarge)
+def upload_too_large(e):
+    return jsonify({'message': e.description}), 413
+
+@bp.before_app_request
 def make_session_temporary():
     if current_user.is_authenticated:
         session.permanent = False
@@ -20,9 +52,23 @@ def admin_required(f):
 
 def allowed_file(filename):
     return '.' in filename and \
-           filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
+           filename.rsplit('.', 1)[1].lower() in current_app.config['ALLOWED_EXTENSIONS']
+
+def catalog_response(name, build):
+    """Serve a catalog view from catalog_cache, answering 304 when unchanged.
+
+    build() returns the JSON-serializable data and only runs on a cache miss.
+    """
+    body, etag, last_modified = catalog_cache.get_or_build(
+        name, lambda: current_app.json.response(build()).get_data()
+    )
+    response = current_app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
 
-@app.route('/api/signin', methods=['POST'])
+@bp.route('/api/signin', methods=['POST'])
 def signin():
     # Get credentials from request
     data = request.json
@@ -40,7 +86,16 @@ def signin():
         return jsonify({'message': 'Your account has been blocked. Please contact support.'}), 403
 
     # Check if user exists and password is correct
-    if user and user.check_password(password):
+    password_ok = False
+    if user:
+        with metrics.timer('password_verify_seconds'):
+            password_ok = password_hasher.verify(user.password_hash, password)
+    if password_ok:
+        metrics.inc('logins_total', result='success')
+        # Upgrade hashes made with older parameters while we have the password
+        if password_hasher.needs_rehash(user.password_hash):
+            user.password_hash = password_hasher.hash(password)
+            db.session.commit()
         login_user(user)
         session.permanent = False
         return jsonify({
@@ -54,9 +109,10 @@ def signin():
             }
         }), 200
 
+    metrics.inc('logins_total', result='failure')
     return jsonify({'message': 'Invalid email or password'}), 401
     
-@app.route('/api/signup', methods=['POST'])
+@bp.route('/api/signup', methods=['POST'])
 def register():
     # get credentials 
     data = request.json
@@ -83,13 +139,14 @@ def register():
             is_valid, error_msg = user.validate_password(password)
             if not is_valid:
                 return jsonify({'message': error_msg}), 401
-            user.set_password(password)
+            user.password_hash = password_hasher.hash(password)
             db.session.add(user)
             db.session.commit()
+            metrics.inc('signups_total')
             return jsonify({'message': 'Registration successful'}), 201
 
 
-@app.route('/api/change-password', methods=['POST'])
+@bp.route('/api/change-password', methods=['POST'])
 @login_required
 def change_password():
     data = request.json
@@ -104,7 +161,7 @@ def change_password():
         }), 400
     
     # Verify current password
-    if not current_user.check_password(current_password):
+    if not password_hasher.verify(current_user.password_hash, current_password):
         return jsonify({
             'message': 'Current password is incorrect'
         }), 401
@@ -115,7 +172,8 @@ def change_password():
             'message': 'New passwords do not match'
         }), 400
         
-    if current_user.check_password(new_password):
+    # current_password was just verified, so comparing strings is enough
+    if new_password == current_password:
         return jsonify({'message': 'New password cannot be the same as the current password'}), 400
     
     # Validate new password requirements
@@ -127,7 +185,7 @@ def change_password():
     
     # Update password
     try:
-        current_user.set_password(new_password)
+        current_user.password_hash = password_hasher.hash(new_password)
         db.session.commit()
         return jsonify({
             'message': 'Password updated successfully'
@@ -140,7 +198,7 @@ def change_password():
             'error': str(e)  # Ensure the error is included in the response
         }), 500
 
-@app.route('/api/upload-profile-picture', methods=['POST'])
+@bp.route('/api/upload-profile-picture', methods=['POST'])
 @login_required
 def upload_profile_picture():
     if 'profile_picture' not in request.files:
@@ -153,39 +211,27 @@ def upload_profile_picture():
     if not allowed_file(file.filename):
         return jsonify({'message': 'Invalid file type'}), 400
 
-    # Ensure profile pictures folder exists
-    if not os.path.exists(app.config['PROFILE_PIC_FOLDER']):
-        os.makedirs(app.config['PROFILE_PIC_FOLDER'])
-
-    # Delete old profile picture if not default
-    if current_user.image_file != 'profile.png':
-        old_path = os.path.join(app.config['PROFILE_PIC_FOLDER'], current_user.image_file)
-        if os.path.exists(old_path):
-            try:
-                os.remove(old_path)
-            except:
-                pass
-
-    # Generate unique filename using user ID and random hex string
-    random_hex = secrets.token_hex(8)
-    ext = file.filename.rsplit('.', 1)[1].lower()
-    filename = f"user_{current_user.id}_{random_hex}.{ext}"
-    filepath = os.path.join(app.config['PROFILE_PIC_FOLDER'], filename)
-
+    old_image = current_user.image_file
     try:
-        file.save(filepath)
+        filename = store_upload(file, 'profile_pictures', current_app.config['MAX_IMAGE_BYTES'])
         current_user.image_file = filename  # Store only filename in DB
+        # Drop the old picture's reference if not default
+        if old_image != 'profile.png':
+            release_upload('profile_pictures', old_image)
         db.session.commit()
+        image_pipeline.submit('profile_pictures', filename)
         return jsonify({'message': 'Profile picture updated', 'filename': filename}), 200
+    except RequestEntityTooLarge:
+        raise
     except Exception as e:
         db.session.rollback()
         return jsonify({'message': 'Error saving profile picture', 'error': str(e)}), 500
 
-@app.route('/profile_pictures/<filename>')
+@bp.route('/profile_pictures/<filename>')
 def serve_profile_picture(filename):
-    return send_from_directory(app.config['PROFILE_PIC_FOLDER'], filename)
+    return image_response('profile_pictures', filename, request.args.get('size'))
 
-@app.route('/api/current_user', methods=['GET'])
+@bp.route('/api/current_user', methods=['GET'])
 @login_required
 def current_user_info():
     # Check if the user is blocked
@@ -202,32 +248,27 @@ def current_user_info():
         'is_blocked': current_user.is_blocked 
     }
 
-    if current_user.role in ['professional', 'user']:
-        professional = Professional.query.get(current_user.id)
-        if professional:
-            user_data['verification_status'] = professional.verification_status
+    if current_user.role in ['professional', 'user'] and current_user.verification_status is not None:
+        user_data['verification_status'] = current_user.verification_status
 
-    # Fetch default address for phone number
-    default_address = Address.query.filter_by(
-        user_id=current_user.id,
-        is_default=True
-    ).first()
+    # Default address (with the phone number) comes from the identity cache
+    default_address = current_user.default_address
 
     if default_address:
-        user_data['phone_number'] = default_address.phone_number
+        user_data['phone_number'] = default_address['phone_number']
         user_data['address'] = {
-            'id': default_address.id,
-            'address_line1': default_address.address_line1,
-            'address_line2': default_address.address_line2,
-            'city': default_address.city,
-            'state': default_address.state,
-            'pincode': default_address.pincode,
-            'is_default': default_address.is_default
+            'id': default_address['id'],
+            'address_line1': default_address['address_line1'],
+            'address_line2': default_address['address_line2'],
+            'city': default_address['city'],
+            'state': default_address['state'],
+            'pincode': default_address['pincode'],
+            'is_default': default_address['is_default']
         }
 
     return jsonify({'user': user_data}), 200
 
-@app.route('/api/logout')
+@bp.route('/api/logout')
 @login_required
 def logout():
     logout_user()
@@ -236,7 +277,7 @@ def logout():
         'message': 'Sign Out! Successful'
     }),200
     
-@app.route('/api/data')
+@bp.route('/api/data')
 def get_data():
     return jsonify({
         'message': 'Successfully connected to Flask backend!'
@@ -244,43 +285,31 @@ def get_data():
 
 def save_service_image(file):
     if file and allowed_file(file.filename):
-        filename = secure_filename(file.filename)
-        # Create a unique filename using random hex
-        unique_filename = f"{secrets.token_hex(8)}_{filename}"
-        # Create service upload folder if it doesn't exist
-        os.makedirs(app.config['SERVICE_UPLOAD_FOLDER'], exist_ok=True)
-        # Save the file
-        file_path = os.path.join(app.config['SERVICE_UPLOAD_FOLDER'], unique_filename)
-        file.save(file_path)
-        return unique_filename
+        filename = store_upload(file, 'services', current_app.config['MAX_IMAGE_BYTES'])
+        image_pipeline.submit('services', filename)
+        return filename
     return None
 
 def delete_service_image(filename):
     if filename and filename != 'service-default.png':
-        try:
-            file_path = os.path.join(app.config['SERVICE_UPLOAD_FOLDER'], filename)
-            if os.path.exists(file_path):
-                os.remove(file_path)
-                return True
-        except Exception as e:
-            print(f"Error deleting file: {e}")
+        release_upload('services', filename)
+        return True
     return False
 
-@app.route('/api/services', methods=['GET', 'POST'])
+@bp.route('/api/services', methods=['GET', 'POST'])
 @admin_required
 @login_required
 def handle_services():
     if request.method == 'GET':
         # List all services with category info
-        services = Service.query.all()
-        return jsonify([{
+        return catalog_response('services:all', lambda: [{
             'id': s.id,
             'name': s.name,
             'is_active': s.is_active,
             'category': s.category_info.name if s.category_info else None,
             'category_id': s.category_id,
             'image_file': s.image_file
-        } for s in services])
+        } for s in Service.query.options(db.joinedload(Service.category_info)).all()])
     
     elif request.method == 'POST':
         # Handle form data
@@ -291,6 +320,10 @@ def handle_services():
         base_price = request.form.get('base_price')
         category_id = request.form.get('category_id')
         
+        # Validate input presence
+        if name is None or description is None or time_required is None or base_price is None:
+            return jsonify({'message': 'Required fields are missing'}), 400
+
         # Handle file upload
         image_file = 'service-default.png'  # Default image
         if 'service_image' in request.files:
@@ -300,10 +333,6 @@ def handle_services():
                 if saved_filename:
                     image_file = saved_filename
 
-        # Validate input presence
-        if name is None or description is None or time_required is None or base_price is None:
-            return jsonify({'message': 'Required fields are missing'}), 400
-
         try:
             service = Service(
                 name=name,
@@ -324,6 +353,7 @@ def handle_services():
                     loc = ServiceLocation(service_id=service.id, pin_code=pincode)
                     db.session.add(loc)
                 db.session.commit()
+            invalidate_catalog()
             
             return jsonify({
                 'message': 'Service added successfully',
@@ -331,16 +361,14 @@ def handle_services():
             }), 201
 
         except Exception as e:
+            # The rollback also drops the new image's reference and its blob
             db.session.rollback()
-            # Clean up the uploaded file if there was an error
-            if image_file != 'service-default.png':
-                delete_service_image(image_file)
             return jsonify({
                 'message': 'Error adding service',
                 'error': str(e)
             }), 500
 
-@app.route('/api/services/<int:service_id>', methods=['GET', 'PUT', 'DELETE', 'PATCH'])
+@bp.route('/api/services/<int:service_id>', methods=['GET', 'PUT', 'DELETE', 'PATCH'])
 @admin_required
 @login_required
 def handle_single_service(service_id):
@@ -390,7 +418,7 @@ def handle_single_service(service_id):
                 saved_filename = save_service_image(file)
                 if saved_filename:
                     service.image_file = saved_filename
-                    # Delete old image after updating database entry
+                    # Release old image; its file goes once this commits
                     if old_image != 'service-default.png':
                         delete_service_image(old_image)
         
@@ -410,6 +438,7 @@ def handle_single_service(service_id):
         
         try:
             db.session.commit()
+            invalidate_catalog()
             return jsonify({'message': 'Service updated successfully'})
         except Exception as e:
             db.session.rollback()
@@ -424,6 +453,7 @@ def handle_single_service(service_id):
             # Service locations will be deleted due to cascade
             db.session.delete(service)
             db.session.commit()
+            invalidate_catalog()
             return jsonify({'message': 'Service deleted successfully'})
         except Exception as e:
             db.session.rollback()
@@ -432,6 +462,7 @@ def handle_single_service(service_id):
     elif request.method == 'PATCH':
         service.is_active = not service.is_active
         db.session.commit()
+        invalidate_catalog()
         return jsonify({'message': 'Service status updated', 'is_active': service.is_active}), 200
     
     elif request.method == 'DELETE':
@@ -454,19 +485,18 @@ def handle_single_service(service_id):
         return jsonify({'message': 'Service status updated', 'is_active': service.is_active}), 200
 
 
-@app.route('/api/categories', methods=['GET', 'POST'])
+@bp.route('/api/categories', methods=['GET', 'POST'])
 @admin_required
 @login_required
 def handle_categories():
     if request.method == 'GET':
         # List all categories
-        categories = ServiceCategory.query.all()
-        return jsonify([{
+        return catalog_response('categories:all', lambda: [{
             'id': c.id,
             'name': c.name,
             'description': c.description,
             'is_active': c.is_active
-        } for c in categories])
+        } for c in ServiceCategory.query.all()])
     
     elif request.method == 'POST':
         data = request.json
@@ -489,6 +519,7 @@ def handle_categories():
             )
             db.session.add(category)
             db.session.commit()
+            invalidate_catalog()
             
             return jsonify({
                 'message': 'Category added successfully',
@@ -502,7 +533,7 @@ def handle_categories():
                 'error': str(e)
             }), 500
 
-@app.route('/api/categories/<int:category_id>', methods=['GET', 'PUT', 'DELETE', 'PATCH'])
+@bp.route('/api/categories/<int:category_id>', methods=['GET', 'PUT', 'DELETE', 'PATCH'])
 @admin_required
 @login_required
 def handle_single_category(category_id):
@@ -536,6 +567,7 @@ def handle_single_category(category_id):
         
         try:
             db.session.commit()
+            invalidate_catalog()
             return jsonify({'message': 'Category updated successfully'})
         except Exception as e:
             db.session.rollback()
@@ -551,6 +583,7 @@ def handle_single_category(category_id):
         try:
             db.session.delete(category)
             db.session.commit()
+            invalidate_catalog()
             return jsonify({'message': 'Category deleted successfully'})
         except Exception as e:
             db.session.rollback()
@@ -559,46 +592,60 @@ def handle_single_category(category_id):
     elif request.method == 'PATCH':
         category.is_active = not category.is_active
         db.session.commit()
+        invalidate_catalog()
         return jsonify({
             'message': 'Category status updated', 
             'is_active': category.is_active
         }), 200
 
-@app.route('/api/categories/active', methods=['GET'])
+@bp.route('/api/categories/active', methods=['GET'])
+@query_budget(2)
 def get_active_categories():
     """Get all active categories - available to all users"""
     try:
-        categories = ServiceCategory.query.filter_by(is_active=True).all()
-        return jsonify([{
+        return catalog_response('categories:active', lambda: [{
             'id': c.id,
             'name': c.name,
-        } for c in categories])
+        } for c in ServiceCategory.query.filter_by(is_active=True).all()])
     except Exception as e:
         return jsonify({'message': 'Error fetching categories', 'error': str(e)}), 500
 
 
-@app.route('/api/services/active', methods=['GET'])
+@bp.route('/api/services/active', methods=['GET'])
+@query_budget(3)
 def get_active_services():
+    """Get active services, optionally only those offered in ?pincode="""
     try:
-        services = Service.query.filter_by(is_active=True).all()
-        return jsonify([{
-            'id': service.id,
-            'name': service.name,
-            'description': service.description,
-            'time_required': service.time_required,
-            'base_price': service.base_price,
-            'image_file': service.image_file,
-            'category_id': service.category_id,
-            'service_pincodes': [loc.pin_code for loc in service.locations]
-        } for service in services])
+        pincode = request.args.get('pincode', '').strip()
+
+        def build():
+            query = Service.query.filter_by(is_active=True)
+            if pincode:
+                service_ids = service_ids_for_pincode(pincode)
+                services = query.filter(Service.id.in_(service_ids)).all() if service_ids else []
+            else:
+                services = query.options(db.selectinload(Service.locations)).all()
+
+            return [{
+                'id': service.id,
+                'name': service.name,
+                'description': service.description,
+                'time_required': service.time_required,
+                'base_price': service.base_price,
+                'image_file': service.image_file,
+                'category_id': service.category_id,
+                'service_pincodes': [pincode] if pincode else [loc.pin_code for loc in service.locations]
+            } for service in services]
+
+        return catalog_response(f'services:active:{pincode}', build)
     except Exception as e:
         return jsonify({'message': 'Error fetching services', 'error': str(e)}), 500
     
-@app.route('/service_images/<filename>')
+@bp.route('/service_images/<filename>')
 def serve_service_image(filename):
-    return send_from_directory(app.config['SERVICE_UPLOAD_FOLDER'], filename)
+    return image_response('services', filename, request.args.get('size'))
 
-@app.route('/api/service-actions', methods=['POST'])
+@bp.route('/api/service-actions', methods=['POST'])
 @login_required
 def handle_service_action():
     data = request.json
@@ -650,7 +697,7 @@ def handle_service_action():
         db.session.rollback()
         return jsonify({'message': str(e)}), 500
 
-@app.route('/api/register-professional', methods=['POST'])
+@bp.route('/api/register-professional', methods=['POST'])
 @login_required
 def register_professional():
     try:
@@ -698,13 +745,8 @@ def register_professional():
             if not document_file.filename.lower().endswith('.pdf'):
                 return jsonify({'message': 'Only PDF files are allowed'}), 400
             
-            # Check file size (20MB limit)
-            MAX_FILE_SIZE = 20 * 1024 * 1024  # 20MB in bytes
-            document_file.seek(0, os.SEEK_END)
-            file_size = document_file.tell()
-            document_file.seek(0)  # Reset file pointer to beginning
-            
-            if file_size > MAX_FILE_SIZE:
+            # Size was counted while the upload streamed in (20MB limit)
+            if spool_upload(document_file).size > current_app.config['MAX_DOCUMENT_BYTES']:
                 return jsonify({'message': 'File size exceeds 20MB limit'}), 400
 
         # Handle Address data instead of Customer data
@@ -766,25 +808,16 @@ def register_professional():
         if has_file:
             document_file = request.files['document']
             
-            # Generate a secure filename
-            secure_filename = f"{uuid.uuid4()}_{document_file.filename}"
-            
-            # Save file to upload folder
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename)
-            document_file.save(file_path)
+            # Store by content hash; resubmitting the same PDF reuses the blob
+            secure_filename = store_upload(document_file, '', current_app.config['MAX_DOCUMENT_BYTES'])
             
             # Check if document already exists for this professional
             existing_document = ProfessionalDocument.query.filter_by(professional_id=user.id).first()
             
             if existing_document:
-                # Remove old file from filesystem if it exists
+                # Release the old file; it is removed once this commits
                 if existing_document.document_url:
-                    try:
-                        old_file_path = os.path.join(app.config['UPLOAD_FOLDER'], existing_document.document_url)
-                        if os.path.exists(old_file_path):
-                            os.remove(old_file_path)
-                    except Exception as e:
-                        print(f"Error removing old document: {str(e)}")
+                    release_upload('', existing_document.document_url)
                 
                 # Update existing document record
                 existing_document.document_type = '.pdf'
@@ -805,15 +838,18 @@ def register_professional():
                 db.session.add(new_document)
 
         db.session.commit()
+        identity_cache.invalidate(user.id)
 
         return jsonify({'message': 'Registration submitted for verification'}), 201
         
+    except RequestEntityTooLarge:
+        raise
     except Exception as e:
         db.session.rollback()
         print(f"Error in registration: {str(e)}")
         return jsonify({'message': f'Registration failed: {str(e)}'}), 500
 
-@app.route('/api/service-actions/<action_type>', methods=['GET'])
+@bp.route('/api/service-actions/<action_type>', methods=['GET'])
 @login_required
 def get_service_actions(action_type):
     actions = UserServiceAction.query.filter_by(
@@ -832,7 +868,7 @@ def get_service_actions(action_type):
         }
     } for action in actions])
 
-@app.route('/api/service-actions/<int:action_id>', methods=['PATCH', 'DELETE'])
+@bp.route('/api/service-actions/<int:action_id>', methods=['PATCH', 'DELETE'])
 @login_required
 def update_service_action(action_id):
     action = UserServiceAction.query.get_or_404(action_id)
@@ -876,7 +912,7 @@ def update_service_action(action_id):
                 'error': str(e)
             }), 500
     
-@app.route('/api/addresses', methods=['POST'])
+@bp.route('/api/addresses', methods=['POST'])
 @login_required
 def add_address():
     data = request.json
@@ -903,6 +939,7 @@ def add_address():
     db.session.add(new_address)
     try:
         db.session.commit()
+        identity_cache.invalidate(current_user.id)
         return jsonify({
             "message": "Address added",
             "address": {
@@ -920,7 +957,7 @@ def add_address():
         db.session.rollback()
         return jsonify({"message": "Error adding address", "error": str(e)}), 500
     
-@app.route('/api/addresses', methods=['GET'])
+@bp.route('/api/addresses', methods=['GET'])
 @login_required
 def get_addresses():
     addresses = Address.query.filter_by(user_id=current_user.id).all()
@@ -935,7 +972,7 @@ def get_addresses():
         "is_default": addr.is_default
     } for addr in addresses])
 
-@app.route('/api/block-user', methods=['POST'])
+@bp.route('/api/block-user', methods=['POST'])
 @admin_required
 @login_required
 def block_user():
@@ -958,6 +995,11 @@ def block_user():
 
     user.is_blocked = not user.is_blocked
     db.session.commit()
+    identity_cache.invalidate(user.id)
+    if user.role == 'professional':
+        # Blocked professionals drop out of offers and free-slot lookups
+        dispatch_index.invalidate()
+        schedule_index.invalidate()
 
     # If the user is blocked, log them out immediately
     if user.is_blocked:
@@ -969,7 +1011,7 @@ def block_user():
         'email': user.email
     }), 200
 
-@app.route('/api/pending-professionals', methods=['GET'])
+@bp.route('/api/pending-professionals', methods=['GET'])
 @admin_required
 def get_pending_professionals():
     pending_pros = Professional.query.filter_by(verification_status='pending').all()
@@ -999,7 +1041,7 @@ def get_pending_professionals():
     
     return jsonify(result), 200
 
-@app.route('/api/update-professional-status/<int:pro_id>', methods=['PATCH'])
+@bp.route('/api/update-professional-status/<int:pro_id>', methods=['PATCH'])
 @admin_required
 def update_professional_status(pro_id):
     data = request.json
@@ -1027,17 +1069,19 @@ def update_professional_status(pro_id):
     
     try:
         db.session.commit()
+        dispatch_index.invalidate()
+        identity_cache.invalidate(pro_id)
         return jsonify({'message': 'Status updated successfully'}), 200
     except Exception as e:
         db.session.rollback()
         return jsonify({'message': str(e)}), 500
 
-@app.route('/documents/<filename>')
+@bp.route('/documents/<filename>')
 @admin_required
 def serve_document(filename):
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    return send_upload(filename, private=True)
 
-@app.route('/api/orders/<int:order_id>', methods=['GET'])
+@bp.route('/api/orders/<int:order_id>', methods=['GET'])
 @login_required
 def get_order_details(order_id):
     order = ServiceRequest.query.get_or_404(order_id)
@@ -1074,7 +1118,7 @@ def get_order_details(order_id):
         'total': total
     })
 
-@app.route('/api/service-requests', methods=['POST'])
+@bp.route('/api/service-requests', methods=['POST'])
 @login_required
 def create_service_request():
     """Handle creation of service requests from both cart and buy-now flows"""
@@ -1098,69 +1142,116 @@ def create_service_request():
         except ValueError:
             return jsonify({'error': 'Invalid date format'}), 400
 
-        # 3. Prepare items based on order type
-        items = []
+        # 3. Claim the idempotency key first, so a retried checkout
+        #    returns the original requests instead of booking twice
+        idempotency_key = request.headers.get('Idempotency-Key')
+        checkout = None
+        if idempotency_key:
+            if len(idempotency_key) > 64:
+                return jsonify({'error': 'Idempotency-Key is too long'}), 400
+            checkout = CheckoutKey(user_id=current_user.id, key=idempotency_key)
+            db.session.add(checkout)
+            try:
+                db.session.flush()
+            except IntegrityError:
+                db.session.rollback()
+                previous = CheckoutKey.query.filter_by(
+                    user_id=current_user.id,
+                    key=idempotency_key
+                ).first()
+                return jsonify({
+                    'message': 'Service requests created successfully',
+                    'requests': [int(i) for i in previous.request_ids.split(',') if i] if previous.request_ids else []
+                }), 200
+
+        # 4. Prepare items based on order type
         if data['orderType'] == 'cart':
-            # Get all cart items
-            cart_items = UserServiceAction.query.filter_by(
+            items = db.session.query(
+                UserServiceAction.service_id,
+                UserServiceAction.quantity
+            ).filter_by(
                 user_id=current_user.id,
                 action_type='cart'
-            ).join(Service).all()
-
-            for item in cart_items:
-                items.append({
-                    'service_id': item.service_id,
-                    'quantity': item.quantity or 1
-                })
-
-            # Delete all cart items
-            UserServiceAction.query.filter_by(
+            ).all()
+            clear_actions = UserServiceAction.query.filter_by(
                 user_id=current_user.id,
                 action_type='cart'
-            ).delete()
+            )
         else:
             # Buy now flow - single item
-            service_id = data.get('serviceId')
-            if not service_id:
+            if not data.get('serviceId'):
+                db.session.rollback()
                 return jsonify({'error': 'serviceId required for buy_now'}), 400
-
-            quantity = data.get('quantity', 1)
-            items.append({
-                'service_id': service_id,
-                'quantity': quantity
-            })
-
-            # Delete buy_now entry if exists
-            UserServiceAction.query.filter_by(
+            try:
+                # The checkout page sends these from the query string, as strings
+                service_id = int(data['serviceId'])
+                quantity = int(data.get('quantity') or 1)
+            except (TypeError, ValueError):
+                db.session.rollback()
+                return jsonify({'error': 'serviceId and quantity must be integers'}), 400
+
+            items = [(service_id, quantity)]
+            clear_actions = UserServiceAction.query.filter_by(
                 user_id=current_user.id,
                 action_type='buy_now',
                 service_id=service_id
-            ).delete()
+            )
 
-        # Create service requests
-        created_requests = []
-        for item in items:
-            # Get the service details
-            service = Service.query.get(item['service_id'])
-            if not service:
-                return jsonify({'error': f'Service {item["service_id"]} not found'}), 404
+        # 5. Price and time every item from a single IN query over the services
+        services = {
+            service_id: (base_price, time_required)
+            for service_id, base_price, time_required in db.session.query(
+                Service.id, Service.base_price, Service.time_required
+            ).filter(Service.id.in_({service_id for service_id, _ in items}))
+        } if items else {}
+
+        rows = []
+        for service_id, quantity in items:
+            if service_id not in services:
+                db.session.rollback()
+                return jsonify({'error': f'Service {service_id} not found'}), 404
+            quantity = quantity or 1
+            base_price, time_required = services[service_id]
+            rows.append({
+                'service_id': service_id,
+                'user_id': current_user.id,
+                'professional_id': None,
+                'scheduled_date': scheduled_date,
+                'scheduled_end': booking_end(scheduled_date, time_required, quantity, schedule_index.default_minutes),
+                'location_pin': address.pincode,
+                'total_amount': float(base_price or 0) * int(quantity),
+                'quantity': quantity,
+                'status': 'pending'
+            })
 
-            total_amount = float(service.base_price or 0) * int(item['quantity'] or 1)
-
-            service_request = ServiceRequest(
-                service_id=item['service_id'],
-                user_id=current_user.id,
-                professional_id=None,
-                scheduled_date=scheduled_date,
-                location_pin=address.pincode,
-                total_amount=total_amount,
-                quantity=item['quantity'],
-                status='pending'
-            )
-            db.session.add(service_request)
-            created_requests.append(service_request.id)
+        # 6. Bulk insert, clear the cart/buy-now entries and commit together
+        created = []
+        if rows:
+            created = db.session.execute(
+                db.insert(ServiceRequest).returning(
+                    ServiceRequest.id,
+                    ServiceRequest.status,
+                    ServiceRequest.user_id,
+                    ServiceRequest.professional_id,
+                    ServiceRequest.scheduled_date,
+                    ServiceRequest.service_id,
+                    ServiceRequest.location_pin,
+                    ServiceRequest.request_date
+                ),
+                rows
+            ).all()
+        created_requests = sorted(row.id for row in created)
+        clear_actions.delete()
+        if checkout is not None:
+            checkout.request_ids = ','.join(str(i) for i in created_requests)
 
         db.session.commit()
+        metrics.inc('service_requests_created_total', len(created_requests))
+        offers = dispatch_requests(created_requests)
+        notification_queue.fan_out(offers)
+        for row in created:
+            event_hub.publish_request('created', row, offers.get(row.id, ()))
+            record_request_event('requested', row, row.request_date)
 
         return jsonify({
             'message': 'Service requests created successfully',
@@ -1171,7 +1262,7 @@ def create_service_request():
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
     
-@app.route('/api/service-actions/cart', methods=['GET'])
+@bp.route('/api/service-actions/cart', methods=['GET'])
 @login_required
 def get_cart_items():
     cart_items = UserServiceAction.query.filter_by(
@@ -1190,57 +1281,16 @@ def get_cart_items():
         }
     } for item in cart_items]), 200
 
-@app.route('/api/professional/service-requests', methods=['GET'])
+@bp.route('/api/professional/service-requests', methods=['GET'])
 @login_required
+@query_budget(4)
 def get_professional_requests():
     try:
         if current_user.role != 'professional':
             return jsonify({'message': 'Access denied'}), 403
 
-        # Get professional's service type
-        service_type = db.session.query(Professional.service_type).filter(
-            Professional.id == current_user.id
-        ).scalar()
-
-        # Get professional's default address pincode
-        address = Address.query.filter_by(
-            user_id=current_user.id, 
-            is_default=True
-        ).first()
-
-        if not service_type or not address:
-            return jsonify([]), 200
-
-        # Query matching service requests
-        requests = ServiceRequest.query.filter(
-            ServiceRequest.service_id == service_type,
-            ServiceRequest.location_pin == address.pincode,
-            ServiceRequest.status == 'pending',
-            ServiceRequest.professional_id.is_(None)
-        ).all()
-
-        response_data = []
-        for req in requests:
-            # Explicitly fetch user and address
-            user = User.query.get(req.user_id)
-            user_address = Address.query.filter_by(
-                user_id=user.id, 
-                is_default=True
-            ).first() if user else None
-
-            address_str = (
-                f"{user_address.address_line1}, {user_address.city}" 
-                if user_address else "Address not available"
-            )
-
-            response_data.append({
-                'id': req.id,
-                'service_name': Service.query.get(req.service_id).name,
-                'scheduled_date': req.scheduled_date.isoformat(),
-                'user_address': address_str,
-                'quantity': req.quantity,
-                'total_amount': req.total_amount
-            })
+        # Requests offered to this professional by the dispatch index
+        response_data = get_dispatch_index().offers_for(current_user.id)
 
         return jsonify(response_data), 200
 
@@ -1248,26 +1298,76 @@ def get_professional_requests():
         print(f"Error in get_professional_requests: {str(e)}")
         return jsonify({'message': 'Internal server error'}), 500
 
-@app.route('/api/professional/service-requests/<int:request_id>', methods=['PATCH'])
+def transition_request(req_id, conditions, values):
+    """Compare-and-set a service request's state in a single UPDATE.
+
+    values are only applied if every condition still holds, so concurrent
+    writers cannot both win. Returns the updated row, or None if the request
+    no longer matched (the caller works out why and answers 4xx).
+    """
+    stmt = db.update(ServiceRequest).where(
+        ServiceRequest.id == req_id, *conditions
+    ).values(**values).returning(
+        ServiceRequest.id,
+        ServiceRequest.status,
+        ServiceRequest.user_id,
+        ServiceRequest.professional_id,
+        ServiceRequest.scheduled_date,
+        ServiceRequest.service_id,
+        ServiceRequest.location_pin,
+        ServiceRequest.scheduled_end,
+        ServiceRequest.request_date,
+        ServiceRequest.total_amount,
+        ServiceRequest.accepted_at,
+        ServiceRequest.completion_date
+    ).execution_options(synchronize_session=False)
+
+    try:
+        row = db.session.execute(stmt).first()
+        db.session.commit()
+        return row
+    except IntegrityError:
+        # unique_professional_scheduling lost a race with another accept
+        db.session.rollback()
+        return None
+
+@bp.route('/api/professional/service-requests/<int:request_id>', methods=['PATCH'])
 @login_required
 def handle_service_request(request_id):
     if current_user.role != 'professional':
         return jsonify({'message': 'Access denied'}), 403
 
-    req = ServiceRequest.query.get_or_404(request_id)
     data = request.get_json()
+    action = data.get('action')
+    open_request = [ServiceRequest.status == 'pending', ServiceRequest.professional_id.is_(None)]
+
+    if action == 'accept':
+        # No other accepted/pending booking of ours overlapping this one
+        other = db.aliased(ServiceRequest)
+        clash = db.exists().where(
+            other.professional_id == current_user.id,
+            overlapping(other, ServiceRequest.scheduled_date, ServiceRequest.scheduled_end),
+            other.status.in_(BOOKED_STATUSES)
+        )
+        now = datetime.utcnow()
+        row = transition_request(
+            request_id,
+            open_request + [~clash],
+            {'professional_id': current_user.id, 'status': 'accepted', 'accepted_at': now, 'status_changed_at': now}
+        )
+    elif action == 'reject':
+        row = transition_request(request_id, open_request, {'status': 'rejected', 'status_changed_at': datetime.utcnow()})
+    else:
+        return jsonify({'message': 'Invalid action'}), 400
 
-    if req.professional_id is not None:
-        return jsonify({'message': 'Request already handled'}), 400
-
-    if data.get('action') == 'accept':
-        # Check for existing bookings at this time
-        existing_booking = ServiceRequest.query.filter(
-            ServiceRequest.professional_id == current_user.id,
-            ServiceRequest.scheduled_date == req.scheduled_date,
-            ServiceRequest.status.in_(['accepted', 'pending'])
-        ).first()
+    if row is None:
+        req = ServiceRequest.query.get_or_404(request_id)
+        if req.professional_id is not None or req.status != 'pending':
+            return jsonify({'message': 'Request already handled'}), 409
 
+        existing_booking = find_overlapping_booking(
+            current_user.id, req.scheduled_date, req.scheduled_end or req.scheduled_date
+        )
         if existing_booking:
             return jsonify({
                 'message': 'You already have a booking scheduled at this time',
@@ -1277,75 +1377,113 @@ def handle_service_request(request_id):
                     'scheduled_date': existing_booking.scheduled_date.isoformat()
                 }
             }), 409
-
-        req.professional_id = current_user.id
-        req.status = 'accepted'
-    elif data.get('action') == 'reject':
-        req.status = 'rejected'
-    else:
-        return jsonify({'message': 'Invalid action'}), 400
-
-    try:
-        db.session.commit()
-        return jsonify({
-            'message': f'Request {data["action"]}ed successfully',
-            'request': {
-                'id': req.id,
-                'status': req.status,
-                'professional_id': req.professional_id,
-                'scheduled_date': req.scheduled_date.isoformat()
-            }
-        }), 200
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({
-            'message': 'Error updating request',
-            'error': str(e)
-        }), 500
+        return jsonify({'message': 'Request was updated concurrently, please retry'}), 409
+
+    offered_to = dispatch_index.remove_request(row.id)
+    if row.status == 'accepted':
+        metrics.inc('service_requests_accepted_total')
+        dispatch_index.adjust_load(current_user.id, 1)
+        schedule_index.book(
+            current_user.id, row.id, row.scheduled_date, row.scheduled_end or row.scheduled_date
+        )
+    notification_queue.notify(
+        row.user_id, f'request_{row.status}', f'Your service request #{row.id} was {row.status}', row.id
+    )
+    event_hub.publish_request(row.status, row, offered_to)
+    record_request_event(row.status, row, row.accepted_at)
+    return jsonify({
+        'message': f'Request {action}ed successfully',
+        'request': {
+            'id': row.id,
+            'status': row.status,
+            'professional_id': row.professional_id,
+            'scheduled_date': row.scheduled_date.isoformat()
+        }
+    }), 200
 
 def serialize_request(request):
     """Serialize a ServiceRequest object to JSON"""
-    service = Service.query.get(request.service_id)
-    professional = Professional.query.get(request.professional_id) if request.professional_id else None
-    user = User.query.get(request.user_id) if request.user_id else None
-    address = Address.query.filter_by(user_id=user.id, is_default=True).first() if user else None
-    if address:
-        address_parts = [
-            address.address_line1,
-            address.address_line2 if address.address_line2 else None,
-            f"{address.city}, {address.state}",
-            address.pincode
-        ]
-        full_address = ", ".join(filter(None, address_parts))
-    else:
-        full_address = "Address not available"
-    
-    # Get review if exists
-    review = Review.query.filter_by(service_request_id=request.id).first()
-    
-    return {
-        'id': request.id,
-        'service_id': request.service_id,
-        'service_name': service.name if service else 'Service not available',
-        'user_id': request.user_id,
-        'professional_id': request.professional_id,
-        'professional_name': professional.username if professional else 'Not assigned',
-        'request_date': request.request_date.isoformat() if request.request_date else None,
-        'scheduled_date': request.scheduled_date.isoformat() if request.scheduled_date else None,
-        'completion_date': request.completion_date.isoformat() if request.completion_date else None,
-        'status': request.status,
-        'location_pin': request.location_pin,
-        'total_amount': request.total_amount,
-        'quantity': request.quantity,
-        'rating': review.rating if review else None,
-        'review_comment': review.comment if review else None,
-        'user_address': full_address,
-        'scheduled_date': request.scheduled_date.isoformat() if request.scheduled_date else None,
-    }
+    return serialize_requests([request])[0]
+
+def serialize_requests(requests):
+    """Serialize a list of ServiceRequest objects to JSON.
+
+    Related services, professionals, default addresses and reviews are
+    loaded with one IN query each instead of per request.
+    """
+    if not requests:
+        return []
+
+    service_ids = {req.service_id for req in requests}
+    professional_ids = {req.professional_id for req in requests if req.professional_id}
+    user_ids = {req.user_id for req in requests if req.user_id}
+    request_ids = [req.id for req in requests]
+
+    services = {s.id: s for s in Service.query.filter(Service.id.in_(service_ids)).all()}
+    professional_names = dict(
+        db.session.query(Professional.id, Professional.username)
+        .filter(Professional.id.in_(professional_ids)).all()
+    ) if professional_ids else {}
+
+    # Keep the first default address/review per key, matching .first()
+    addresses = {}
+    if user_ids:
+        for address in Address.query.filter(
+            Address.user_id.in_(user_ids),
+            Address.is_default == True
+        ).order_by(Address.id).all():
+            addresses.setdefault(address.user_id, address)
+
+    reviews = {}
+    for review in Review.query.filter(
+        Review.service_request_id.in_(request_ids)
+    ).order_by(Review.id).all():
+        reviews.setdefault(review.service_request_id, review)
+
+    result = []
+    for request in requests:
+        service = services.get(request.service_id)
+        professional_name = professional_names.get(request.professional_id) if request.professional_id else None
+        address = addresses.get(request.user_id)
+        if address:
+            address_parts = [
+                address.address_line1,
+                address.address_line2 if address.address_line2 else None,
+                f"{address.city}, {address.state}",
+                address.pincode
+            ]
+            full_address = ", ".join(filter(None, address_parts))
+        else:
+            full_address = "Address not available"
+
+        review = reviews.get(request.id)
+
+        result.append({
+            'id': request.id,
+            'service_id': request.service_id,
+            'service_name': service.name if service else 'Service not available',
+            'user_id': request.user_id,
+            'professional_id': request.professional_id,
+            'professional_name': professional_name if professional_name else 'Not assigned',
+            'request_date': request.request_date.isoformat() if request.request_date else None,
+            'scheduled_date': request.scheduled_date.isoformat() if request.scheduled_date else None,
+            'completion_date': request.completion_date.isoformat() if request.completion_date else None,
+            'status': request.status,
+            'location_pin': request.location_pin,
+            'total_amount': request.total_amount,
+            'quantity': request.quantity,
+            'rating': review.rating if review else None,
+            'review_comment': review.comment if review else None,
+            'user_address': full_address,
+            'scheduled_date': request.scheduled_date.isoformat() if request.scheduled_date else None,
+        })
+
+    return result
 
 # Add these new routes to your existing api.py
-@app.route('/api/professional/accepted-requests', methods=['GET'])
+@bp.route('/api/professional/accepted-requests', methods=['GET'])
 @login_required
+@query_budget(6)
 def get_accepted_requests():
     if current_user.role != 'professional':
         return jsonify({'error': 'Access denied'}), 403
@@ -1353,11 +1491,12 @@ def get_accepted_requests():
     requests = ServiceRequest.query.filter_by(
         professional_id=current_user.id,
         status='accepted'
-    ).all()
-    return jsonify([serialize_request(req) for req in requests])
+    ).order_by(ServiceRequest.id).all()
+    return jsonify(serialize_requests(requests))
 
-@app.route('/api/professional/completed-requests', methods=['GET'])
+@bp.route('/api/professional/completed-requests', methods=['GET'])
 @login_required
+@query_budget(6)
 def get_completed_pro_requests():
     if current_user.role != 'professional':
         return jsonify({'error': 'Access denied'}), 403
@@ -1365,22 +1504,24 @@ def get_completed_pro_requests():
     requests = ServiceRequest.query.filter_by(
         professional_id=current_user.id,
         status='completed'
-    ).all()
-    return jsonify([serialize_request(req) for req in requests])
+    ).order_by(ServiceRequest.id).all()
+    return jsonify(serialize_requests(requests))
 
-@app.route('/api/user/current-requests', methods=['GET'])
+@bp.route('/api/user/current-requests', methods=['GET'])
 @login_required
+@query_budget(6)
 def get_user_requests():
     if current_user.role != 'user':
         return jsonify({'error': 'Access denied'}), 403
     
     requests = ServiceRequest.query.filter_by(
         user_id=current_user.id
-    ).filter(ServiceRequest.status.in_(['pending', 'accepted'])).all()
-    return jsonify([serialize_request(req) for req in requests])
+    ).filter(ServiceRequest.status.in_(['pending', 'accepted'])).order_by(ServiceRequest.id).all()
+    return jsonify(serialize_requests(requests))
 
-@app.route('/api/user/completed-requests', methods=['GET'])
+@bp.route('/api/user/completed-requests', methods=['GET'])
 @login_required
+@query_budget(6)
 def get_completed_user_requests():
     if current_user.role != 'user':
         return jsonify({'error': 'Access denied'}), 403
@@ -1388,48 +1529,96 @@ def get_completed_user_requests():
     requests = ServiceRequest.query.filter_by(
         user_id=current_user.id,
         status='completed'
-    ).all()
-    return jsonify([serialize_request(req) for req in requests])
+    ).order_by(ServiceRequest.id).all()
+    return jsonify(serialize_requests(requests))
 
-@app.route('/api/service-requests/<int:req_id>/unassign', methods=['PATCH'])
+@bp.route('/api/service-requests/<int:req_id>/unassign', methods=['PATCH'])
 @login_required
 def unassign_request(req_id):
-    req = ServiceRequest.query.get_or_404(req_id)
-    
-    if current_user.role != 'professional' or req.professional_id != current_user.id:
+    if current_user.role != 'professional':
         return jsonify({'error': 'Access denied'}), 403
-    
-    req.professional_id = None
-    req.status = 'pending'
-    db.session.commit()
+
+    row = transition_request(
+        req_id,
+        [ServiceRequest.professional_id == current_user.id, ServiceRequest.status == 'accepted'],
+        {'professional_id': None, 'status': 'pending', 'status_changed_at': datetime.utcnow()}
+    )
+    if row is None:
+        req = ServiceRequest.query.get_or_404(req_id)
+        if req.professional_id != current_user.id:
+            return jsonify({'error': 'Access denied'}), 403
+        return jsonify({'error': f'Request is already {req.status}'}), 409
+
+    dispatch_index.adjust_load(current_user.id, -1)
+    offers = dispatch_requests([row.id])
+    schedule_index.release(row.id)
+    notification_queue.notify(
+        row.user_id, 'request_unassigned',
+        f'Your professional withdrew from service request #{row.id}; it is open again', row.id
+    )
+    notification_queue.fan_out(offers)
+    event_hub.publish_request('unassigned', row, offers[row.id])
     return jsonify({'message': 'Request unassigned'})
 
-@app.route('/api/service-requests/<int:req_id>/cancel', methods=['PATCH'])
+@bp.route('/api/service-requests/<int:req_id>/cancel', methods=['PATCH'])
 @login_required
 def cancel_request(req_id):
-    req = ServiceRequest.query.get_or_404(req_id)
-    
-    if current_user.role != 'user' or req.user_id != current_user.id:
+    if current_user.role != 'user':
         return jsonify({'error': 'Access denied'}), 403
-    
-    req.status = 'cancelled'
-    db.session.commit()
+
+    row = transition_request(
+        req_id,
+        [ServiceRequest.user_id == current_user.id, ServiceRequest.status.in_(['pending', 'accepted'])],
+        {'status': 'cancelled', 'status_changed_at': datetime.utcnow()}
+    )
+    if row is None:
+        req = ServiceRequest.query.get_or_404(req_id)
+        if req.user_id != current_user.id:
+            return jsonify({'error': 'Access denied'}), 403
+        return jsonify({'error': f'Request is already {req.status}'}), 409
+
+    metrics.inc('service_requests_cancelled_total')
+    offered_to = dispatch_index.remove_request(row.id)
+    schedule_index.release(row.id)
+    if row.professional_id:
+        # Only accepted requests carry a professional
+        dispatch_index.adjust_load(row.professional_id, -1)
+        notification_queue.notify(
+            row.professional_id, 'request_cancelled', f'Service request #{row.id} was cancelled', row.id
+        )
+    event_hub.publish_request('cancelled', row, offered_to)
+    record_request_event('cancelled', row)
     return jsonify({'message': 'Request cancelled'})
 
-@app.route('/api/service-requests/<int:req_id>/complete', methods=['PATCH'])
+@bp.route('/api/service-requests/<int:req_id>/complete', methods=['PATCH'])
 @login_required
 def complete_request(req_id):
-    req = ServiceRequest.query.get_or_404(req_id)
-    
-    if current_user.role != 'user' or req.user_id != current_user.id:
+    if current_user.role != 'user':
         return jsonify({'error': 'Access denied'}), 403
-    
-    req.status = 'completed'
-    req.completion_date = datetime.utcnow()
-    db.session.commit()
+
+    now = datetime.utcnow()
+    row = transition_request(
+        req_id,
+        [ServiceRequest.user_id == current_user.id, ServiceRequest.status == 'accepted'],
+        {'status': 'completed', 'completion_date': now, 'status_changed_at': now}
+    )
+    if row is None:
+        req = ServiceRequest.query.get_or_404(req_id)
+        if req.user_id != current_user.id:
+            return jsonify({'error': 'Access denied'}), 403
+        return jsonify({'error': f'Request is {req.status}, only accepted requests can be completed'}), 409
+
+    metrics.inc('service_requests_completed_total')
+    dispatch_index.adjust_load(row.professional_id, -1)
+    schedule_index.release(row.id)
+    notification_queue.notify(
+        row.professional_id, 'request_completed', f'Service request #{row.id} was marked completed', row.id
+    )
+    event_hub.publish_request('completed', row)
+    record_request_event('completed', row, row.completion_date)
     return jsonify({'message': 'Request marked as completed'})
 
-@app.route('/api/reviews', methods=['GET', 'POST'])
+@bp.route('/api/reviews', methods=['GET', 'POST'])
 @login_required
 def handle_reviews():
     if request.method == 'GET':
@@ -1454,6 +1643,9 @@ def handle_reviews():
         
         if not request_id:
             return jsonify({'error': 'request_id is required'}), 400
+        rating = parse_rating(data.get('rating'))
+        if rating is None:
+            return jsonify({'error': 'rating must be a whole number from 1 to 5'}), 400
         
         # Get professional_id from service request
         service_request = ServiceRequest.query.get(request_id)
@@ -1472,20 +1664,25 @@ def handle_reviews():
             service_request_id=request_id,
             professional_id=service_request.professional_id,
             user_id=current_user.id,
-            rating=data['rating'],
+            rating=rating,
             comment=data.get('comment', '')
         )
         
         try:
             db.session.add(review)
+            update_professional_rating(review.professional_id, review.rating, 1)
             db.session.commit()
-            update_professional_rating(review.professional_id)
+            record_rating(service_request, review.rating, 1)
+            notification_queue.notify(
+                review.professional_id, 'review',
+                f'You received a {review.rating}-star review for service request #{request_id}', service_request.id
+            )
             return jsonify({'message': 'Review created'}), 201
         except Exception as e:
             db.session.rollback()
             return jsonify({'error': str(e)}), 500
 
-@app.route('/api/reviews/<int:review_id>', methods=['PUT'])
+@bp.route('/api/reviews/<int:review_id>', methods=['PUT'])
 @login_required
 def update_review(review_id):
     review = Review.query.get(review_id)
@@ -1494,18 +1691,23 @@ def update_review(review_id):
         return jsonify({'message': 'Unauthorized'}), 403
             
     data = request.json
-    review.rating = data['rating']
+    rating = parse_rating(data.get('rating'))
+    if rating is None:
+        return jsonify({'error': 'rating must be a whole number from 1 to 5'}), 400
+    old_rating = review.rating
+    review.rating = rating
     review.comment = data.get('comment', '')
     
     try:
+        update_professional_rating(review.professional_id, review.rating - old_rating, 0)
         db.session.commit()
-        update_professional_rating(review.professional_id)
+        record_rating(review.service_request, review.rating - old_rating, 0)
         return jsonify({'message': 'Review updated'}), 200
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/service-requests/<int:req_id>', methods=['GET', 'PATCH'])
+@bp.route('/api/service-requests/<int:req_id>', methods=['GET', 'PATCH'])
 @login_required
 def service_request(req_id):
     req = ServiceRequest.query.get_or_404(req_id)
@@ -1532,34 +1734,75 @@ def service_request(req_id):
                 return jsonify({'error': 'Invalid date format'}), 400
         
         # Update quantity and recalculate total
+        rescheduled = 'scheduled_date' in data or 'quantity' in data
+        service = Service.query.get(req.service_id) if rescheduled else None
         if 'quantity' in data:
             req.quantity = int(data['quantity'])
-            service = Service.query.get(req.service_id)
             if service:
                 req.total_amount = service.base_price * req.quantity
 
+        if rescheduled:
+            req.scheduled_end = booking_end(
+                req.scheduled_date, service.time_required if service else None, req.quantity,
+                schedule_index.default_minutes
+            )
+            if req.professional_id and req.status in BOOKED_STATUSES:
+                existing_booking = find_overlapping_booking(
+                    req.professional_id, req.scheduled_date, req.scheduled_end, exclude_id=req.id
+                )
+                if existing_booking:
+                    db.session.rollback()
+                    return jsonify({
+                        'error': 'The professional has another booking at this time',
+                        'conflicting_request': {
+                            'id': existing_booking.id,
+                            'scheduled_date': existing_booking.scheduled_date.isoformat()
+                        }
+                    }), 409
+
         try:
             db.session.commit()
+            if req.professional_id and req.status in BOOKED_STATUSES:
+                schedule_index.book(req.professional_id, req.id, req.scheduled_date, req.scheduled_end)
             return jsonify(serialize_request(req)), 200
         except Exception as e:
             db.session.rollback()
             return jsonify({'error': str(e)}), 500
 
-def update_professional_rating(professional_id):
-    professional = Professional.query.get(professional_id)
-    if not professional:
-        return
-    
-    reviews = Review.query.filter_by(professional_id=professional_id).all()
-    if not reviews:
-        professional.rating = 3.0
-    else:
-        total = sum(review.rating for review in reviews)
-        professional.rating = round(total / len(reviews), 1)
-    
-    db.session.commit()
+def parse_rating(value):
+    """A review's star rating as an int from 1 to 5, or None if it isn't one"""
+    if isinstance(value, bool):
+        return None
+    try:
+        rating = int(value)
+    except (TypeError, ValueError):
+        return None
+    if isinstance(value, float) and value != rating:
+        return None
+    return rating if 1 <= rating <= 5 else None
+
+def update_professional_rating(professional_id, rating_delta, count_delta):
+    """Apply a review change to a professional's running rating aggregates.
+
+    Runs as one UPDATE in the caller's transaction; the caller commits.
+    """
+    professionals = Professional.__table__
+    review_count = professionals.c.review_count + count_delta
+    rating_sum = professionals.c.rating_sum + rating_delta
+    db.session.execute(
+        db.update(professionals)
+        .where(professionals.c.id == professional_id)
+        .values(
+            review_count=review_count,
+            rating_sum=rating_sum,
+            rating=db.case(
+                (review_count > 0, db.func.round(db.cast(rating_sum, db.Float) / review_count, 1)),
+                else_=3.0
+            )
+        )
+    )
 
-@app.route('/api/professionals/worst-performing')
+@bp.route('/api/professionals/worst-performing')
 @admin_required
 @login_required
 def get_worst_performers():
@@ -1585,8 +1828,382 @@ def get_worst_performers():
         print(f"Error fetching worst performers: {str(e)}")
         return jsonify({'error': 'Failed to fetch performance data'}), 500
     
-@app.route('/api/admin/service-requests', methods=['GET'])
+def encode_cursor(moment, row_id):
+    """Build an opaque keyset cursor from a row's (timestamp, id); the
+    timestamp may be None"""
+    raw = f"{moment.isoformat() if moment else ''}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor, raises ValueError on malformed input"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        moment, row_id = raw.rsplit('|', 1)
+        return datetime.fromisoformat(moment) if moment else None, int(row_id)
+    except (UnicodeDecodeError, binascii.Error, ValueError):
+        raise ValueError('Invalid cursor')
+
+def after_cursor(moment_column, id_column, cursor):
+    """Filter for the rows after a cursor when paging by (moment, id)
+    newest first; rows without a timestamp sort last, as SQLite orders them"""
+    last_moment, last_id = decode_cursor(cursor)
+    if last_moment is None:
+        return db.and_(moment_column.is_(None), id_column < last_id)
+    return db.or_(
+        moment_column < last_moment,
+        db.and_(moment_column == last_moment, id_column < last_id),
+        moment_column.is_(None)
+    )
+
+@bp.route('/api/admin/service-requests', methods=['GET'])
 @admin_required
+@query_budget(7)
 def get_all_service_requests():
-    requests = ServiceRequest.query.all()
-    return jsonify([serialize_request(req) for req in requests])
\ No newline at end of file
+    """Return one page of service requests, newest first.
+
+    Supports filtering on status, service_id, professional_id, location_pin
+    and a scheduled_from/scheduled_to range. The next page is requested by
+    passing the X-Next-Cursor header value back as ?cursor=.
+    """
+    query = ServiceRequest.query
+
+    try:
+        limit = min(int(request.args.get('limit', DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE)
+        if limit < 1:
+            raise ValueError
+    except ValueError:
+        return jsonify({'error': 'limit must be a positive integer'}), 400
+
+    if request.args.get('status'):
+        query = query.filter(ServiceRequest.status.in_(request.args['status'].split(',')))
+    if request.args.get('location_pin'):
+        query = query.filter(ServiceRequest.location_pin == request.args['location_pin'])
+
+    for field in ('service_id', 'professional_id'):
+        value = request.args.get(field)
+        if value:
+            if not value.isdigit():
+                return jsonify({'error': f'{field} must be an integer'}), 400
+            query = query.filter(getattr(ServiceRequest, field) == int(value))
+
+    try:
+        if request.args.get('scheduled_from'):
+            query = query.filter(ServiceRequest.scheduled_date >= datetime.fromisoformat(request.args['scheduled_from']))
+        if request.args.get('scheduled_to'):
+            query = query.filter(ServiceRequest.scheduled_date < datetime.fromisoformat(request.args['scheduled_to']))
+    except ValueError:
+        return jsonify({'error': 'Invalid date format'}), 400
+
+    # Count with the filters only, before ordering and the cursor are applied
+    total = query.order_by(None).with_entities(db.func.count(ServiceRequest.id)).scalar()
+
+    if request.args.get('cursor'):
+        try:
+            query = query.filter(after_cursor(ServiceRequest.request_date, ServiceRequest.id, request.args['cursor']))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+    # Fetch one extra row to know whether another page exists
+    page = query.order_by(
+        ServiceRequest.request_date.desc(),
+        ServiceRequest.id.desc()
+    ).limit(limit + 1).all()
+    has_more = len(page) > limit
+    page = page[:limit]
+
+    response = jsonify(serialize_requests(page))
+    response.headers['X-Total-Count'] = str(total)
+    if has_more:
+        response.headers['X-Next-Cursor'] = encode_cursor(page[-1].request_date, page[-1].id)
+    return response
+
+@bp.route('/api/admin/sql-metrics', methods=['GET'])
+@admin_required
+def get_sql_metrics():
+    """Per-endpoint query counts, DB time and N+1 suspects for this process"""
+    return jsonify(sql_metrics.snapshot()), 200
+
+@bp.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus scrape endpoint covering every worker process"""
+    token = current_app.config['METRICS_TOKEN']
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return jsonify({'error': 'Access denied'}), 403
+    return current_app.response_class(scrape(), mimetype='text/plain; version=0.0.4')
+
+
+@bp.route('/healthz', methods=['GET'])
+def healthz():
+    """Liveness: the worker is up and serving requests"""
+    return jsonify({'status': 'ok'}), 200
+
+@bp.route('/readyz', methods=['GET'])
+def readyz():
+    """Readiness: the worker can reach the database"""
+    try:
+        db.session.execute(db.text('SELECT 1'))
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        current_app.logger.error(f"Readiness check failed: {e}")
+        return jsonify({'status': 'unavailable', 'database': 'unreachable'}), 503
+    return jsonify({'status': 'ok', 'database': 'ok'}), 200
+
+@bp.route('/api/notifications', methods=['GET'])
+@login_required
+@query_budget(2)
+def get_notifications():
+    """One page of the current user's notifications, newest first.
+
+    ?unread=true returns unread ones only, read from the
+    (recipient_id, is_read, created_at) index in order. The next page is
+    requested by passing the X-Next-Cursor header value back as ?before=.
+    """
+    try:
+        limit = min(int(request.args.get('limit', DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE)
+        if limit < 1:
+            raise ValueError
+    except ValueError:
+        return jsonify({'error': 'limit must be a positive integer'}), 400
+
+    query = Notification.query.filter(Notification.recipient_id == current_user.id)
+    if request.args.get('unread') == 'true':
+        query = query.filter(Notification.is_read == False)
+    if request.args.get('before'):
+        try:
+            query = query.filter(after_cursor(Notification.created_at, Notification.id, request.args['before']))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+    page = query.order_by(Notification.created_at.desc(), Notification.id.desc()).limit(limit + 1).all()
+    has_more = len(page) > limit
+    page = page[:limit]
+
+    response = jsonify([{
+        'id': n.id,
+        'type': n.type,
+        'message': n.message,
+        'service_request_id': n.service_request_id,
+        'created_at': n.created_at.isoformat(),
+        'is_read': n.is_read
+    } for n in page])
+    if has_more:
+        response.headers['X-Next-Cursor'] = encode_cursor(page[-1].created_at, page[-1].id)
+    return response
+
+@bp.route('/api/notifications/unread-count', methods=['GET'])
+@login_required
+@query_budget(2)
+def get_unread_notification_count():
+    count = db.session.query(db.func.count(Notification.id)).filter(
+        Notification.recipient_id == current_user.id,
+        Notification.is_read == False
+    ).scalar()
+    return jsonify({'unread': count}), 200
+
+@bp.route('/api/notifications/mark-read', methods=['POST'])
+@login_required
+def mark_notifications_read():
+    """Mark the given ids, or with {"all": true} every notification, as read"""
+    data = request.get_json() or {}
+    query = db.update(Notification).where(
+        Notification.recipient_id == current_user.id,
+        Notification.is_read == False
+    )
+    if not data.get('all'):
+        ids = data.get('ids')
+        if not isinstance(ids, list) or not all(isinstance(i, int) for i in ids):
+            return jsonify({'error': 'Provide ids as a list of integers or all: true'}), 400
+        query = query.where(Notification.id.in_(ids))
+
+    updated = db.session.execute(query.values(is_read=True)).rowcount
+    db.session.commit()
+    return jsonify({'message': 'Notifications marked as read', 'updated': updated}), 200
+
+@bp.route('/api/events', methods=['GET'])
+@login_required
+def event_stream():
+    """Server-sent events for the current user's service requests.
+
+    Admins get every request.* event, professionals the ones for the
+    requests assigned to them and the open requests dispatch offered them,
+    users the ones for their own requests.
+    """
+    pubsub = event_hub.open_stream(subscriber_channels(current_user))
+    if pubsub is None:
+        response = jsonify({'error': 'Too many open event streams, retry later'})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(event_hub.heartbeat)
+        return response
+
+    response = current_app.response_class(event_hub.stream(pubsub), mimetype='text/event-stream')
+    response.call_on_close(lambda: event_hub.close_stream(pubsub))
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # nginx must not buffer the stream
+    return response
+
+def schedule_query_args():
+    """(service, pincode, quantity, error) from the query string; error is a response or None"""
+    try:
+        service_id = int(request.args['service_id'])
+        quantity = int(request.args.get('quantity', 1))
+        if quantity < 1:
+            raise ValueError
+    except (KeyError, ValueError):
+        return None, None, None, (jsonify({'error': 'service_id and a positive quantity are required'}), 400)
+
+    pincode = request.args.get('pincode')
+    if not pincode and current_user.default_address:
+        pincode = current_user.default_address['pincode']
+    if not pincode:
+        return None, None, None, (jsonify({'error': 'pincode is required'}), 400)
+
+    service = db.session.get(Service, service_id)
+    if service is None:
+        return None, None, None, (jsonify({'error': 'Service not found'}), 404)
+    return service, pincode, quantity, None
+
+@bp.route('/api/schedule/available-professionals', methods=['GET'])
+@login_required
+@query_budget(6)  # with a calendar rebuild
+def get_available_professionals():
+    """Professionals of a service and pincode with nothing booked for the
+    job starting at ?start= (its length comes from time_required x quantity)"""
+    service, pincode, quantity, error = schedule_query_args()
+    if error:
+        return error
+    try:
+        start = datetime.fromisoformat(request.args['start'])
+    except (KeyError, ValueError):
+        return jsonify({'error': 'start must be an ISO date and time'}), 400
+
+    end = booking_end(start, service.time_required, quantity, schedule_index.default_minutes)
+    free = get_schedule_index().free_professionals(service.id, pincode, start, end)
+    names = dict(db.session.query(User.id, User.username).filter(User.id.in_(free))) if free else {}
+    return jsonify({
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'professionals': [{'id': pro_id, 'username': names.get(pro_id)} for pro_id in free]
+    }), 200
+
+@bp.route('/api/schedule/suggestions', methods=['GET'])
+@login_required
+@query_budget(5)  # with a calendar rebuild
+def get_slot_suggestions():
+    """The next slots at or after ?after= (default now) when at least one
+    professional of the service is free in the pincode"""
+    service, pincode, quantity, error = schedule_query_args()
+    if error:
+        return error
+    try:
+        after = datetime.fromisoformat(request.args['after']) if request.args.get('after') else datetime.utcnow()
+        count = min(int(request.args.get('count', 5)), 20)
+    except ValueError:
+        return jsonify({'error': 'after must be an ISO date and time and count an integer'}), 400
+
+    duration = booking_end(after, service.time_required, quantity, schedule_index.default_minutes) - after
+    slots = get_schedule_index().suggest_slots(service.id, pincode, after, duration, count)
+    return jsonify([{
+        'start': start.isoformat(),
+        'end': (start + duration).isoformat(),
+        'free_professionals': free
+    } for start, free in slots]), 200
+
+@bp.route('/api/admin/stats', methods=['GET'])
+@admin_required
+@query_budget(3)
+def get_admin_stats():
+    """Request volume, revenue, completion rate, rating and response times
+    from the daily rollups.
+
+    ?dimension= all (default), service, category, pincode or professional;
+    ?from= and ?to= are inclusive YYYY-MM-DD days (default: the last 30);
+    ?interval= total (default), day or month.
+    """
+    dimension = request.args.get('dimension', 'all')
+    interval = request.args.get('interval', 'total')
+    if dimension not in ROLLUP_DIMENSIONS or interval not in ('total', 'day', 'month'):
+        return jsonify({'error': 'Unknown dimension or interval'}), 400
+    try:
+        end_day = date.fromisoformat(request.args['to']) if request.args.get('to') else datetime.utcnow().date()
+        start_day = date.fromisoformat(request.args['from']) if request.args.get('from') else end_day - timedelta(days=29)
+    except ValueError:
+        return jsonify({'error': 'from and to must be YYYY-MM-DD'}), 400
+    if start_day > end_day:
+        return jsonify({'error': 'from must not be after to'}), 400
+
+    stats = rollup_stats(dimension, start_day, end_day + timedelta(days=1), interval)
+    labels = rollup_labels(dimension, {entry['key'] for entry in stats})
+    for entry in stats:
+        entry['label'] = labels.get(entry['key'], entry['key'])
+    return jsonify({
+        'dimension': dimension,
+        'interval': interval,
+        'from': start_day.isoformat(),
+        'to': end_day.isoformat(),
+        'stats': stats
+    }), 200
+
+@bp.route('/api/admin/exports/service-requests', methods=['GET'])
+@admin_required
+def export_service_requests():
+    """Stream every matching service request as CSV or Parquet (?format=).
+
+    Takes the filters of parse_export_filters. Rows are read through a
+    server-side cursor EXPORT_CHUNK_ROWS at a time and each chunk is sent
+    as soon as it is encoded, so memory does not grow with the table.
+    """
+    export_format = request.args.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': f"format must be one of {', '.join(EXPORT_FORMATS)}"}), 400
+    try:
+        stmt = export_statement(parse_export_filters(request.args))
+        chunks = export_chunks(export_format, db.engine, stmt, current_app.config['EXPORT_CHUNK_ROWS'])
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except ImportError:
+        return jsonify({'error': f'{export_format} export is not available on this server'}), 501
+
+    mimetype, extension = EXPORT_FORMATS[export_format]
+    response = current_app.response_class(chunks, mimetype=mimetype)
+    response.headers['Content-Disposition'] = (
+        f'attachment; filename="service-requests-{datetime.utcnow():%Y%m%d-%H%M%S}.{extension}"'
+    )
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@bp.route('/api/admin/catalog/import', methods=['POST'])
+@admin_required
+def import_catalog_rows():
+    """Create or update categories, services and service areas in bulk.
+
+    Takes a JSON object with categories, services and service_areas lists,
+    or a multipart upload with those sections as CSV (or *.json) files.
+    Every row is validated before anything is written; any bad row
+    rejects the whole import with a 400 listing each row's error.
+    ?dry_run=true validates and counts without writing.
+    """
+    try:
+        if request.files:
+            sections = {
+                name: read_import_file(request.files[name].filename or name, request.files[name].read().decode('utf-8-sig'))
+                for name in IMPORT_SECTIONS if name in request.files
+            }
+        else:
+            sections = request.get_json(silent=True)
+            if not isinstance(sections, dict) or any(not isinstance(sections.get(name, []), list) for name in IMPORT_SECTIONS):
+                raise ValueError(f"Send {', '.join(IMPORT_SECTIONS)} as lists of rows")
+    except (ValueError, UnicodeDecodeError) as e:
+        return jsonify({'error': str(e)}), 400
+
+    total = sum(len(sections.get(name) or []) for name in IMPORT_SECTIONS)
+    if total > current_app.config['IMPORT_MAX_ROWS']:
+        return jsonify({'error': f"At most {current_app.config['IMPORT_MAX_ROWS']} rows per import"}), 413
+
+    dry_run = request.args.get('dry_run', 'false').lower() == 'true'
+    try:
+        counts = import_catalog(sections, dry_run)
+    except ImportRejected as e:
+        return jsonify({'error': 'Nothing was imported', 'errors': e.errors}), 400
+    except SQLAlchemyError as e:
+        return jsonify({'message': 'Error importing catalog', 'error': str(e)}), 500
+    return jsonify({'dry_run': dry_run, **counts}), 200
@@ -0,0 +1,142 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from models import *
+
+class LocalCacheBackend:
+    """In-process LRU store with per-key TTL.
+
+    Implements the small subset of the redis client API the catalog cache
+    needs (get, set with ex=, incr), so a shared store can replace it when
+    several worker processes must see the same invalidations.
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ex=None):
+        if ex is not None and ex <= 0:
+            # Already expired: drop any older value rather than store this one
+            with self._lock:
+                self._data.pop(key, None)
+            return True
+        expires_at = time.monotonic() + ex if ex is not None else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+        return True
+
+    def incr(self, key):
+        with self._lock:
+            value, expires_at = self._data.get(key, (0, None))
+            value = int(value) + 1
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            return value
+
+class CatalogCache:
+    """Versioned cache of serialized catalog responses.
+
+    Every entry key embeds the current catalog version, so bumping the
+    version on an admin write makes all older entries unreachable at once.
+    """
+
+    VERSION_KEY = 'catalog:version'
+
+    def __init__(self, backend, ttl=300):
+        self.backend = backend
+        self.ttl = ttl
+
+    def version(self):
+        return int(self.backend.get(self.VERSION_KEY) or 0)
+
+    def get_or_build(self, name, build):
+        """Return (body, etag, last_modified) for a catalog view.
+
+        build() is only called on a miss and must return the JSON bytes.
+        """
+        key = f"catalog:{self.version()}:{name}"
+        entry = self.backend.get(key)
+        if entry is None:
+            built_at = int(time.time())
+            entry = str(built_at).encode() + b'\n' + build()
+            self.backend.set(key, entry, ex=self.ttl)
+
+        built_at, body = entry.split(b'\n', 1)
+        etag = hashlib.sha1(body).hexdigest()
+        last_modified = datetime.fromtimestamp(int(built_at), tz=timezone.utc)
+        return body, etag, last_modified
+
+    def invalidate(self):
+        return self.backend.incr(self.VERSION_KEY)
+
+catalog_cache = CatalogCache(LocalCacheBackend())
+
+def init_catalog(app):
+    catalog_cache.backend = LocalCacheBackend(app.config['CATALOG_CACHE_SIZE'])
+    catalog_cache.ttl = app.config['CATALOG_CACHE_TTL']
+
+# pin_code -> set of service ids with an active ServiceLocation there.
+# Built lazily on first lookup and rebuilt once the catalog version moves
+# or it is older than the catalog TTL, which bounds how long a worker
+# keeps serving it after an admin write in another worker.
+_pincode_index = None
+_pincode_index_version = None
+_pincode_index_built_at = None
+_pincode_index_lock = threading.Lock()
+
+def build_pincode_index():
+    """Load every active (pin_code, service_id) pair in a single query"""
+    index = {}
+    rows = db.session.query(ServiceLocation.pin_code, ServiceLocation.service_id).filter(
+        ServiceLocation.is_active == True
+    ).all()
+    for pin_code, service_id in rows:
+        index.setdefault(pin_code, set()).add(service_id)
+    return index
+
+def service_ids_for_pincode(pincode):
+    """Return the ids of services offered in a pincode"""
+    global _pincode_index, _pincode_index_version, _pincode_index_built_at
+    version = catalog_cache.version()
+
+    def is_stale():
+        return (
+            _pincode_index is None or _pincode_index_version != version
+            or time.monotonic() - _pincode_index_built_at > catalog_cache.ttl
+        )
+
+    index = _pincode_index
+    if is_stale():
+        with _pincode_index_lock:
+            if is_stale():
+                _pincode_index = build_pincode_index()
+                _pincode_index_version = version
+                _pincode_index_built_at = time.monotonic()
+            index = _pincode_index
+    return index.get(pincode, set())
+
+def invalidate_catalog():
+    """Call after any admin write to services, categories or service areas"""
+    global _pincode_index
+    with _pincode_index_lock:
+        _pincode_index = None
+    catalog_cache.invalidate()
@@ -0,0 +1,356 @@
+import click
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy.dialects import sqlite
+from models import *
+from images import make_variants
+from scheduling import fill_scheduled_ends
+from analytics import rebuild_rollups, rollup_backfill_range
+from exports import EXPORT_FORMATS, export_chunks, export_statement, parse_export_filters
+from imports import ImportRejected, import_catalog, read_import_file
+from datetime import datetime, timedelta
+
+def add_missing_columns(table, columns):
+    """ALTER TABLE ADD COLUMN for columns the database doesn't have yet.
+
+    columns maps column name -> SQL type/default clause. Lets existing
+    frenzy.db files pick up new model fields without recreating them.
+    """
+    existing = {col['name'] for col in db.inspect(db.engine).get_columns(table)}
+    added = []
+    for name, ddl in columns.items():
+        if name not in existing:
+            db.session.execute(db.text(f'ALTER TABLE {table} ADD COLUMN {name} {ddl}'))
+            added.append(name)
+    db.session.commit()
+    return added
+
+# Columns added to existing tables after they were first created
+NEW_COLUMNS = {
+    'professionals': {
+        'review_count': 'INTEGER NOT NULL DEFAULT 0',
+        'rating_sum': 'INTEGER NOT NULL DEFAULT 0',
+    },
+    'service_requests': {
+        'scheduled_end': 'DATETIME',
+        'accepted_at': 'DATETIME',
+        'status_changed_at': 'DATETIME',
+    },
+}
+
+@click.command('upgrade-db')
+@with_appcontext
+def upgrade_db():
+    """Bring an existing database up to the current models.
+
+    Creates missing tables, adds missing columns and creates any index
+    declared on the models that the database doesn't have yet, then fills
+    in derived values for rows written before their columns existed.
+    """
+    had_rollups = db.inspect(db.engine).has_table(DailyRollup.__tablename__)
+    db.create_all()
+    for table, columns in NEW_COLUMNS.items():
+        added = add_missing_columns(table, columns)
+        if added:
+            click.echo(f"{table}: added columns {', '.join(added)}")
+            if table == 'professionals':
+                # New aggregates start at 0; fill them from the existing reviews
+                updated = rebuild_rating_aggregates()
+                click.echo(f"professionals: rebuilt rating aggregates for {updated} rows")
+
+    for table in db.metadata.sorted_tables:
+        existing = {index['name'] for index in db.inspect(db.engine).get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(db.engine)
+                click.echo(f"{table.name}: created index {index.name}")
+
+    filled = fill_scheduled_ends()
+    if filled:
+        click.echo(f"service_requests: set scheduled_end on {filled} rows")
+
+    # Before the rollup backfill, which times accepts and completions from request_date
+    dated = fill_request_dates()
+    if dated:
+        click.echo(f"service_requests: set request_date on {dated} rows")
+
+    backfill = None if had_rollups else rollup_backfill_range()
+    if backfill:
+        # The live counters only start now; count everything before them once
+        written = rebuild_rollups(*backfill)
+        click.echo(f"daily_rollups: backfilled {written} rows from {backfill[0]} on")
+    click.echo('Database is up to date')
+
+def hot_queries():
+    """Representative statements behind the API endpoints, for plan checks"""
+    return {
+        'signin': db.select(User).where(User.email == 'a@b.c'),
+        'default address': db.select(Address).where(Address.user_id == 1, Address.is_default == True),
+        'user requests': db.select(ServiceRequest).where(
+            ServiceRequest.user_id == 1, ServiceRequest.status.in_(['pending', 'accepted'])),
+        'professional requests': db.select(ServiceRequest).where(
+            ServiceRequest.professional_id == 1, ServiceRequest.status == 'accepted'),
+        'open requests by area': db.select(ServiceRequest).where(
+            ServiceRequest.service_id == 1, ServiceRequest.location_pin == '600001',
+            ServiceRequest.status == 'pending', ServiceRequest.professional_id.is_(None)),
+        'admin requests page': db.select(ServiceRequest).order_by(
+            ServiceRequest.request_date.desc(), ServiceRequest.id.desc()).limit(50),
+        'admin requests by status': db.select(ServiceRequest).where(
+            ServiceRequest.status == 'completed').order_by(
+            ServiceRequest.request_date.desc(), ServiceRequest.id.desc()).limit(50),
+        'reviews by request': db.select(Review).where(Review.service_request_id.in_([1, 2])),
+        'reviews by professional': db.select(Review).where(Review.professional_id == 1),
+        'cart items': db.select(UserServiceAction).where(
+            UserServiceAction.user_id == 1, UserServiceAction.action_type == 'cart'),
+        'unread notifications': db.select(Notification).where(
+            Notification.recipient_id == 1, Notification.is_read == False).order_by(
+            Notification.created_at.desc(), Notification.id.desc()).limit(20),
+        'pending professionals': db.select(Professional.__table__).where(
+            Professional.__table__.c.verification_status == 'pending'),
+        'professional documents': db.select(ProfessionalDocument).where(
+            ProfessionalDocument.professional_id == 1),
+        'services by pincode': db.select(ServiceLocation.service_id).where(
+            ServiceLocation.pin_code == '600001', ServiceLocation.is_active == True),
+        'admin stats': db.select(DailyRollup).where(
+            DailyRollup.dimension == 'service', DailyRollup.day >= datetime(2025, 1, 1).date()),
+    }
+
+@click.command('check-query-plans')
+@with_appcontext
+def check_query_plans():
+    """Fail if any hot query needs a full table scan (SQLite only)"""
+    if db.engine.dialect.name != 'sqlite':
+        raise click.ClickException('check-query-plans only understands SQLite plans')
+
+    failures = []
+    with db.engine.connect() as conn:
+        for name, stmt in hot_queries().items():
+            sql = str(stmt.compile(dialect=sqlite.dialect(), compile_kwargs={'literal_binds': True}))
+            plan = [row[-1] for row in conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {sql}')]
+            # "SCAN <table>" without an index is a full table scan
+            scans = [step for step in plan if step.startswith('SCAN') and 'USING' not in step]
+            click.echo(f"{'FAIL' if scans else 'ok'}  {name}: {'; '.join(plan)}")
+            if scans:
+                failures.append(name)
+
+    if failures:
+        raise click.ClickException(f"Full table scans in: {', '.join(failures)}")
+
+def fill_request_dates():
+    """Date requests saved without a request_date by their earliest later
+    event, so cursors and rollups can rely on it; returns how many"""
+    earliest = db.func.coalesce(
+        ServiceRequest.accepted_at, ServiceRequest.status_changed_at,
+        ServiceRequest.completion_date, ServiceRequest.scheduled_date
+    )
+    result = db.session.execute(
+        db.update(ServiceRequest).where(
+            ServiceRequest.request_date.is_(None), earliest.isnot(None)
+        ).values(request_date=earliest).execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return result.rowcount
+
+def rebuild_rating_aggregates():
+    """Recompute every professional's review_count, rating_sum and rating
+    from the reviews; returns how many professionals were updated"""
+    professionals = Professional.__table__
+    review_count = db.select(db.func.count(Review.id)).where(
+        Review.professional_id == professionals.c.id
+    ).scalar_subquery()
+    rating_sum = db.select(db.func.coalesce(db.func.sum(Review.rating), 0)).where(
+        Review.professional_id == professionals.c.id
+    ).scalar_subquery()
+    result = db.session.execute(
+        db.update(professionals).values(
+            review_count=review_count,
+            rating_sum=rating_sum,
+            rating=db.case(
+                (review_count > 0, db.func.round(db.cast(rating_sum, db.Float) / review_count, 1)),
+                else_=3.0
+            )
+        )
+    )
+    db.session.commit()
+    return result.rowcount
+
+@click.command('check-accept-race')
+@click.option('--threads', default=8, show_default=True, help='Concurrent accepts per race')
+@click.option('--rounds', default=20, show_default=True)
+def check_accept_race(threads, rounds):
+    """Race concurrent accepts on a temporary SQLite database.
+
+    Each round, THREADS professionals accept the same open request at
+    once, and one professional accepts THREADS requests booked for the
+    same time at once. Fails unless exactly one accept wins every race.
+    Runs its own app, so it never touches the configured database.
+    """
+    from config import Config
+    from main import create_app
+    from api import transition_request
+
+    with tempfile.TemporaryDirectory() as directory:
+        class RaceConfig(Config):
+            SQLALCHEMY_DATABASE_URI = f'sqlite:///{directory}/race.db'
+            DB_PROFILE = 'tuned'  # WAL and busy_timeout, as in production
+            SQL_INSTRUMENTATION = False
+
+        app = create_app(RaceConfig)
+        with app.app_context():
+            db.create_all()
+            service = Service(name='race', base_price=1, time_required=60)
+            customer = User(username='customer', email='customer@race', password_hash='-')
+            professionals = [
+                Professional(username=f'pro{i}', email=f'pro{i}@race', password_hash='-', role='professional')
+                for i in range(threads)
+            ]
+            db.session.add_all([service, customer, *professionals])
+            db.session.commit()
+            service_id, customer_id = service.id, customer.id
+            professional_ids = [pro.id for pro in professionals]
+
+        def open_requests(count, scheduled_date):
+            with app.app_context():
+                rows = [ServiceRequest(
+                    service_id=service_id, user_id=customer_id, scheduled_date=scheduled_date,
+                    location_pin='000000', status='pending'
+                ) for _ in range(count)]
+                db.session.add_all(rows)
+                db.session.commit()
+                return [row.id for row in rows]
+
+        def race(attempts):
+            """Run (request_id, professional_id) accepts at once; returns how many won"""
+            start = threading.Barrier(len(attempts))
+
+            def accept(request_id, professional_id):
+                with app.app_context():
+                    start.wait()
+                    row = transition_request(
+                        request_id,
+                        [ServiceRequest.status == 'pending', ServiceRequest.professional_id.is_(None)],
+                        {'professional_id': professional_id, 'status': 'accepted', 'accepted_at': datetime.utcnow()}
+                    )
+                    return row is not None
+
+            with ThreadPoolExecutor(len(attempts)) as pool:
+                return sum(pool.map(lambda attempt: accept(*attempt), attempts))
+
+        failures = []
+        for round_number in range(rounds):
+            scheduled_date = datetime(2030, 1, 1) + timedelta(hours=2 * round_number)
+            request_id, = open_requests(1, scheduled_date)
+            winners = race([(request_id, pro_id) for pro_id in professional_ids])
+            if winners != 1:
+                failures.append(f'round {round_number}: {winners} professionals accepted one request')
+
+            request_ids = open_requests(threads, scheduled_date + timedelta(hours=1))
+            winners = race([(request_id, professional_ids[0]) for request_id in request_ids])
+            if winners != 1:
+                failures.append(f'round {round_number}: one professional accepted {winners} requests for the same time')
+
+        with app.app_context():
+            db.engine.dispose()
+
+    for failure in failures:
+        click.echo(failure, err=True)
+    if failures:
+        raise click.ClickException(f'{len(failures)} races did not have exactly one winner')
+    click.echo(f'{rounds} rounds x 2 races of {threads} concurrent accepts: exactly one winner each')
+
+@click.command('rebuild-ratings')
+@with_appcontext
+def rebuild_ratings():
+    """Recompute every professional's review_count, rating_sum and rating"""
+    added = add_missing_columns('professionals', NEW_COLUMNS['professionals'])
+    if added:
+        click.echo(f"Added columns: {', '.join(added)}")
+    click.echo(f"Rebuilt rating aggregates for {rebuild_rating_aggregates()} professionals")
+
+@click.command('backfill-images')
+@with_appcontext
+def backfill_images():
+    """Create missing thumbnail/card/full variants for stored images"""
+    images = {('profile_pictures', 'profile.png')}
+    images.update(('profile_pictures', name) for (name,) in db.session.query(User.image_file).distinct())
+    images.update(('services', name) for (name,) in db.session.query(Service.image_file).distinct())
+
+    written = 0
+    for folder, filename in sorted(images):
+        if filename:
+            count = make_variants(folder, filename)
+            if count:
+                click.echo(f"{folder}/{filename}: {count} variants")
+            written += count
+    click.echo(f"Wrote {written} variants")
+
+@click.command('rollup-analytics')
+@click.option('--days', default=7, show_default=True, help='Days before today to rebuild')
+@click.option('--since', type=click.DateTime(['%Y-%m-%d']), help='Rebuild from this day instead')
+@with_appcontext
+def rollup_analytics(days, since):
+    """Rebuild the daily analytics rollups of finished days from the requests.
+
+    Run it daily (e.g. from cron) to fold in anything the live counters
+    missed. Today is left to the live counters, which are still adding to it.
+    """
+    end_day = datetime.utcnow().date()  # request timestamps are UTC
+    start_day = since.date() if since else end_day - timedelta(days=days)
+    written = rebuild_rollups(start_day, end_day)
+    click.echo(f"Rebuilt {written} rollup rows for {start_day} to {end_day - timedelta(days=1)}")
+
+@click.command('export-requests')
+@click.argument('output', type=click.File('wb'))
+@click.option('--format', 'export_format', type=click.Choice(list(EXPORT_FORMATS)), default='csv', show_default=True)
+@click.option('--status', help='Comma separated statuses')
+@click.option('--service-id')
+@click.option('--professional-id')
+@click.option('--location-pin')
+@click.option('--requested-from', help='ISO date')
+@click.option('--requested-to', help='ISO date')
+@click.option('--chunk-rows', type=int, help='Defaults to EXPORT_CHUNK_ROWS')
+@with_appcontext
+def export_requests(output, export_format, chunk_rows, **filters):
+    """Write service requests to OUTPUT ('-' for stdout) as CSV or Parquet"""
+    try:
+        stmt = export_statement(parse_export_filters(filters))
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+    chunk_rows = chunk_rows or current_app.config['EXPORT_CHUNK_ROWS']
+    for chunk in export_chunks(export_format, db.engine, stmt, chunk_rows):
+        output.write(chunk)
+
+@click.command('import-catalog')
+@click.option('--categories', type=click.File('r', encoding='utf-8-sig'), help='CSV or *.json rows')
+@click.option('--services', type=click.File('r', encoding='utf-8-sig'), help='CSV or *.json rows')
+@click.option('--service-areas', type=click.File('r', encoding='utf-8-sig'), help='CSV or *.json rows')
+@click.option('--dry-run', is_flag=True, help='Validate and count without writing')
+@with_appcontext
+def import_catalog_files(dry_run, **files):
+    """Create or update categories, services and service areas in bulk.
+
+    Same rules as POST /api/admin/catalog/import: every row is checked
+    first, and one bad row stops the whole import.
+    """
+    try:
+        sections = {name: read_import_file(file.name, file.read()) for name, file in files.items() if file}
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+    try:
+        counts = import_catalog(sections, dry_run)
+    except ImportRejected as e:
+        for error in e.errors:
+            click.echo(f"{error['section']} row {error['row']}: {error['error']}", err=True)
+        raise click.ClickException(f'Nothing was imported ({len(e.errors)} invalid rows)')
+    for name, section_counts in counts.items():
+        click.echo(f"{name}: " + ', '.join(f'{count} {what}' for what, count in section_counts.items()))
+    if dry_run:
+        click.echo('Dry run, nothing was written')
+
+def register_commands(app):
+    for command in (upgrade_db, check_query_plans, check_accept_race, rebuild_ratings, backfill_images, rollup_analytics,
+                    export_requests, import_catalog_files):
+        app.cli.add_command(command)
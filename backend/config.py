@@ -3,6 +3,42 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+def database_profile_options(uri, profile):
+    """Return (SQLALCHEMY_ENGINE_OPTIONS, SQLITE_PRAGMAS) for a DB_PROFILE.
+
+    'default' keeps the SQLAlchemy/SQLite stock settings. 'tuned' turns on
+    WAL and friends for SQLite, or pooling and statement timeouts for
+    server databases.
+    """
+    uri = uri or ''
+    if profile == 'default':
+        return {}, {}
+
+    if uri.startswith('sqlite'):
+        return {}, {
+            'journal_mode': 'WAL',  # readers no longer block on the writer
+            'synchronous': 'NORMAL',
+            'busy_timeout': int(os.getenv('DB_BUSY_TIMEOUT_MS', 5000)),
+            'mmap_size': int(os.getenv('DB_MMAP_SIZE', 256 * 1024 * 1024)),
+            'cache_size': -int(os.getenv('DB_CACHE_SIZE_KB', 64 * 1024)),  # negative = KiB
+        }
+
+    statement_timeout = int(os.getenv('DB_STATEMENT_TIMEOUT_MS', 30000))
+    if uri.startswith('postgresql'):
+        connect_args = {'options': f'-c statement_timeout={statement_timeout}'}
+    elif uri.startswith('mysql'):
+        connect_args = {'init_command': f'SET SESSION max_execution_time={statement_timeout}'}
+    else:
+        connect_args = {}
+
+    return {
+        'pool_size': int(os.getenv('DB_POOL_SIZE', 10)),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 20)),
+        'pool_pre_ping': True,
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', 1800)),
+        'connect_args': connect_args,
+    }, {}
+
 class Config:
     SECRET_KEY = os.getenv('SECRET_KEY')
     SQLALCHEMY_TRACK_MODIFICATIONS = os.getenv('SQLALCHEMY_TRACK_MODIFICATIONS')
@@ -10,4 +46,44 @@ class Config:
     UPLOAD_FOLDER = os.path.abspath(os.getenv('UPLOAD_FOLDER', 'instance/uploads'))
     ALLOWED_EXTENSIONS = set(os.getenv('ALLOWED_EXTENSIONS', 'png,jpg,jpeg').split(','))
     PROFILE_PIC_FOLDER = os.path.join(UPLOAD_FOLDER, 'profile_pictures')
-    SERVICE_UPLOAD_FOLDER = os.path.join(UPLOAD_FOLDER, 'services')
\ No newline at end of file
+    SERVICE_UPLOAD_FOLDER = os.path.join(UPLOAD_FOLDER, 'services')
+    UPLOAD_TMP_FOLDER = os.path.join(UPLOAD_FOLDER, '.tmp')  # same filesystem, so storing is a rename
+    MAX_IMAGE_BYTES = int(os.getenv('MAX_IMAGE_BYTES', 10 * 1024 * 1024))
+    MAX_DOCUMENT_BYTES = int(os.getenv('MAX_DOCUMENT_BYTES', 20 * 1024 * 1024))
+    MAX_UPLOAD_BYTES = max(MAX_IMAGE_BYTES, MAX_DOCUMENT_BYTES)  # any one file, checked while it streams in
+    MAX_CONTENT_LENGTH = MAX_UPLOAD_BYTES + 1024 * 1024  # whole request body, form fields included
+    UPLOAD_SENDFILE = os.getenv('UPLOAD_SENDFILE', '')  # '', 'x-sendfile' (Apache) or 'x-accel-redirect' (nginx)
+    USE_X_SENDFILE = UPLOAD_SENDFILE == 'x-sendfile'
+    X_ACCEL_REDIRECT_PREFIX = os.getenv('X_ACCEL_REDIRECT_PREFIX', '/_uploads/')  # nginx internal location aliased to UPLOAD_FOLDER
+    IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', 2))  # threads rendering thumbnails per server worker
+    CATALOG_CACHE_TTL = int(os.getenv('CATALOG_CACHE_TTL', 300))  # seconds; 0 disables the cache
+    CATALOG_CACHE_SIZE = int(os.getenv('CATALOG_CACHE_SIZE', 256))
+    DISPATCH_SHORTLIST_SIZE = int(os.getenv('DISPATCH_SHORTLIST_SIZE', 5))
+    DISPATCH_REFRESH_SECONDS = int(os.getenv('DISPATCH_REFRESH_SECONDS', 30))
+    SCHEDULE_DEFAULT_MINUTES = int(os.getenv('SCHEDULE_DEFAULT_MINUTES', 60))  # for services without time_required
+    SCHEDULE_SLOT_MINUTES = int(os.getenv('SCHEDULE_SLOT_MINUTES', 30))  # suggested slots start on these boundaries
+    SCHEDULE_HORIZON_DAYS = int(os.getenv('SCHEDULE_HORIZON_DAYS', 14))  # how far ahead slots are suggested
+    SCHEDULE_REFRESH_SECONDS = int(os.getenv('SCHEDULE_REFRESH_SECONDS', 30))
+    ANALYTICS_FLUSH_SECONDS = int(os.getenv('ANALYTICS_FLUSH_SECONDS', 30))  # how far the admin stats may lag
+    IMPORT_MAX_ROWS = int(os.getenv('IMPORT_MAX_ROWS', 100000))  # rows across all sections of one import
+    EXPORT_CHUNK_ROWS = int(os.getenv('EXPORT_CHUNK_ROWS', 10000))  # rows per cursor fetch and encoded chunk
+    DB_PROFILE = os.getenv('DB_PROFILE', 'tuned')  # tuned, default; SQLALCHEMY_ENGINE_OPTIONS/SQLITE_PRAGMAS override it
+    SQL_INSTRUMENTATION = os.getenv('SQL_INSTRUMENTATION', 'true').lower() == 'true'
+    SQL_N_PLUS_ONE_THRESHOLD = int(os.getenv('SQL_N_PLUS_ONE_THRESHOLD', 5))  # same statement this many times
+    SQL_ENFORCE_QUERY_BUDGETS = os.getenv('SQL_ENFORCE_QUERY_BUDGETS', 'false').lower() == 'true'  # for tests
+    METRICS_DIR = os.path.abspath(os.getenv('METRICS_DIR', 'instance/metrics'))  # shared by all workers
+    METRICS_FLUSH_SECONDS = int(os.getenv('METRICS_FLUSH_SECONDS', 5))
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN')  # if set, scrapes need "Authorization: Bearer <token>"
+    PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')  # werkzeug method; old hashes upgrade on login
+    PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', 2))  # hashing processes per server worker, 0 = inline
+    PASSWORD_HASH_MAX_PENDING = int(os.getenv('PASSWORD_HASH_MAX_PENDING', 16))
+    PASSWORD_HASH_TIMEOUT = int(os.getenv('PASSWORD_HASH_TIMEOUT', 10))  # seconds, then 503
+    IDENTITY_CACHE_TTL = int(os.getenv('IDENTITY_CACHE_TTL', 30))  # seconds other workers' reads may see a stale login; 0 disables the cache
+    IDENTITY_CACHE_SIZE = int(os.getenv('IDENTITY_CACHE_SIZE', 1024))
+    NOTIFICATION_BATCH_SIZE = int(os.getenv('NOTIFICATION_BATCH_SIZE', 500))
+    NOTIFICATION_FLUSH_SECONDS = float(os.getenv('NOTIFICATION_FLUSH_SECONDS', 0.5))
+    EVENTS_BROKER_URL = os.getenv('EVENTS_BROKER_URL')  # redis://...; needed for live events with several workers
+    EVENTS_MAX_STREAMS = int(os.getenv('EVENTS_MAX_STREAMS', 32))  # open /api/events streams per server worker
+    EVENTS_MAX_PENDING = int(os.getenv('EVENTS_MAX_PENDING', 100))  # per stream, then the oldest are dropped
+    EVENTS_HEARTBEAT_SECONDS = int(os.getenv('EVENTS_HEARTBEAT_SECONDS', 15))
+    EVENTS_STREAM_SECONDS = int(os.getenv('EVENTS_STREAM_SECONDS', 300))  # then the browser reconnects
\ No newline at end of file
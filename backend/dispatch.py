@@ -0,0 +1,219 @@
+import heapq
+import threading
+import time
+from models import *
+
+class DispatchIndex:
+    """In-memory index of open service requests and who they are offered to.
+
+    Open requests are grouped by (service_id, pincode). Each one is offered to
+    a shortlist of at most shortlist_size professionals from that area,
+    ranked by availability, current load and rating, so a professional's
+    offers are a direct lookup instead of a table scan. Outstanding offers
+    count towards the load, so a burst of requests is spread over the area.
+
+    The index is rebuilt from the database when it is older than
+    refresh_interval seconds, which bounds how stale a worker process can
+    get when another process created or took a request.
+    """
+
+    def __init__(self, shortlist_size=5, refresh_interval=30):
+        self.shortlist_size = shortlist_size
+        self.refresh_interval = refresh_interval
+        self._lock = threading.RLock()
+        self._loaded_at = None
+        self._open = {}           # (service_id, pincode) -> {request_id: offer}
+        self._request_keys = {}   # request_id -> (service_id, pincode)
+        self._pros = {}           # professional_id -> profile dict
+        self._pros_by_area = {}   # (service_id, pincode) -> set of professional ids
+        self._offers = {}         # professional_id -> set of request ids
+        self._shortlists = {}     # request_id -> list of professional ids
+
+    def load(self, professionals, open_requests):
+        """Replace the whole index.
+
+        professionals: dicts with id, service_id, pincode, rating,
+        is_available and load. open_requests: (service_id, pincode, offer)
+        tuples where offer is the JSON row shown to professionals.
+        """
+        with self._lock:
+            self._open = {}
+            self._request_keys = {}
+            self._pros = {}
+            self._pros_by_area = {}
+            self._offers = {}
+            self._shortlists = {}
+
+            for pro in professionals:
+                self._pros[pro['id']] = pro
+                key = (pro['service_id'], pro['pincode'])
+                self._pros_by_area.setdefault(key, set()).add(pro['id'])
+
+            for service_id, pincode, offer in open_requests:
+                self._add(service_id, pincode, offer)
+
+            self._loaded_at = time.monotonic()
+
+    def _rank(self, key):
+        """Best professionals for an area: available first, then least busy
+        (accepted jobs plus outstanding offers), then best rated"""
+        candidates = self._pros_by_area.get(key, ())
+        return heapq.nsmallest(
+            self.shortlist_size,
+            candidates,
+            key=lambda pro_id: (
+                not self._pros[pro_id]['is_available'],
+                self._pros[pro_id]['load'] + len(self._offers.get(pro_id, ())),
+                -(self._pros[pro_id]['rating'] or 0),
+                pro_id
+            )
+        )
+
+    def _add(self, service_id, pincode, offer):
+        key = (service_id, pincode)
+        request_id = offer['id']
+        self._open.setdefault(key, {})[request_id] = offer
+        self._request_keys[request_id] = key
+        shortlist = self._rank(key)
+        self._shortlists[request_id] = shortlist
+        for pro_id in shortlist:
+            self._offers.setdefault(pro_id, set()).add(request_id)
+
+    def add_request(self, service_id, pincode, offer):
+        with self._lock:
+            self.remove_request(offer['id'])
+            self._add(service_id, pincode, offer)
+
+    def remove_request(self, request_id):
+        """Withdraw a request from every professional it was offered to;
+        returns their ids"""
+        with self._lock:
+            key = self._request_keys.pop(request_id, None)
+            if key is None:
+                return []
+            area = self._open.get(key)
+            if area is not None:
+                area.pop(request_id, None)
+                if not area:
+                    del self._open[key]
+            shortlist = self._shortlists.pop(request_id, [])
+            for pro_id in shortlist:
+                offers = self._offers.get(pro_id)
+                if offers is not None:
+                    offers.discard(request_id)
+            return shortlist
+
+    def shortlist(self, request_id):
+        """Professionals a request is offered to"""
+        with self._lock:
+            return list(self._shortlists.get(request_id, ()))
+
+    def adjust_load(self, professional_id, delta):
+        with self._lock:
+            pro = self._pros.get(professional_id)
+            if pro is not None:
+                pro['load'] = max(0, pro['load'] + delta)
+
+    def offers_for(self, professional_id):
+        """Open requests currently offered to a professional, oldest first"""
+        with self._lock:
+            offers = []
+            for request_id in sorted(self._offers.get(professional_id, ())):
+                key = self._request_keys[request_id]
+                offers.append(self._open[key][request_id])
+            return offers
+
+    def is_stale(self):
+        return self._loaded_at is None or time.monotonic() - self._loaded_at > self.refresh_interval
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+dispatch_index = DispatchIndex()
+
+def init_dispatch(app):
+    dispatch_index.shortlist_size = app.config['DISPATCH_SHORTLIST_SIZE']
+    dispatch_index.refresh_interval = app.config['DISPATCH_REFRESH_SECONDS']
+    dispatch_index.invalidate()
+
+def load_open_requests(request_ids=None):
+    """Open (service_id, pincode, offer) tuples, optionally only for request_ids"""
+    query = db.session.query(
+        ServiceRequest, Service.name, Address.address_line1, Address.city
+    ).join(
+        Service, Service.id == ServiceRequest.service_id
+    ).outerjoin(
+        Address, db.and_(Address.user_id == ServiceRequest.user_id, Address.is_default == True)
+    ).filter(
+        ServiceRequest.status == 'pending',
+        ServiceRequest.professional_id.is_(None)
+    )
+    if request_ids is not None:
+        query = query.filter(ServiceRequest.id.in_(request_ids))
+
+    seen = set()
+    rows = []
+    for req, service_name, address_line1, city in query.order_by(ServiceRequest.id, Address.id):
+        # Keep the first default address per request, like .first() did
+        if req.id in seen:
+            continue
+        seen.add(req.id)
+        rows.append((req.service_id, req.location_pin, {
+            'id': req.id,
+            'service_name': service_name,
+            'scheduled_date': req.scheduled_date.isoformat(),
+            'user_address': f"{address_line1}, {city}" if address_line1 is not None else "Address not available",
+            'quantity': req.quantity,
+            'total_amount': req.total_amount
+        }))
+    return rows
+
+def load_professionals():
+    """Dispatch profiles for every unblocked professional with a service and default address"""
+    loads = dict(
+        db.session.query(ServiceRequest.professional_id, db.func.count(ServiceRequest.id))
+        .filter(ServiceRequest.status == 'accepted', ServiceRequest.professional_id.isnot(None))
+        .group_by(ServiceRequest.professional_id).all()
+    )
+    rows = db.session.query(
+        Professional.id, Professional.service_type, Professional.rating,
+        Professional.is_available, Address.pincode
+    ).join(
+        Address, db.and_(Address.user_id == Professional.id, Address.is_default == True)
+    ).filter(
+        Professional.role == 'professional',
+        Professional.service_type.isnot(None),
+        Professional.is_blocked.isnot(True)  # they could never accept an offer
+    ).order_by(Address.id)
+
+    professionals = {}
+    for pro_id, service_type, rating, is_available, pincode in rows:
+        professionals.setdefault(pro_id, {
+            'id': pro_id,
+            'service_id': service_type,
+            'pincode': pincode,
+            'rating': rating,
+            'is_available': is_available is not False,
+            'load': loads.get(pro_id, 0)
+        })
+    return list(professionals.values())
+
+def get_dispatch_index():
+    """Return dispatch_index, rebuilding it from the database if stale"""
+    if dispatch_index.is_stale():
+        with dispatch_index._lock:
+            if dispatch_index.is_stale():
+                dispatch_index.load(load_professionals(), load_open_requests())
+    return dispatch_index
+
+def dispatch_requests(request_ids):
+    """Offer newly opened requests (created or unassigned) to professionals.
+
+    Returns request id -> ids of the professionals it is offered to, the
+    only ones who should hear about it.
+    """
+    index = get_dispatch_index()
+    for service_id, pincode, offer in load_open_requests(request_ids):
+        index.add_request(service_id, pincode, offer)
+    return {request_id: index.shortlist(request_id) for request_id in request_ids}
@@ -0,0 +1,198 @@
+import itertools
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+from metrics import metrics
+
+RECONNECT_MS = 3000  # how long the browser waits before reopening a closed stream
+
+class LocalBroker:
+    """In-process publish/subscribe on named channels.
+
+    Implements the subset of the redis client API the event stream needs
+    (publish, and pubsub() with subscribe, get_message and close), so a
+    shared broker can replace it when events must reach subscribers held
+    by other worker processes.
+    """
+
+    def __init__(self, max_pending=100):
+        self.max_pending = max_pending
+        self._channels = {}  # channel -> set of LocalPubSub
+        self._lock = threading.Lock()
+
+    def publish(self, channel, message):
+        """Deliver message to every subscriber of channel; returns how many"""
+        with self._lock:
+            subscribers = list(self._channels.get(channel, ()))
+        for subscriber in subscribers:
+            subscriber._deliver(channel, message)
+        return len(subscribers)
+
+    def pubsub(self, ignore_subscribe_messages=False):
+        # Subscribing never produces a message here, so the flag is moot
+        return LocalPubSub(self)
+
+class LocalPubSub:
+    """One subscriber's bounded inbox; the oldest message is dropped when full"""
+
+    def __init__(self, broker):
+        self.broker = broker
+        self.channels = set()
+        self._inbox = queue.Queue(broker.max_pending)
+
+    def subscribe(self, *channels):
+        with self.broker._lock:
+            for channel in channels:
+                self.broker._channels.setdefault(channel, set()).add(self)
+                self.channels.add(channel)
+
+    def _deliver(self, channel, data):
+        message = {'type': 'message', 'channel': channel, 'data': data}
+        while True:
+            try:
+                self._inbox.put_nowait(message)
+                return
+            except queue.Full:
+                # A slow reader loses old events, never blocks the publisher
+                try:
+                    self._inbox.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def get_message(self, timeout=0):
+        try:
+            return self._inbox.get(timeout=timeout) if timeout else self._inbox.get_nowait()
+        except queue.Empty:
+            return None
+
+    def close(self):
+        with self.broker._lock:
+            for channel in self.channels:
+                subscribers = self.broker._channels.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(self)
+                    if not subscribers:
+                        del self.broker._channels[channel]
+        self.channels.clear()
+
+class EventHub:
+    """Request lifecycle events fanned out to server-sent event streams.
+
+    Each event is published to the channels of everyone who should see it:
+    the customer (user:<id>), the assigned professional and the
+    professionals the request is or was offered to (professional:<id>),
+    and admins (admin). A stream subscribes to the channels of its user,
+    so scoping costs nothing per event.
+    """
+
+    def __init__(self, broker, max_streams=32, heartbeat=15, stream_seconds=300):
+        self.broker = broker
+        self.max_streams = max_streams
+        self.heartbeat = heartbeat
+        self.stream_seconds = stream_seconds
+        self._ids = itertools.count(1)
+        self._streams = threading.BoundedSemaphore(max_streams)
+
+    def publish_request(self, kind, row, offered_to=()):
+        """Publish a request.<kind> event for a service request row.
+
+        row needs id, status, user_id, professional_id, service_id,
+        location_pin and scheduled_date, e.g. a RETURNING row. offered_to
+        are the professionals the request was just offered to or
+        withdrawn from (see dispatch_requests and remove_request).
+        """
+        data = json.dumps({
+            'event': f'request.{kind}',
+            'id': f'{os.getpid()}.{next(self._ids)}',
+            'request': {
+                'id': row.id,
+                'status': row.status,
+                'user_id': row.user_id,
+                'professional_id': row.professional_id,
+                'service_id': row.service_id,
+                'location_pin': row.location_pin,
+                'scheduled_date': row.scheduled_date.isoformat() if row.scheduled_date else None
+            }
+        })
+        channels = [f'user:{row.user_id}', 'admin']
+        for professional_id in {row.professional_id, *offered_to} - {None}:
+            channels.append(f'professional:{professional_id}')
+        try:
+            for channel in channels:
+                self.broker.publish(channel, data)
+            metrics.inc('events_published_total', event=kind)
+        except Exception as e:
+            # Clients still see the change on their next fetch
+            print(f"Error publishing request.{kind} for request {row.id}: {e}")
+
+    def open_stream(self, channels):
+        """Subscribe to channels; returns the pubsub, or None at max_streams"""
+        streams = self._streams
+        if not streams.acquire(blocking=False):
+            return None
+        pubsub = self.broker.pubsub(ignore_subscribe_messages=True)
+        pubsub.stream_slots = streams  # released here even if init_events replaced _streams
+        pubsub.subscribe(*channels)
+        metrics.inc('event_streams_opened_total')
+        return pubsub
+
+    def close_stream(self, pubsub):
+        pubsub.close()
+        pubsub.stream_slots.release()
+
+    def stream(self, pubsub):
+        """Yield SSE frames until stream_seconds pass; the browser then reconnects"""
+        yield f'retry: {RECONNECT_MS}\n\n'
+        deadline = time.monotonic() + self.stream_seconds
+        # A subscriber on several of an event's channels gets it once per channel
+        recent = deque(maxlen=32)
+        while time.monotonic() < deadline:
+            message = pubsub.get_message(timeout=self.heartbeat)
+            if message is None:
+                yield ': keep-alive\n\n'
+                continue
+            data = message['data']
+            if isinstance(data, bytes):
+                data = data.decode()
+            event = json.loads(data)
+            if event['id'] in recent:
+                continue
+            recent.append(event['id'])
+            yield f"id: {event['id']}\nevent: {event['event']}\ndata: {data}\n\n"
+
+event_hub = EventHub(LocalBroker())
+
+def make_broker(url, max_pending):
+    """A redis client for url, or a LocalBroker if no url is configured.
+
+    A LocalBroker only reaches streams held by the worker process that
+    published the event, so with several workers a stream misses whatever
+    the others publish until the page fetches again. A redis broker
+    reaches every worker; it bounds slow subscribers with its own client
+    output buffer limit rather than max_pending.
+    """
+    if not url:
+        return LocalBroker(max_pending)
+    try:
+        import redis
+    except ImportError:
+        raise RuntimeError('EVENTS_BROKER_URL is set but the redis package is not installed')
+    return redis.Redis.from_url(url)
+
+def init_events(app):
+    event_hub.broker = make_broker(app.config['EVENTS_BROKER_URL'], app.config['EVENTS_MAX_PENDING'])
+    event_hub.max_streams = app.config['EVENTS_MAX_STREAMS']
+    event_hub._streams = threading.BoundedSemaphore(event_hub.max_streams)
+    event_hub.heartbeat = app.config['EVENTS_HEARTBEAT_SECONDS']
+    event_hub.stream_seconds = app.config['EVENTS_STREAM_SECONDS']
+
+def subscriber_channels(user):
+    """The channels a logged-in user's event stream listens on"""
+    if user.role == 'admin':
+        return ['admin']
+    if user.role == 'professional':
+        return [f'professional:{user.id}']
+    return [f'user:{user.id}']
@@ -0,0 +1,183 @@
+import io
+from datetime import datetime
+from models import *
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+# Output column -> pyarrow type name, in file order
+EXPORT_COLUMNS = {
+    'id': 'int64',
+    'status': 'string',
+    'request_date': 'timestamp',
+    'scheduled_date': 'timestamp',
+    'scheduled_end': 'timestamp',
+    'accepted_at': 'timestamp',
+    'completion_date': 'timestamp',
+    'service_id': 'int64',
+    'service_name': 'string',
+    'category_name': 'string',
+    'location_pin': 'string',
+    'user_id': 'int64',
+    'customer_name': 'string',
+    'customer_email': 'string',
+    'professional_id': 'int64',
+    'professional_name': 'string',
+    'quantity': 'int64',
+    'total_amount': 'float64',
+    'rating': 'float64',
+    'accept_minutes': 'float64',
+    'complete_minutes': 'float64',
+}
+
+def parse_export_filters(args):
+    """Filters for export_statement from request args or CLI options.
+
+    Accepts status (comma separated), location_pin, service_id,
+    professional_id and requested_from/requested_to and
+    scheduled_from/scheduled_to as ISO dates. Raises ValueError with a
+    message for the client on bad input.
+    """
+    filters = {}
+    if args.get('status'):
+        filters['status'] = args['status'].split(',')
+    if args.get('location_pin'):
+        filters['location_pin'] = args['location_pin']
+    for field in ('service_id', 'professional_id'):
+        value = args.get(field)
+        if value:
+            if not str(value).isdigit():
+                raise ValueError(f'{field} must be an integer')
+            filters[field] = int(value)
+    for field in ('requested_from', 'requested_to', 'scheduled_from', 'scheduled_to'):
+        if args.get(field):
+            try:
+                filters[field] = datetime.fromisoformat(str(args[field]))
+            except ValueError:
+                raise ValueError(f'{field} must be an ISO date')
+    return filters
+
+def export_statement(filters):
+    """One SELECT of every export column, joined and filtered in the database, by id"""
+    customer = db.aliased(User)
+    professional = db.aliased(User)
+    ratings = db.select(
+        Review.service_request_id, db.func.avg(Review.rating).label('rating')
+    ).group_by(Review.service_request_id).subquery()
+
+    stmt = db.select(
+        ServiceRequest.id, ServiceRequest.status, ServiceRequest.request_date,
+        ServiceRequest.scheduled_date, ServiceRequest.scheduled_end, ServiceRequest.accepted_at,
+        ServiceRequest.completion_date, ServiceRequest.service_id,
+        Service.name.label('service_name'), ServiceCategory.name.label('category_name'),
+        ServiceRequest.location_pin, ServiceRequest.user_id,
+        customer.username.label('customer_name'), customer.email.label('customer_email'),
+        ServiceRequest.professional_id, professional.username.label('professional_name'),
+        ServiceRequest.quantity, ServiceRequest.total_amount, ratings.c.rating
+    ).join(
+        Service, Service.id == ServiceRequest.service_id
+    ).outerjoin(
+        ServiceCategory, ServiceCategory.id == Service.category_id
+    ).join(
+        customer, customer.id == ServiceRequest.user_id
+    ).outerjoin(
+        professional, professional.id == ServiceRequest.professional_id
+    ).outerjoin(
+        ratings, ratings.c.service_request_id == ServiceRequest.id
+    )
+
+    if 'status' in filters:
+        stmt = stmt.where(ServiceRequest.status.in_(filters['status']))
+    for field in ('location_pin', 'service_id', 'professional_id'):
+        if field in filters:
+            stmt = stmt.where(getattr(ServiceRequest, field) == filters[field])
+    if 'requested_from' in filters:
+        stmt = stmt.where(ServiceRequest.request_date >= filters['requested_from'])
+    if 'requested_to' in filters:
+        stmt = stmt.where(ServiceRequest.request_date < filters['requested_to'])
+    if 'scheduled_from' in filters:
+        stmt = stmt.where(ServiceRequest.scheduled_date >= filters['scheduled_from'])
+    if 'scheduled_to' in filters:
+        stmt = stmt.where(ServiceRequest.scheduled_date < filters['scheduled_to'])
+    return stmt.order_by(ServiceRequest.id)
+
+def export_frames(engine, stmt, chunk_rows):
+    """DataFrames of at most chunk_rows rows, read through a server-side cursor.
+
+    Uses its own connection, so it can run after the request's session is
+    gone (inside a streamed response). Derived columns are computed on
+    whole columns at once.
+    """
+    import pandas as pd
+
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, max_row_buffer=chunk_rows).execute(stmt)
+        columns = list(result.keys())
+        for rows in result.partitions(chunk_rows):
+            frame = pd.DataFrame.from_records(rows, columns=columns)
+            for column, kind in EXPORT_COLUMNS.items():
+                if kind == 'timestamp' and column in frame:
+                    frame[column] = pd.to_datetime(frame[column])
+            frame['accept_minutes'] = (frame['accepted_at'] - frame['request_date']).dt.total_seconds() / 60
+            frame['complete_minutes'] = (frame['completion_date'] - frame['request_date']).dt.total_seconds() / 60
+            for column, kind in EXPORT_COLUMNS.items():
+                if kind == 'int64':
+                    frame[column] = frame[column].astype('Int64')  # nullable
+                elif kind == 'float64':
+                    frame[column] = frame[column].astype('float64')
+            yield frame[list(EXPORT_COLUMNS)]
+
+def csv_chunks(frames):
+    header = True
+    for frame in frames:
+        yield frame.to_csv(index=False, header=header, date_format='%Y-%m-%dT%H:%M:%S').encode()
+        header = False
+    if header:
+        # No rows: still send the header line
+        yield (','.join(EXPORT_COLUMNS) + '\n').encode()
+
+class ChunkSink(io.RawIOBase):
+    """Write-only file that hands out what was written since the last take()"""
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._buffer += data
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def take(self):
+        data, self._buffer = bytes(self._buffer), bytearray()
+        return data
+
+def parquet_chunks(frames):
+    """One Parquet row group per frame, yielded as soon as it is encoded"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    types = {'int64': pa.int64(), 'float64': pa.float64(), 'string': pa.string(), 'timestamp': pa.timestamp('us')}
+    schema = pa.schema([(column, types[kind]) for column, kind in EXPORT_COLUMNS.items()])
+    sink = ChunkSink()
+    with pq.ParquetWriter(sink, schema, compression='snappy') as writer:
+        for frame in frames:
+            writer.write_table(pa.Table.from_pandas(frame, schema=schema, preserve_index=False))
+            yield sink.take()
+    yield sink.take()  # footer
+
+def export_chunks(export_format, engine, stmt, chunk_rows):
+    """Encoded chunks of the export file; raises ImportError if the format's
+    library is not installed (pyarrow for Parquet)"""
+    if export_format == 'parquet':
+        import pyarrow  # fail before the response starts, not halfway through it
+        return parquet_chunks(export_frames(engine, stmt, chunk_rows))
+    return csv_chunks(export_frames(engine, stmt, chunk_rows))
@@ -3,10 +3,41 @@ from flask_bcrypt import Bcrypt
 from flask_login import LoginManager,login_required,logout_user,login_user,current_user
 from flask_restful import Api
 from flask_cors import CORS
-from main import app
+from sqlalchemy import event
+from config import database_profile_options
 
-db = SQLAlchemy(app)
-bcrypt = Bcrypt(app)
-login_manager = LoginManager(app)
-api = Api(app)
-CORS(app, supports_credentials=True)
\ No newline at end of file
+db = SQLAlchemy()
+bcrypt = Bcrypt()
+login_manager = LoginManager()
+api = Api()
+cors = CORS()
+
+def apply_sqlite_pragmas(engine, pragmas):
+    """Run the configured PRAGMAs on every new SQLite connection"""
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
+
+def init_extensions(app):
+    # From the app's own config, so a config object can pick the database
+    # and profile or set SQLALCHEMY_ENGINE_OPTIONS/SQLITE_PRAGMAS directly
+    engine_options, pragmas = database_profile_options(
+        app.config.get('SQLALCHEMY_DATABASE_URI'), app.config.get('DB_PROFILE', 'tuned')
+    )
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options)
+    app.config.setdefault('SQLITE_PRAGMAS', pragmas)
+
+    db.init_app(app)
+    bcrypt.init_app(app)
+    login_manager.init_app(app)
+    api.init_app(app)
+    cors.init_app(app, supports_credentials=True)
+
+    with app.app_context():
+        if app.config['SQLITE_PRAGMAS'] and db.engine.dialect.name == 'sqlite':
+            apply_sqlite_pragmas(db.engine, app.config['SQLITE_PRAGMAS'])
+        settings = app.config['SQLITE_PRAGMAS'] or app.config['SQLALCHEMY_ENGINE_OPTIONS'] or 'stock settings'
+        app.logger.info(f"Database profile '{app.config.get('DB_PROFILE', 'tuned')}' ({db.engine.dialect.name}): {settings}")
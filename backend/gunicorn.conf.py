@@ -0,0 +1,46 @@
+import multiprocessing
+import os
+
+# Serving settings for `gunicorn -c gunicorn.conf.py wsgi:app`.
+# Every value can be overridden from the environment.
+
+bind = os.getenv('GUNICORN_BIND', '127.0.0.1:5000')
+
+# Sync workers with a few threads each: requests mostly wait on the database
+# and on bcrypt, so (2 x cores) + 1 processes keeps every core busy.
+# Every open /api/events stream holds a thread, so each worker gets
+# EVENTS_MAX_STREAMS threads on top of the ones serving requests.
+workers = int(os.getenv('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.getenv('GUNICORN_THREADS', 4 + int(os.getenv('EVENTS_MAX_STREAMS', 32))))
+worker_class = 'gthread'
+
+# Import the app and models once in the master, then fork
+preload_app = True
+
+# Recycle each worker after a number of requests (with jitter so they do not
+# all restart together) to cap memory growth; in-flight requests finish first.
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 100))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+
+accesslog = os.getenv('GUNICORN_ACCESS_LOG', '-')
+errorlog = '-'
+
+def post_fork(server, worker):
+    # Connections opened by the master while preloading must not be shared
+    # with the forked workers; drop them so each worker opens its own.
+    from wsgi import app
+    from extensions import db
+    with app.app_context():
+        db.engine.dispose(close=False)
+
+def child_exit(server, worker):
+    # Recycled workers would otherwise leave a metrics file behind each,
+    # and every scrape reads them all; fold them into one instead.
+    from metrics import metrics
+    try:
+        metrics.retire_dead_workers()
+    except Exception as e:
+        server.log.warning(f"Could not fold metrics of worker {worker.pid}: {e}")
@@ -0,0 +1,99 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from werkzeug.security import generate_password_hash, check_password_hash
+
+# Kept free of app/model imports: pool processes import this module by name
+
+class HashingBusy(Exception):
+    """Raised when the hashing pool is full and a slot did not free up in time"""
+
+class PasswordHasher:
+    """Runs password hashing and verification in a small process pool.
+
+    Hashing is deliberately slow and CPU bound. Done on request threads, a
+    login burst takes every core and every other endpoint slows down.
+    Sending it to max_workers processes caps how many cores hashing can
+    take, and the max_pending semaphore bounds the backlog: callers that
+    cannot get a slot within timeout get HashingBusy instead of queueing
+    without limit.
+
+    max_workers=0 hashes on the calling thread (still bounded by
+    max_pending), for platforms or tests where a process pool is unwanted.
+    """
+
+    def __init__(self, method='scrypt:32768:8:1', max_workers=2, max_pending=16, timeout=10):
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pool_pid = None
+        self.configure(method, max_workers, max_pending, timeout)
+
+    def configure(self, method, max_workers, max_pending, timeout):
+        self.shutdown()
+        self.method = method
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._method_prefix = None
+
+    def _executor(self):
+        # A pool inherited through fork (gunicorn preload) is unusable, so
+        # each process starts its own on first use
+        with self._lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+                self._pool_pid = os.getpid()
+            return self._pool
+
+    def _run(self, fn, *args):
+        slots = self._slots
+        if not slots.acquire(timeout=self.timeout):
+            raise HashingBusy('Too many password operations in progress')
+        if self.max_workers == 0:
+            try:
+                return fn(*args)
+            finally:
+                slots.release()
+
+        try:
+            future = self._executor().submit(fn, *args)
+        except BaseException:
+            slots.release()
+            raise
+        # The slot stays taken until the job really ends, even if we stop waiting
+        future.add_done_callback(lambda f: slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            raise HashingBusy('Password operation timed out')
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """True if password_hash was made with other parameters than self.method"""
+        if self._method_prefix is None:
+            # werkzeug fills in defaults ('scrypt' -> 'scrypt:32768:8:1'), so
+            # take the prefix from a real hash instead of the setting
+            self._method_prefix = generate_password_hash('', self.method).split('$', 1)[0]
+        return password_hash.split('$', 1)[0] != self._method_prefix
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None and self._pool_pid == os.getpid():
+                self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+password_hasher = PasswordHasher()
+
+def init_hashing(app):
+    password_hasher.configure(
+        app.config['PASSWORD_HASH_METHOD'],
+        app.config['PASSWORD_HASH_WORKERS'],
+        app.config['PASSWORD_HASH_MAX_PENDING'],
+        app.config['PASSWORD_HASH_TIMEOUT']
+    )
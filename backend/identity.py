@@ -0,0 +1,140 @@
+import json
+from flask import has_request_context, request
+from flask_login import UserMixin
+from models import *
+from catalog import LocalCacheBackend
+
+class Identity(UserMixin):
+    """What Flask-Login's current_user is on authenticated requests.
+
+    Reads of the cached fields (see load_identity) are served from the
+    snapshot. Anything else, including writes, goes to the User row, which
+    is loaded on first use, and a write drops the cached snapshot.
+    """
+
+    def __init__(self, data):
+        object.__setattr__(self, '_data', data)
+        object.__setattr__(self, '_user', None)
+
+    @property
+    def user(self):
+        if self._user is None:
+            object.__setattr__(self, '_user', db.session.get(User, self._data['id']))
+        return self._user
+
+    def __getattr__(self, name):
+        data = self.__dict__['_data']
+        if name in data:
+            return data[name]
+        return getattr(self.user, name)
+
+    def __setattr__(self, name, value):
+        setattr(self.user, name, value)
+        if name in self._data:
+            self._data[name] = value
+        identity_cache.invalidate(self._data['id'])
+
+class IdentityCache:
+    """Short-lived per-user snapshots for the user_loader.
+
+    Each user has a version counter in the cache and the snapshot key embeds
+    it, so invalidate(user_id) retires the snapshot at once. Other worker
+    processes only see the change when their copy expires after ttl
+    seconds, so load_user reloads the snapshot (see needs_fresh_identity)
+    wherever a stale block or role would matter.
+    """
+
+    def __init__(self, backend, ttl=30):
+        self.backend = backend
+        self.ttl = ttl
+
+    def _key(self, user_id):
+        version = int(self.backend.get(f'identity:{user_id}:version') or 0)
+        return f'identity:{user_id}:{version}'
+
+    def get(self, user_id):
+        """The cached snapshot, or None"""
+        cached = self.backend.get(self._key(user_id))
+        return json.loads(cached) if cached is not None else None
+
+    def refresh(self, user_id):
+        """Load the snapshot from the database and cache it"""
+        data = load_identity(user_id)
+        if data is not None:
+            self.backend.set(self._key(user_id), json.dumps(data), ex=self.ttl)
+        return data
+
+    def invalidate(self, user_id):
+        return self.backend.incr(f'identity:{user_id}:version')
+
+identity_cache = IdentityCache(LocalCacheBackend())
+
+def init_identity(app):
+    identity_cache.backend = LocalCacheBackend(app.config['IDENTITY_CACHE_SIZE'])
+    identity_cache.ttl = app.config['IDENTITY_CACHE_TTL']
+
+def load_identity(user_id):
+    """User, professional fields and default address in one query"""
+    professionals = Professional.__table__
+    row = db.session.query(
+        User.id, User.email, User.username, User.role, User.image_file, User.is_blocked,
+        professionals.c.verification_status, professionals.c.service_type,
+        Address.id.label('address_id'), Address.address_line1, Address.address_line2, Address.city,
+        Address.state, Address.pincode, Address.phone_number
+    ).outerjoin(
+        professionals, professionals.c.id == User.id
+    ).outerjoin(
+        Address, db.and_(Address.user_id == User.id, Address.is_default == True)
+    ).filter(User.id == user_id).order_by(Address.id).first()
+    if row is None:
+        return None
+
+    return {
+        'id': row.id,
+        'email': row.email,
+        'username': row.username,
+        'role': row.role,
+        'image_file': row.image_file,
+        'is_blocked': row.is_blocked,
+        'verification_status': row.verification_status,
+        'service_type': row.service_type,
+        'default_address': {
+            'id': row.address_id,
+            'address_line1': row.address_line1,
+            'address_line2': row.address_line2,
+            'city': row.city,
+            'state': row.state,
+            'pincode': row.pincode,
+            'phone_number': row.phone_number,
+            'is_default': True
+        } if row.address_id is not None else None
+    }
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Requests that act on the account's current block status and role
+FRESH_IDENTITY_ENDPOINTS = {'api.current_user_info'}
+
+def is_write_request():
+    return has_request_context() and request.method not in SAFE_METHODS
+
+def needs_fresh_identity(data):
+    """True for writes, admin requests and FRESH_IDENTITY_ENDPOINTS.
+
+    A user blocked or re-roled through another worker must not write or
+    act as admin on that worker's cached snapshot, so these requests pay
+    one query to reload it. Other reads may see the old snapshot for up
+    to IDENTITY_CACHE_TTL seconds.
+    """
+    if not has_request_context():
+        return False
+    return is_write_request() or data['role'] == 'admin' or request.endpoint in FRESH_IDENTITY_ENDPOINTS
+
+@login_manager.user_loader
+def load_user(user_id):
+    data = identity_cache.get(int(user_id))
+    if data is None or needs_fresh_identity(data):
+        data = identity_cache.refresh(int(user_id))
+    if data is None or (data['is_blocked'] and is_write_request()):
+        return None  # blocked users can't change anything, as if signed out
+    return Identity(data)
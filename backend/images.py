@@ -0,0 +1,120 @@
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import request
+from storage import *
+
+# name -> longest side in pixels
+IMAGE_SIZES = {'thumb': 160, 'card': 480, 'full': 1280}
+
+# extension -> (Pillow format, save options)
+IMAGE_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+def variant_key(folder, filename, size, ext):
+    stem = filename.rsplit('.', 1)[0]
+    return f'{folder}/variants/{stem}.{size}.{ext}'
+
+def make_variants(folder, filename):
+    """Write every size/format variant of an image that is missing.
+
+    Returns how many were written; a missing or non-image source writes none.
+    """
+    # Pillow is only needed here, so it is not imported at startup
+    from PIL import Image, ImageOps, UnidentifiedImageError
+    written = 0
+    try:
+        with Image.open(storage.path(f'{folder}/{filename}')) as original:
+            original = ImageOps.exif_transpose(original)
+            if original.mode not in ('RGB', 'RGBA'):
+                original = original.convert('RGBA' if 'transparency' in original.info else 'RGB')
+            for size, pixels in IMAGE_SIZES.items():
+                image = original.copy()
+                image.thumbnail((pixels, pixels), Image.LANCZOS)
+                for ext, (image_format, options) in IMAGE_FORMATS.items():
+                    key = variant_key(folder, filename, size, ext)
+                    if storage.exists(key):
+                        continue
+                    os.makedirs(image_pipeline.tmp_dir, exist_ok=True)
+                    with tempfile.NamedTemporaryFile(dir=image_pipeline.tmp_dir, delete=False) as tmp:
+                        (image.convert('RGB') if image_format == 'JPEG' else image).save(tmp, image_format, **options)
+                    storage.put(key, tmp.name)
+                    written += 1
+    except (FileNotFoundError, UnidentifiedImageError):
+        return 0
+    return written
+
+def delete_variants(key):
+    """Storage release callback: drop an image's variants with it"""
+    folder, _, filename = key.rpartition('/')
+    for size in IMAGE_SIZES:
+        for ext in IMAGE_FORMATS:
+            storage.delete(variant_key(folder, filename, size, ext))
+
+class ImagePipeline:
+    """Thread pool that renders variants off the request thread.
+
+    Pillow releases the GIL while decoding, resizing and encoding, so a
+    couple of threads per worker process are enough.
+    """
+
+    def __init__(self, max_workers=2, tmp_dir='instance/uploads/.tmp'):
+        self.max_workers = max_workers
+        self.tmp_dir = tmp_dir  # variants are rendered here, then moved into storage
+        self._pool = None
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def submit(self, folder, filename):
+        with self._lock:
+            if (folder, filename) in self._pending:
+                return
+            self._pending.add((folder, filename))
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(self.max_workers, thread_name_prefix='images')
+        self._pool.submit(self._run, folder, filename)
+
+    def _run(self, folder, filename):
+        try:
+            make_variants(folder, filename)
+        except Exception as e:
+            print(f"Error creating variants of {folder}/{filename}: {e}")
+        finally:
+            with self._lock:
+                self._pending.discard((folder, filename))
+
+image_pipeline = ImagePipeline()
+
+def init_images(app):
+    image_pipeline.max_workers = app.config['IMAGE_WORKERS']
+    image_pipeline.tmp_dir = app.config['UPLOAD_TMP_FOLDER']
+    if delete_variants not in release_callbacks:
+        release_callbacks.append(delete_variants)
+
+def image_response(folder, filename, size=None):
+    """Send the precomputed variant for size when there is one, else the original.
+
+    WebP goes to clients that accept it, JPEG to the rest. A missing
+    variant is queued so the next request finds it; until then the
+    original stands in, marked for revalidation so browsers and proxies
+    don't keep it as the variant.
+    """
+    if size not in IMAGE_SIZES:
+        return send_upload(f'{folder}/{filename}')
+
+    ext = 'webp' if 'image/webp' in request.headers.get('Accept', '') else 'jpg'
+    key = variant_key(folder, filename, size, ext)
+    if storage.exists(key):
+        response = send_upload(key)
+    else:
+        if storage.exists(f'{folder}/{filename}'):
+            image_pipeline.submit(folder, filename)
+        response = send_upload(f'{folder}/{filename}')
+        response.cache_control.immutable = False
+        response.cache_control.max_age = None
+        response.cache_control.no_cache = True
+    response.vary.add('Accept')
+    return response
@@ -0,0 +1,295 @@
+import csv
+import io
+import json
+from models import *
+from catalog import invalidate_catalog
+
+IMPORT_SECTIONS = ('categories', 'services', 'service_areas')
+
+class ImportRejected(Exception):
+    """Raised by import_catalog when any row is invalid; nothing was written"""
+
+    def __init__(self, errors):
+        super().__init__(f'{len(errors)} invalid rows')
+        self.errors = errors
+
+def read_import_file(filename, text):
+    """Rows of one section: a JSON list for *.json, CSV with a header otherwise"""
+    if filename.lower().endswith('.json'):
+        rows = json.loads(text)
+        if not isinstance(rows, list):
+            raise ValueError(f'{filename} must hold a JSON list of rows')
+        return rows
+    return list(csv.DictReader(io.StringIO(text)))
+
+def clean_row(row):
+    """Strip strings and drop blank cells, so they leave existing values alone"""
+    cleaned = {}
+    for field, value in row.items():
+        if field is None:
+            continue  # extra CSV cells without a header
+        if isinstance(value, str):
+            value = value.strip()
+        if value is not None and value != '':
+            cleaned[str(field).strip()] = value
+    return cleaned
+
+def parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    text = str(value).lower()
+    if text in ('1', 'true', 'yes', 'y'):
+        return True
+    if text in ('0', 'false', 'no', 'n'):
+        return False
+    raise ValueError('must be true or false')
+
+def parse_price(value):
+    try:
+        price = float(value)
+    except (TypeError, ValueError):
+        price = -1
+    if not price >= 0:
+        raise ValueError('must be a number, at least 0')
+    return price
+
+def parse_minutes(value):
+    if not str(value).isdigit() or int(value) == 0:
+        raise ValueError('must be a whole number of minutes')
+    return int(value)
+
+def parse_pincodes(value):
+    """A list or comma separated string of pincodes, without repeats"""
+    values = value if isinstance(value, list) else str(value).split(',')
+    pincodes = []
+    for pincode in (str(v).strip() for v in values):
+        if not pincode:
+            continue
+        if len(pincode) > ServiceLocation.pin_code.type.length:
+            raise ValueError(f'has {pincode}, longer than {ServiceLocation.pin_code.type.length} characters')
+        if pincode not in pincodes:
+            pincodes.append(pincode)
+    return pincodes
+
+def parse_name(value, column):
+    if len(str(value)) > column.type.length:
+        raise ValueError(f'must be at most {column.type.length} characters')
+    return str(value)
+
+def chunked(values, size=500):
+    """values in lists short enough for an IN (...) on any database"""
+    values = list(values)
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+class CatalogImport:
+    """One bulk import of categories, services and service areas.
+
+    validate() checks every row against the database and the rest of the
+    import in one pass and collects an error per bad row. apply() then
+    writes everything with one SELECT per table for what already exists
+    and executemany INSERTs and UPDATEs for the rest, in the caller's
+    transaction.
+
+    Categories and services are matched by name, service areas by service
+    name and pincode. A service row with pincodes replaces that service's
+    areas, as editing the service does; service_areas rows add or
+    (de)activate single areas and leave the others alone.
+    """
+
+    FIELDS = {
+        'categories': {'name': None, 'description': str, 'is_active': parse_bool},
+        'services': {
+            'name': None, 'description': str, 'base_price': parse_price, 'time_required': parse_minutes,
+            'is_active': parse_bool, 'category': str, 'pincodes': parse_pincodes
+        },
+        'service_areas': {'service': str, 'pin_code': parse_pincodes, 'is_active': parse_bool},
+    }
+
+    def __init__(self, sections):
+        self.sections = {name: sections.get(name) or [] for name in IMPORT_SECTIONS}
+        self.errors = []
+        self.categories = {}   # name -> column values
+        self.services = {}     # name -> column values, plus category and pincodes
+        self.areas = {}        # (service name, pincode) -> is_active
+        self.counts = {name: {'created': 0, 'updated': 0} for name in IMPORT_SECTIONS}
+        self.counts['service_areas']['removed'] = 0
+
+    def error(self, section, number, message):
+        self.errors.append({'section': section, 'row': number, 'error': message})
+
+    def parsed_rows(self, section, name_column=None):
+        """(row number from 1, parsed values) for the section's valid rows"""
+        fields = self.FIELDS[section]
+        for number, row in enumerate(self.sections[section], 1):
+            if not isinstance(row, dict):
+                self.error(section, number, 'row must be an object')
+                continue
+            row = clean_row(row)
+            unknown = sorted(set(row) - set(fields))
+            if unknown:
+                self.error(section, number, f"unknown fields {', '.join(unknown)}")
+                continue
+            values = {}
+            try:
+                for field, value in row.items():
+                    parse = fields[field] or (lambda value: parse_name(value, name_column))
+                    values[field] = parse(value)
+            except ValueError as e:
+                self.error(section, number, f'{field} {e}')
+                continue
+            yield number, values
+
+    def validate(self):
+        """Check every row; returns True when there are no errors"""
+        existing_categories = {name for name, in db.session.query(ServiceCategory.name)}
+        self.existing_services = {}  # name -> ids; names are not unique in the table
+        for service_id, name in db.session.query(Service.id, Service.name).order_by(Service.id):
+            self.existing_services.setdefault(name, []).append(service_id)
+
+        for number, values in self.parsed_rows('categories', ServiceCategory.name):
+            name = values.get('name')
+            if not name:
+                self.error('categories', number, 'name is required')
+            elif name in self.categories:
+                self.error('categories', number, f'category {name} appears more than once')
+            else:
+                self.categories[name] = values
+
+        known_categories = existing_categories | set(self.categories)
+        for number, values in self.parsed_rows('services', Service.name):
+            name = values.get('name')
+            missing = [field for field in ('base_price', 'time_required') if field not in values]
+            if not name:
+                self.error('services', number, 'name is required')
+            elif name in self.services:
+                self.error('services', number, f'service {name} appears more than once')
+            elif len(self.existing_services.get(name, ())) > 1:
+                self.error('services', number, f'several services are named {name}; edit them one at a time')
+            elif name not in self.existing_services and missing:
+                self.error('services', number, f"{' and '.join(missing)} required for a new service")
+            elif 'category' in values and values['category'] not in known_categories:
+                self.error('services', number, f"unknown category {values['category']}")
+            else:
+                self.services[name] = values
+
+        for number, values in self.parsed_rows('service_areas'):
+            service, pincodes = values.get('service'), values.get('pin_code', [])
+            if not service or len(pincodes) != 1:
+                self.error('service_areas', number, 'service and a single pin_code are required')
+            elif service not in self.existing_services and service not in self.services:
+                self.error('service_areas', number, f'unknown service {service}')
+            elif len(self.existing_services.get(service, ())) > 1:
+                self.error('service_areas', number, f'several services are named {service}')
+            elif (service, pincodes[0]) in self.areas:
+                self.error('service_areas', number, f'{service} in {pincodes[0]} appears more than once')
+            else:
+                self.areas[(service, pincodes[0])] = values.get('is_active', True)
+
+        return not self.errors
+
+    def upsert(self, model, section, ids, rows):
+        """UPDATE the rows whose name is in ids and INSERT the rest, each as
+        one executemany; adds the new rows' ids to ids"""
+        updates = [dict(row, id=ids[row['name']]) for row in rows if row['name'] in ids]
+        inserts = [row for row in rows if row['name'] not in ids]
+        if updates:
+            db.session.execute(db.update(model), updates)
+        if inserts:
+            ids.update(db.session.execute(db.insert(model).returning(model.name, model.id), inserts).all())
+        self.counts[section]['created'] += len(inserts)
+        self.counts[section]['updated'] += len(updates)
+
+    def apply(self):
+        """Write a validated import into the current transaction"""
+        category_ids = dict(db.session.query(ServiceCategory.name, ServiceCategory.id))
+        self.upsert(ServiceCategory, 'categories', category_ids, list(self.categories.values()))
+
+        service_rows = []
+        for values in self.services.values():
+            row = {field: value for field, value in values.items() if field not in ('category', 'pincodes')}
+            if 'category' in values:
+                row['category_id'] = category_ids[values['category']]
+            service_rows.append(row)
+        service_ids = {name: ids[0] for name, ids in self.existing_services.items()}
+        self.upsert(Service, 'services', service_ids, service_rows)
+
+        # Service areas: the pincodes each touched service should end up with
+        wanted = {}      # (service_id, pincode) -> is_active
+        replaced = set() # services whose pincodes were given in full
+        for name, values in self.services.items():
+            if 'pincodes' in values:
+                replaced.add(service_ids[name])
+                for pincode in values['pincodes']:
+                    wanted[(service_ids[name], pincode)] = True
+        for (name, pincode), is_active in self.areas.items():
+            wanted[(service_ids[name], pincode)] = is_active
+        touched = replaced | {service_id for service_id, _ in wanted}
+        if not touched:
+            return
+
+        existing = {}    # (service_id, pincode) -> (location id, is_active)
+        for ids in chunked(touched):
+            rows = db.session.query(
+                ServiceLocation.id, ServiceLocation.service_id, ServiceLocation.pin_code, ServiceLocation.is_active
+            ).filter(ServiceLocation.service_id.in_(ids)).order_by(ServiceLocation.id)
+            for location_id, service_id, pincode, is_active in rows:
+                existing[(service_id, pincode)] = (location_id, is_active)
+
+        removed = [location_id for key, (location_id, _) in existing.items() if key[0] in replaced and key not in wanted]
+        updates = [
+            {'id': existing[key][0], 'is_active': is_active}
+            for key, is_active in wanted.items() if key in existing and existing[key][1] != is_active
+        ]
+        inserts = [
+            {'service_id': service_id, 'pin_code': pincode, 'is_active': is_active}
+            for (service_id, pincode), is_active in wanted.items() if (service_id, pincode) not in existing
+        ]
+        if removed:
+            locations = ServiceLocation.__table__
+            db.session.execute(
+                db.delete(locations).where(locations.c.id == db.bindparam('location_id')),
+                [{'location_id': location_id} for location_id in removed]
+            )
+        if updates:
+            db.session.execute(db.update(ServiceLocation), updates)
+        if inserts:
+            db.session.execute(db.insert(ServiceLocation), inserts)
+        self.counts['service_areas'].update(created=len(inserts), updated=len(updates), removed=len(removed))
+
+        # Keep the comma separated service_area the edit form shows in step
+        areas = {service_id: [] for service_id in touched}
+        for (service_id, pincode), (_, is_active) in existing.items():
+            if wanted.get((service_id, pincode), is_active) and (service_id not in replaced or (service_id, pincode) in wanted):
+                areas[service_id].append(pincode)
+        for row in inserts:
+            if row['is_active']:
+                areas[row['service_id']].append(row['pin_code'])
+        db.session.execute(db.update(Service), [
+            {'id': service_id, 'service_area': ','.join(pincodes)} for service_id, pincodes in areas.items()
+        ])
+
+def import_catalog(sections, dry_run=False):
+    """Validate and write a bulk catalog import in one transaction.
+
+    sections maps categories, services and service_areas to lists of row
+    dicts. Raises ImportRejected with every row error if any row is bad.
+    Returns created/updated counts per section; with dry_run the writes
+    are rolled back, so the counts are what the import would do. The
+    catalog cache is invalidated once, after the commit.
+    """
+    job = CatalogImport(sections)
+    if not job.validate():
+        raise ImportRejected(job.errors)
+    try:
+        job.apply()
+        if dry_run:
+            db.session.rollback()
+        else:
+            db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    if not dry_run:
+        invalidate_catalog()
+    return job.counts
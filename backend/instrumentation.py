@@ -0,0 +1,148 @@
+import json
+import re
+import threading
+import time
+from collections import Counter
+from functools import wraps
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from extensions import *
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised in budget-enforcing mode when a route issues too many queries"""
+
+def query_budget(max_queries):
+    """Declare how many SQL statements a route may issue per request"""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            return f(*args, **kwargs)
+        decorated_function.query_budget = max_queries
+        return decorated_function
+    return decorator
+
+_literals = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_in_lists = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_spaces = re.compile(r"\s+")
+
+MAX_LOGGED_STATEMENT = 300  # characters kept per statement in logs/metrics
+
+def fingerprint(statement):
+    """Normalize a statement so the same query with other parameters matches"""
+    statement = _literals.sub('?', statement)
+    statement = _in_lists.sub('(?)', statement)
+    return _spaces.sub(' ', statement).strip()[:MAX_LOGGED_STATEMENT]
+
+class SQLMetrics:
+    """Per-endpoint SQL totals since the process started"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}
+
+    def record(self, endpoint, stats):
+        with self._lock:
+            route = self._routes.setdefault(endpoint, {
+                'requests': 0,
+                'queries': 0,
+                'max_queries': 0,
+                'db_time_ms': 0.0,
+                'n_plus_one_requests': 0,
+                'repeated': Counter()
+            })
+            route['requests'] += 1
+            route['queries'] += stats['query_count']
+            route['max_queries'] = max(route['max_queries'], stats['query_count'])
+            route['db_time_ms'] += stats['db_time_ms']
+            if stats['n_plus_one']:
+                route['n_plus_one_requests'] += 1
+                for item in stats['n_plus_one']:
+                    route['repeated'][item['statement']] += item['count']
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                endpoint: {
+                    'requests': route['requests'],
+                    'avg_queries': round(route['queries'] / route['requests'], 2),
+                    'max_queries': route['max_queries'],
+                    'avg_db_time_ms': round(route['db_time_ms'] / route['requests'], 3),
+                    'n_plus_one_requests': route['n_plus_one_requests'],
+                    'top_repeated': [
+                        {'statement': statement, 'count': count}
+                        for statement, count in route['repeated'].most_common(3)
+                    ]
+                }
+                for endpoint, route in self._routes.items()
+            }
+
+sql_metrics = SQLMetrics()
+
+def summarize_queries(queries, n_plus_one_threshold):
+    """Count, total time, slowest statements and likely N+1 loops"""
+    repeated = Counter(fingerprint(statement) for statement, _ in queries)
+    slowest = sorted(queries, key=lambda q: q[1], reverse=True)[:3]
+    return {
+        'query_count': len(queries),
+        'db_time_ms': round(sum(duration for _, duration in queries) * 1000, 3),
+        'slowest': [
+            {'statement': statement[:MAX_LOGGED_STATEMENT], 'ms': round(duration * 1000, 3)}
+            for statement, duration in slowest
+        ],
+        'n_plus_one': [
+            {'statement': statement, 'count': count}
+            for statement, count in repeated.most_common()
+            if count >= n_plus_one_threshold
+        ]
+    }
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and 'sql_queries' in g:
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and 'sql_queries' in g and conn.info.get('query_start'):
+        g.sql_queries.append((statement, time.perf_counter() - conn.info['query_start'].pop()))
+
+def start_sql_recording():
+    g.sql_queries = []
+
+def finish_sql_recording(response):
+    queries = g.pop('sql_queries', None)
+    if queries is None:
+        return response
+
+    stats = summarize_queries(queries, current_app.config['SQL_N_PLUS_ONE_THRESHOLD'])
+    endpoint = request.endpoint or request.path
+    sql_metrics.record(endpoint, stats)
+
+    response.headers.add(
+        'Server-Timing',
+        f'db;dur={stats["db_time_ms"]};desc="{stats["query_count"]} queries"'
+    )
+
+    log = current_app.logger.warning if stats['n_plus_one'] else current_app.logger.info
+    log(json.dumps({
+        'event': 'sql',
+        'method': request.method,
+        'endpoint': endpoint,
+        'status': response.status_code,
+        **stats
+    }))
+
+    view = current_app.view_functions.get(request.endpoint)
+    budget = getattr(view, 'query_budget', None)
+    if current_app.config['SQL_ENFORCE_QUERY_BUDGETS'] and budget is not None and stats['query_count'] > budget:
+        raise QueryBudgetExceeded(
+            f"{endpoint} issued {stats['query_count']} queries, budget is {budget}"
+        )
+    return response
+
+def init_instrumentation(app):
+    if not app.config['SQL_INSTRUMENTATION']:
+        return
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        event.listen(db.engine, 'after_cursor_execute', after_cursor_execute)
+    app.before_request(start_sql_recording)
+    app.after_request(finish_sql_recording)
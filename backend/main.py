@@ -1,12 +1,60 @@
+import os
 from flask import Flask
 from config import Config
 
-app = Flask(__name__)
-app.config.from_object(Config)
+def create_app(config=Config):
+    """Build an app with its extensions, routes and CLI commands.
 
-from api import *
+    Modules that register on the app are imported here rather than at the
+    top of the file, so importing main stays cheap and each call gets a
+    separate app (e.g. with a test config).
+
+    The caches, indexes, queues and upload storage are module-level
+    services shared by the whole process. Each call reconfigures them for
+    the new app: caches and indexes start empty, queued notifications and
+    rollups are first written to the previous app's database, and open
+    event streams still close cleanly. So several apps can be created in
+    one process (tests, CLI), but only the latest one should serve.
+    """
+    app = Flask(__name__)
+    app.config.from_object(config)
+
+    from extensions import init_extensions
+    from hashing import init_hashing
+    from instrumentation import init_instrumentation
+    from metrics import init_metrics
+    from catalog import init_catalog
+    from dispatch import init_dispatch
+    from identity import init_identity
+    from storage import init_storage
+    from images import init_images
+    from notifications import init_notifications
+    from events import init_events
+    from scheduling import init_scheduling
+    from analytics import init_analytics
+    from api import bp
+    from commands import register_commands
+
+    init_extensions(app)
+    init_hashing(app)
+    init_instrumentation(app)
+    init_metrics(app)
+    init_catalog(app)
+    init_dispatch(app)
+    init_identity(app)
+    init_storage(app)
+    init_images(app)
+    init_notifications(app)
+    init_events(app)
+    init_scheduling(app)
+    init_analytics(app)
+    app.register_blueprint(bp)
+    register_commands(app)
+    return app
 
 if __name__ == '__main__':
+    from extensions import db
+    app = create_app()
     app.app_context().push()
     db.create_all()
-    app.run(debug=True)
\ No newline at end of file
+    app.run(debug=os.getenv('FLASK_DEBUG', 'true').lower() == 'true')
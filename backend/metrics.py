@@ -0,0 +1,244 @@
+import atexit
+import glob
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from flask import g, request
+from extensions import *
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# name -> (type, help text)
+METRICS = {
+    'http_request_duration_seconds': ('histogram', 'Request latency by route, method and status'),
+    'http_requests_in_flight': ('gauge', 'Requests currently being handled'),
+    'password_verify_seconds': ('histogram', 'Time spent verifying a password hash'),
+    'service_requests_created_total': ('counter', 'Service requests booked'),
+    'service_requests_accepted_total': ('counter', 'Service requests accepted by a professional'),
+    'service_requests_completed_total': ('counter', 'Service requests marked completed'),
+    'service_requests_cancelled_total': ('counter', 'Service requests cancelled by the user'),
+    'signups_total': ('counter', 'User registrations'),
+    'logins_total': ('counter', 'Sign-in attempts by result'),
+    'events_published_total': ('counter', 'Request lifecycle events published, by event'),
+    'event_streams_opened_total': ('counter', 'Server-sent event streams opened'),
+    'db_pool_checked_out': ('gauge', 'Database connections currently in use'),
+    'db_pool_size': ('gauge', 'Configured database pool size'),
+    'db_pool_overflow': ('gauge', 'Database connections opened beyond the pool size'),
+}
+
+class MetricsRegistry:
+    """Counters, gauges and histograms for one worker process.
+
+    Updates only touch in-memory dicts. The values are written to a
+    per-process JSON file in METRICS_DIR at most every flush_interval
+    seconds, and a scrape merges the files of every worker, so any worker
+    can answer for the whole server. Files of exited workers are folded
+    into one retired file by retire_dead_workers.
+    """
+
+    RETIRED_FILE = 'metrics_retired.json'
+
+
+    def __init__(self, directory='instance/metrics', flush_interval=5):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._values = {}  # (name, sorted label items) -> number or histogram list
+        self._last_flush = 0
+
+    def _key(self, name, labels):
+        return name, tuple(sorted((labels or {}).items()))
+
+    def inc(self, name, amount=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self._values[self._key(name, labels)] = value
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            # one slot per bucket, then +Inf, sum
+            histogram = self._values.get(key)
+            if histogram is None:
+                histogram = self._values[key] = [0] * (len(buckets) + 2)
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram[i] += 1
+                    break
+            else:
+                histogram[len(buckets)] += 1
+            histogram[-1] += value
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def _path(self, pid):
+        return os.path.join(self.directory, f'metrics_{pid}.json')
+
+    def flush(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._last_flush < self.flush_interval:
+            return
+        self._last_flush = now
+        with self._lock:
+            rows = [[name, dict(labels), value] for (name, labels), value in self._values.items()]
+        self._write(self._path(os.getpid()), rows)
+
+    def _read(self, path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, path, rows):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(rows, f)
+        os.replace(path + '.tmp', path)
+
+    def _worker_files(self):
+        """(path, pid) of every worker file; pid is None for the retired file"""
+        for path in glob.glob(os.path.join(self.directory, 'metrics_*.json')):
+            name = os.path.basename(path)[len('metrics_'):-len('.json')]
+            yield path, int(name) if name.isdigit() else None
+
+    def _merge(self, merged, rows, include_gauges=True):
+        for name, labels, value in rows:
+            kind = METRICS.get(name, ('counter',))[0]
+            if kind == 'gauge' and not include_gauges:
+                continue
+            key = self._key(name, labels)
+            if isinstance(value, list):
+                current = merged.setdefault(key, [0] * len(value))
+                merged[key] = [a + b for a, b in zip(current, value)]
+            else:
+                merged[key] = merged.get(key, 0) + value
+
+    def collect(self):
+        """Merge every worker's values, dropping gauges of dead workers"""
+        self.flush(force=True)
+        merged = {}
+        for path, pid in self._worker_files():
+            rows = self._read(path)
+            if rows is not None:
+                self._merge(merged, rows, include_gauges=pid is not None and pid_alive(pid))
+        return merged
+
+    def retire_dead_workers(self):
+        """Fold the counters and histograms of exited workers into the
+        retired file and delete their files; returns how many were folded.
+
+        Only one process may run this at a time: gunicorn's master does,
+        from its child_exit hook.
+        """
+        dead = [path for path, pid in self._worker_files() if pid is not None and not pid_alive(pid)]
+        if not dead:
+            return 0
+        retired_path = os.path.join(self.directory, self.RETIRED_FILE)
+        merged = {}
+        self._merge(merged, self._read(retired_path) or [])
+        for path in dead:
+            self._merge(merged, self._read(path) or [], include_gauges=False)
+        self._write(retired_path, [[name, dict(labels), value] for (name, labels), value in merged.items()])
+        for path in dead:
+            os.remove(path)
+        return len(dead)
+
+    def render(self):
+        """Prometheus text exposition format"""
+        merged = self.collect()
+        lines = []
+        for name, (kind, help_text) in METRICS.items():
+            series = sorted((labels, value) for (metric, labels), value in merged.items() if metric == name)
+            if not series:
+                continue
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in series:
+                if kind == 'histogram':
+                    cumulative = 0
+                    for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), value[:-1]):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{format_labels(labels + (("le", str(bound)),))} {cumulative}')
+                    lines.append(f'{name}_sum{format_labels(labels)} {value[-1]}')
+                    lines.append(f'{name}_count{format_labels(labels)} {cumulative}')
+                else:
+                    lines.append(f'{name}{format_labels(labels)} {value}')
+        return '\n'.join(lines) + '\n'
+
+def pid_alive(pid):
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    pairs = []
+    for key, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{key}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+metrics = MetricsRegistry()
+
+def record_pool_stats():
+    pool = db.engine.pool
+    for name, attr in (('db_pool_checked_out', 'checkedout'), ('db_pool_size', 'size'), ('db_pool_overflow', 'overflow')):
+        if hasattr(pool, attr):
+            metrics.set(name, getattr(pool, attr)())
+
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    g.in_flight = True
+    metrics.inc('http_requests_in_flight')
+
+def observe_request(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.observe(
+            'http_request_duration_seconds',
+            time.perf_counter() - started,
+            route=route,
+            method=request.method,
+            status=str(response.status_code)
+        )
+    return response
+
+def end_request(exc):
+    if g.pop('in_flight', False):
+        metrics.inc('http_requests_in_flight', -1)
+    record_pool_stats()
+    metrics.flush()
+
+def scrape():
+    record_pool_stats()
+    return metrics.render()
+
+def init_metrics(app):
+    metrics.directory = app.config['METRICS_DIR']
+    metrics.flush_interval = app.config['METRICS_FLUSH_SECONDS']
+    app.before_request(start_request_timer)
+    app.after_request(observe_request)
+    app.teardown_request(end_request)
+
+atexit.register(metrics.flush, force=True)
@@ -2,10 +2,7 @@ from datetime import datetime
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 from extensions import *
-
-@login_manager.user_loader
-def load_user(user_id):
-    return User.query.get(int(user_id))
+from hashing import password_hasher
 
 class User(db.Model, UserMixin):
     """Base user model that other user types inherit from"""
@@ -20,7 +17,7 @@ class User(db.Model, UserMixin):
     is_blocked = db.Column(db.Boolean, default=False)
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = generate_password_hash(password, password_hasher.method)
         
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
@@ -42,8 +39,11 @@ class Professional(User):
     is_available = db.Column(db.Boolean, default=True)
     date_created = db.Column(db.DateTime, default=datetime.utcnow)
     rating = db.Column(db.Float, default=3)
+    # Running review aggregates so rating updates don't rescan reviews
+    review_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_sum = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     contact_number = db.Column(db.String(13))
-    verification_status = db.Column(db.String(20), default='pending')  # pending, verified, rejected
+    verification_status = db.Column(db.String(20), default='pending', index=True)  # pending, verified, rejected
     verification_date = db.Column(db.DateTime)
     verified_by = db.Column(db.Integer, db.ForeignKey('users.id'))
 
@@ -63,7 +63,7 @@ class ProfessionalDocument(db.Model):
     __tablename__ = 'professional_documents'
     
     id = db.Column(db.Integer, primary_key=True)
-    professional_id = db.Column(db.Integer, db.ForeignKey('professionals.id'))
+    professional_id = db.Column(db.Integer, db.ForeignKey('professionals.id'), index=True)
     document_type = db.Column(db.String(10),default='.pdf')
     document_url = db.Column(db.String(255))
     is_verified = db.Column(db.Boolean, default=False)
@@ -85,6 +85,11 @@ class Address(db.Model):
     is_default = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        # Default address lookups by user
+        db.Index('ix_addresses_user_default', 'user_id', 'is_default'),
+    )
+
 class ServiceCategory(db.Model):
     """Model for service categories"""
     __tablename__ = 'service_categories'
@@ -132,6 +137,8 @@ class ServiceLocation(db.Model):
     # Add unique constraint to prevent duplicate pin codes for same service
     __table_args__ = (
         db.UniqueConstraint('service_id', 'pin_code', name='unique_service_location'),
+        # Covers the pincode -> services lookup without touching the table
+        db.Index('ix_service_locations_pin_active_service', 'pin_code', 'is_active', 'service_id'),
     )
 
 class ServiceRequest(db.Model):
@@ -145,7 +152,10 @@ class ServiceRequest(db.Model):
     request_date = db.Column(db.DateTime, default=datetime.utcnow)
     quantity = db.Column(db.Integer, default=1)
     scheduled_date = db.Column(db.DateTime, nullable=False)
+    scheduled_end = db.Column(db.DateTime)  # scheduled_date + time_required x quantity
     completion_date = db.Column(db.DateTime)
+    accepted_at = db.Column(db.DateTime)
+    status_changed_at = db.Column(db.DateTime)
     status = db.Column(db.String(20), default='requested')
     remarks = db.Column(db.Text)
     location_pin = db.Column(db.String(10))
@@ -161,6 +171,31 @@ class ServiceRequest(db.Model):
             'scheduled_date',
             name='unique_professional_scheduling'
         ),
+        # Open requests waiting for a professional, by area
+        db.Index(
+            'ix_service_requests_open', 'service_id', 'location_pin', 'status',
+            sqlite_where=professional_id.is_(None),
+            postgresql_where=professional_id.is_(None)
+        ),
+        db.Index('ix_service_requests_professional_status', 'professional_id', 'status'),
+        db.Index('ix_service_requests_user_status', 'user_id', 'status'),
+        # Keyset pagination for the admin listing, optionally by status
+        db.Index('ix_service_requests_request_date', 'request_date', 'id'),
+        db.Index('ix_service_requests_status_request_date', 'status', 'request_date', 'id'),
+    )
+
+class CheckoutKey(db.Model):
+    """Idempotency keys for checkout so client retries don't book twice"""
+    __tablename__ = 'checkout_keys'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    key = db.Column(db.String(64), nullable=False)
+    request_ids = db.Column(db.Text)  # created service request ids seperated by comma
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'key', name='unique_checkout_key'),
     )
 
 class Review(db.Model):
@@ -168,8 +203,8 @@ class Review(db.Model):
     __tablename__ = 'reviews'
     
     id = db.Column(db.Integer, primary_key=True)
-    service_request_id = db.Column(db.Integer, db.ForeignKey('service_requests.id'), nullable=False)
-    professional_id = db.Column(db.Integer, db.ForeignKey('professionals.id'), nullable=False)
+    service_request_id = db.Column(db.Integer, db.ForeignKey('service_requests.id'), nullable=False, index=True)
+    professional_id = db.Column(db.Integer, db.ForeignKey('professionals.id'), nullable=False, index=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     rating = db.Column(db.Integer, nullable=False)
     comment = db.Column(db.Text)
@@ -187,6 +222,10 @@ class Notification(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     is_read = db.Column(db.Boolean, default=False)
 
+    __table_args__ = (
+        db.Index('ix_notifications_recipient_unread', 'recipient_id', 'is_read', 'created_at'),
+    )
+
 class UserServiceAction(db.Model):
     """Model to track user actions: cart, wishlist, or immediate purchases."""
     __tablename__ = 'user_service_actions'
@@ -205,4 +244,38 @@ class UserServiceAction(db.Model):
     # Ensure unique entries per user-service-action type (e.g., avoid duplicate cart items)
     __table_args__ = (
         db.UniqueConstraint('user_id', 'service_id', 'action_type', name='unique_user_service_action'),
-    )
\ No newline at end of file
+        # Cart/wishlist listings filter on user and action type only
+        db.Index('ix_user_service_actions_user_action', 'user_id', 'action_type'),
+    )
+
+class DailyRollup(db.Model):
+    """Request activity of one day, summed for one key of a dimension"""
+    __tablename__ = 'daily_rollups'
+
+    day = db.Column(db.Date, primary_key=True)
+    dimension = db.Column(db.String(20), primary_key=True)  # all, service, category, pincode, professional
+    key = db.Column(db.String(50), primary_key=True)  # id or pincode, '' for all
+    requested = db.Column(db.Integer, nullable=False, default=0)
+    accepted = db.Column(db.Integer, nullable=False, default=0)
+    rejected = db.Column(db.Integer, nullable=False, default=0)
+    cancelled = db.Column(db.Integer, nullable=False, default=0)
+    completed = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0)  # total_amount of completed requests
+    rating_sum = db.Column(db.Integer, nullable=False, default=0)
+    rating_count = db.Column(db.Integer, nullable=False, default=0)
+    accept_seconds = db.Column(db.Float, nullable=False, default=0)  # request to accept, summed
+    complete_seconds = db.Column(db.Float, nullable=False, default=0)  # request to completion, summed
+
+    __table_args__ = (
+        db.Index('ix_daily_rollups_dimension_day', 'dimension', 'day'),
+    )
+
+class StoredFile(db.Model):
+    """Reference count for an uploaded blob stored under its content hash"""
+    __tablename__ = 'stored_files'
+
+    key = db.Column(db.String(255), primary_key=True)  # path under UPLOAD_FOLDER
+    sha256 = db.Column(db.String(64), nullable=False)
+    size = db.Column(db.Integer, nullable=False)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
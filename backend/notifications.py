@@ -0,0 +1,142 @@
+import atexit
+import os
+import queue
+import threading
+from datetime import datetime
+from models import *
+
+class NotificationQueue:
+    """Collects notifications and writes them in batches on a background thread.
+
+    Request handlers only put dicts (or request ids to fan out) on an
+    in-process queue. The writer thread drains it every flush_interval
+    seconds, or as soon as batch_size items are waiting, and writes the
+    whole batch in one transaction: one executemany INSERT for direct
+    notifications and one INSERT ... SELECT that fans new requests out to
+    the professionals they were offered to.
+
+    Items still queued when the process dies are lost; these are
+    convenience messages, the service requests themselves are already
+    committed.
+    """
+
+    def __init__(self, batch_size=500, flush_interval=0.5):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.app = None
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._thread_pid = None
+
+    def notify(self, recipient_id, kind, message, service_request_id=None):
+        if recipient_id is None:
+            return
+        self._put(('row', {
+            'recipient_id': recipient_id,
+            'service_request_id': service_request_id,
+            'type': kind,
+            'message': message,
+            'created_at': datetime.utcnow(),
+            'is_read': False
+        }))
+
+    def fan_out(self, offers):
+        """Tell professionals about requests offered to them.
+
+        offers maps request id -> professional ids, as dispatch_requests
+        returns it.
+        """
+        for request_id, professional_ids in offers.items():
+            for professional_id in professional_ids:
+                self._put(('fan_out', (request_id, professional_id)))
+
+    def _put(self, item):
+        self._queue.put(item)
+        self._ensure_writer()
+
+    def _ensure_writer(self):
+        # Started on first use so each forked worker gets its own thread
+        with self._lock:
+            if self._thread is None or self._thread_pid != os.getpid() or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='notifications', daemon=True)
+                self._thread_pid = os.getpid()
+                self._thread.start()
+
+    def _take_batch(self, timeout):
+        items = []
+        try:
+            items.append(self._queue.get(timeout=timeout))
+            while len(items) < self.batch_size:
+                items.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        return items
+
+    def _run(self):
+        while True:
+            items = self._take_batch(self.flush_interval)
+            if items:
+                try:
+                    self._write(items)
+                except Exception as e:
+                    print(f"Error writing {len(items)} notifications: {e}")
+
+    def _write(self, items):
+        rows = [payload for kind, payload in items if kind == 'row']
+        offers = sorted({payload for kind, payload in items if kind == 'fan_out'})
+        with self.app.app_context():
+            try:
+                if rows:
+                    db.session.execute(db.insert(Notification), rows)
+                if offers:
+                    db.session.execute(fan_out_statement(offers))
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+
+    def flush(self):
+        """Write everything queued so far on the calling thread"""
+        if self.app is None:
+            return
+        while True:
+            items = self._take_batch(0)
+            if not items:
+                return
+            self._write(items)
+
+notification_queue = NotificationQueue()
+
+def fan_out_statement(offers):
+    """INSERT ... SELECT of a 'new_request' notification per (request id,
+    professional id) offer whose request is still open"""
+    candidates = db.select(
+        ServiceRequest.id,
+        User.id,
+        db.literal('new_request'),
+        db.literal('New request: ') + Service.name,
+        db.literal(datetime.utcnow()),
+        db.literal(False)
+    ).select_from(ServiceRequest).join(
+        Service, Service.id == ServiceRequest.service_id
+    ).join(
+        User, db.tuple_(ServiceRequest.id, User.id).in_(offers)
+    ).where(
+        ServiceRequest.status == 'pending',
+        ServiceRequest.professional_id.is_(None),
+        User.is_blocked.isnot(True)
+    )
+    return db.insert(Notification).from_select(
+        ['service_request_id', 'recipient_id', 'type', 'message', 'created_at', 'is_read'],
+        candidates
+    )
+
+def init_notifications(app):
+    # Write what a previous app queued into its own database first
+    notification_queue.flush()
+    notification_queue.app = app
+    notification_queue.batch_size = app.config['NOTIFICATION_BATCH_SIZE']
+    notification_queue.flush_interval = app.config['NOTIFICATION_FLUSH_SECONDS']
+
+atexit.register(notification_queue.flush)
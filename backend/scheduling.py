@@ -0,0 +1,262 @@
+import bisect
+import math
+import threading
+import time
+from datetime import timedelta
+from models import *
+from dispatch import load_professionals
+
+# A professional's calendar holds requests in these states
+BOOKED_STATUSES = ('accepted', 'pending')
+
+def booking_end(scheduled_date, time_required, quantity, default_minutes=60):
+    """When a booking ends: time_required minutes per unit of quantity"""
+    minutes = (time_required or default_minutes) * max(quantity or 1, 1)
+    return scheduled_date + timedelta(minutes=minutes)
+
+def overlapping(model, start, end):
+    """SQL condition: model's booking overlaps [start, end).
+
+    Rows without a scheduled_end (not backfilled yet) only clash on the
+    exact start, as before scheduled_end existed.
+    """
+    return db.or_(
+        model.scheduled_date == start,
+        db.and_(model.scheduled_date < end, model.scheduled_end > start)
+    )
+
+def find_overlapping_booking(professional_id, start, end, exclude_id=None):
+    """The professional's booked request overlapping [start, end), if any"""
+    query = ServiceRequest.query.filter(
+        ServiceRequest.professional_id == professional_id,
+        ServiceRequest.status.in_(BOOKED_STATUSES),
+        overlapping(ServiceRequest, start, end)
+    )
+    if exclude_id is not None:
+        query = query.filter(ServiceRequest.id != exclude_id)
+    return query.order_by(ServiceRequest.scheduled_date).first()
+
+class Calendar:
+    """One professional's bookings as half-open intervals sorted by start.
+
+    reach[i] is the latest end among the first i+1 intervals, so whether
+    [start, end) overlaps anything is one bisect plus one lookup, even if
+    older bookings overlap each other.
+    """
+
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+        self.request_ids = []
+        self.reach = []
+
+    def __len__(self):
+        return len(self.starts)
+
+    def _recompute_reach(self, i):
+        previous = self.reach[i - 1] if i else None
+        for j in range(i, len(self.starts)):
+            previous = self.ends[j] if previous is None else max(previous, self.ends[j])
+            self.reach[j] = previous
+
+    def add(self, start, end, request_id):
+        i = bisect.bisect_right(self.starts, start)
+        self.starts.insert(i, start)
+        self.ends.insert(i, end)
+        self.request_ids.insert(i, request_id)
+        self.reach.insert(i, end)
+        self._recompute_reach(i)
+
+    def remove(self, start, request_id):
+        i = bisect.bisect_left(self.starts, start)
+        while i < len(self.starts) and self.starts[i] == start:
+            if self.request_ids[i] == request_id:
+                for column in (self.starts, self.ends, self.request_ids, self.reach):
+                    del column[i]
+                self._recompute_reach(i)
+                return True
+            i += 1
+        return False
+
+    def busy_until(self, start, end):
+        """None if [start, end) is free, else the time every overlapping booking is over"""
+        i = bisect.bisect_left(self.starts, end)
+        if i and self.reach[i - 1] > start:
+            return self.reach[i - 1]
+        return None
+
+    def next_free(self, start, duration, limit=None):
+        """Earliest time at or after start with duration free, or the first
+        busy_until at or past limit if nothing is free before it"""
+        while limit is None or start < limit:
+            until = self.busy_until(start, start + duration)
+            if until is None:
+                return start
+            start = until
+        return start
+
+class ScheduleIndex:
+    """In-memory calendars of every professional, grouped by service area.
+
+    Answers "who is free for service X in pincode Y at time T" and slot
+    suggestions from the calendars instead of querying bookings per
+    professional. Like the dispatch index it is rebuilt once older than
+    refresh_interval seconds; the accept UPDATE still checks overlaps in
+    the database, so a stale index can only suggest, never double-book.
+    """
+
+    def __init__(self, default_minutes=60, slot_minutes=30, horizon_days=14, refresh_interval=30):
+        self.default_minutes = default_minutes
+        self.slot_minutes = slot_minutes
+        self.horizon_days = horizon_days
+        self.refresh_interval = refresh_interval
+        self._lock = threading.RLock()
+        self._loaded_at = None
+        self._pros = {}           # professional_id -> profile dict (see load_professionals)
+        self._pros_by_area = {}   # (service_id, pincode) -> set of professional ids
+        self._calendars = {}      # professional_id -> Calendar
+        self._bookings = {}       # request_id -> (professional_id, start)
+
+    def load(self, professionals, bookings):
+        """Replace the whole index.
+
+        bookings: (request_id, professional_id, start, end) tuples.
+        """
+        with self._lock:
+            self._pros = {}
+            self._pros_by_area = {}
+            self._calendars = {}
+            self._bookings = {}
+            for pro in professionals:
+                self._pros[pro['id']] = pro
+                self._pros_by_area.setdefault((pro['service_id'], pro['pincode']), set()).add(pro['id'])
+            # In start order every insert is an append
+            for request_id, professional_id, start, end in sorted(bookings, key=lambda booking: booking[2]):
+                self._book(professional_id, request_id, start, end)
+            self._loaded_at = time.monotonic()
+
+    def _book(self, professional_id, request_id, start, end):
+        self._calendars.setdefault(professional_id, Calendar()).add(start, end, request_id)
+        self._bookings[request_id] = (professional_id, start)
+
+    def book(self, professional_id, request_id, start, end):
+        with self._lock:
+            self.release(request_id)
+            self._book(professional_id, request_id, start, end)
+
+    def release(self, request_id):
+        with self._lock:
+            booking = self._bookings.pop(request_id, None)
+            if booking is not None:
+                professional_id, start = booking
+                self._calendars[professional_id].remove(start, request_id)
+
+    def _candidates(self, service_id, pincode):
+        return [
+            pro_id for pro_id in self._pros_by_area.get((service_id, pincode), ())
+            if self._pros[pro_id]['is_available']
+        ]
+
+    def free_professionals(self, service_id, pincode, start, end):
+        """Available professionals of an area with nothing booked in [start, end),
+        least loaded and best rated first"""
+        with self._lock:
+            free = [
+                pro_id for pro_id in self._candidates(service_id, pincode)
+                if pro_id not in self._calendars or self._calendars[pro_id].busy_until(start, end) is None
+            ]
+            free.sort(key=lambda pro_id: (self._pros[pro_id]['load'], -(self._pros[pro_id]['rating'] or 0), pro_id))
+            return free
+
+    def _round_up(self, moment):
+        """moment rounded up to a slot boundary (slots are counted from midnight)"""
+        midnight = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+        step = timedelta(minutes=self.slot_minutes)
+        return midnight + math.ceil((moment - midnight) / step) * step
+
+    def suggest_slots(self, service_id, pincode, after, duration, count=5):
+        """Up to count slot starts at or after after, on slot_minutes
+        boundaries within horizon_days, when someone in the area is free.
+
+        Returns (start, free professional count) pairs. Each step either
+        yields a slot or jumps straight to the earliest time any candidate
+        becomes free. A professional's next free time stays valid until the
+        search passes it, so it is only looked up again after that.
+        """
+        with self._lock:
+            candidates = self._candidates(service_id, pincode)
+            calendars = [self._calendars.get(pro_id, Calendar()) for pro_id in candidates]
+            horizon = after + timedelta(days=self.horizon_days)
+            slots = []
+            start = self._round_up(after)
+            next_free = [start] * len(calendars)
+            while calendars and len(slots) < count and start < horizon:
+                for i, calendar in enumerate(calendars):
+                    if next_free[i] <= start:
+                        next_free[i] = calendar.next_free(start, duration, horizon)
+                free = sum(1 for moment in next_free if moment == start)
+                if free:
+                    slots.append((start, free))
+                    start += timedelta(minutes=self.slot_minutes)
+                else:
+                    start = self._round_up(min(next_free))
+            return slots
+
+    def is_stale(self):
+        return self._loaded_at is None or time.monotonic() - self._loaded_at > self.refresh_interval
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+schedule_index = ScheduleIndex()
+
+def init_scheduling(app):
+    schedule_index.default_minutes = app.config['SCHEDULE_DEFAULT_MINUTES']
+    schedule_index.slot_minutes = app.config['SCHEDULE_SLOT_MINUTES']
+    schedule_index.horizon_days = app.config['SCHEDULE_HORIZON_DAYS']
+    schedule_index.refresh_interval = app.config['SCHEDULE_REFRESH_SECONDS']
+    schedule_index.invalidate()
+
+def load_bookings():
+    """(request_id, professional_id, start, end) for every booked request"""
+    rows = db.session.query(
+        ServiceRequest.id, ServiceRequest.professional_id, ServiceRequest.scheduled_date,
+        ServiceRequest.scheduled_end, ServiceRequest.quantity, Service.time_required
+    ).join(
+        Service, Service.id == ServiceRequest.service_id
+    ).filter(
+        ServiceRequest.professional_id.isnot(None),
+        ServiceRequest.status.in_(BOOKED_STATUSES)
+    )
+    return [
+        (request_id, professional_id, start,
+         end or booking_end(start, time_required, quantity, schedule_index.default_minutes))
+        for request_id, professional_id, start, end, quantity, time_required in rows
+    ]
+
+def get_schedule_index():
+    """Return schedule_index, rebuilding it from the database if stale"""
+    if schedule_index.is_stale():
+        with schedule_index._lock:
+            if schedule_index.is_stale():
+                schedule_index.load(load_professionals(), load_bookings())
+    return schedule_index
+
+def fill_scheduled_ends():
+    """Set scheduled_end on requests created before it existed; returns how many"""
+    rows = db.session.query(
+        ServiceRequest.id, ServiceRequest.scheduled_date, ServiceRequest.quantity, Service.time_required
+    ).join(
+        Service, Service.id == ServiceRequest.service_id
+    ).filter(
+        ServiceRequest.scheduled_end.is_(None),
+        ServiceRequest.scheduled_date.isnot(None)
+    ).all()
+    if rows:
+        db.session.execute(db.update(ServiceRequest), [
+            {'id': request_id, 'scheduled_end': booking_end(start, time_required, quantity, schedule_index.default_minutes)}
+            for request_id, start, quantity, time_required in rows
+        ])
+        db.session.commit()
+    return len(rows)
@@ -0,0 +1,242 @@
+import hashlib
+import mimetypes
+import os
+import re
+import shutil
+import tempfile
+from flask import Request, abort, current_app, g, request, send_from_directory
+from sqlalchemy import event
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.security import safe_join
+from models import *
+
+CHUNK_SIZE = 64 * 1024
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+# Names that are never reused for other content: sha256 names (and their
+# variants), plus the random names uploads got before content addressing
+_content_hash_name = re.compile(r'^[0-9a-f]{64}(\.|$)')
+_random_name = re.compile(
+    r'^(user_\d+_[0-9a-f]{16}\.|[0-9a-f]{16}_|[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}_)'
+)
+
+# Functions called with a key after its blob is deleted (e.g. to drop derived files)
+release_callbacks = []
+
+class LocalStorage:
+    """Blob store in a local directory.
+
+    Keys are '/'-separated paths under root. The methods are the ones an
+    object store offers (put, open, exists, delete), so a bucket-backed
+    class with the same methods can replace this one.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, key):
+        return os.path.join(self.root, *key.split('/'))
+
+    def put(self, key, source_path):
+        """Move a finished local file into place (atomic on one filesystem)"""
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(source_path, path)
+
+    def open(self, key):
+        return open(self.path(key), 'rb')
+
+    def exists(self, key):
+        return os.path.exists(self.path(key))
+
+    def delete(self, key):
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+class HashingSpool:
+    """Temp file that hashes and counts bytes as the upload is written to it.
+
+    Werkzeug's form parser writes each uploaded file into one of these
+    chunk by chunk, so the sha256 is ready when parsing ends and a body
+    over `limit` is rejected as soon as it crosses the limit.
+    """
+
+    def __init__(self, directory, limit):
+        os.makedirs(directory, exist_ok=True)
+        self._file = tempfile.NamedTemporaryFile(dir=directory, delete=False)
+        self.name = self._file.name
+        self.limit = limit
+        self.size = 0
+        self.sha256 = hashlib.sha256()
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.limit:
+            self.discard()
+            raise RequestEntityTooLarge(f'Upload exceeds the {self.limit / (1024 * 1024):g}MB limit')
+        self.sha256.update(data)
+        return self._file.write(data)
+
+    def discard(self):
+        self._file.close()
+        try:
+            os.remove(self.name)
+        except FileNotFoundError:
+            pass
+
+    def __getattr__(self, name):
+        # read, seek, tell, close, ... for werkzeug's FileStorage
+        return getattr(self._file, name)
+
+class UploadRequest(Request):
+    """Request that spools uploaded files through HashingSpool"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        spool = HashingSpool(current_app.config['UPLOAD_TMP_FOLDER'], current_app.config['MAX_UPLOAD_BYTES'])
+        g.setdefault('upload_spools', []).append(spool)
+        return spool
+
+storage = LocalStorage('instance/uploads')
+
+def spool_upload(file):
+    """The HashingSpool holding an uploaded file's bytes"""
+    if isinstance(file.stream, HashingSpool):
+        return file.stream
+    # Files that did not come through UploadRequest's parser
+    spool = HashingSpool(current_app.config['UPLOAD_TMP_FOLDER'], current_app.config['MAX_UPLOAD_BYTES'])
+    g.setdefault('upload_spools', []).append(spool)
+    shutil.copyfileobj(file.stream, spool, CHUNK_SIZE)
+    return spool
+
+def store_upload(file, folder, max_bytes):
+    """Store an uploaded file by content and take a reference to it.
+
+    The stored name is the sha256 of the content plus the original
+    extension, so identical uploads share one blob in folder. Returns the
+    stored filename; the reference is committed with the caller's
+    transaction. Raises RequestEntityTooLarge over max_bytes.
+    """
+    spool = spool_upload(file)
+    if spool.size > max_bytes:
+        raise RequestEntityTooLarge(f'File exceeds the {max_bytes / (1024 * 1024):g}MB limit')
+
+    digest = spool.sha256.hexdigest()
+    ext = file.filename.rsplit('.', 1)[1].lower() if '.' in file.filename else ''
+    filename = f'{digest}.{ext}' if ext else digest
+    key = f'{folder}/{filename}' if folder else filename
+
+    # Always move the new copy into place: it costs a rename and puts back a
+    # blob that went missing
+    spool.close()
+    if not storage.exists(key):
+        # Deleted again if the transaction ends without committing
+        db.session.info.setdefault('stored_uploads', set()).add(key)
+    storage.put(key, spool.name)
+
+    updated = db.session.execute(
+        db.update(StoredFile).where(StoredFile.key == key).values(ref_count=StoredFile.ref_count + 1)
+    ).rowcount
+    if not updated:
+        db.session.add(StoredFile(key=key, sha256=digest, size=spool.size, ref_count=1))
+    return filename
+
+def release_upload(folder, filename):
+    """Drop a reference; the blob is deleted after commit once none are left"""
+    key = f'{folder}/{filename}' if folder else filename
+    remaining = db.session.execute(
+        db.update(StoredFile)
+        .where(StoredFile.key == key, StoredFile.ref_count > 0)
+        .values(ref_count=StoredFile.ref_count - 1)
+        .returning(StoredFile.ref_count)
+    ).scalar()
+    if remaining == 0:
+        db.session.execute(db.delete(StoredFile).where(StoredFile.key == key, StoredFile.ref_count == 0))
+    elif remaining is not None:
+        return
+    # Last reference, or a file stored before reference counting
+    db.session.info.setdefault('released_uploads', set()).add(key)
+
+def delete_blob(key):
+    storage.delete(key)
+    for callback in release_callbacks:
+        callback(key)
+
+def delete_released_uploads(session):
+    session.info.pop('stored_uploads', None)
+    for key in session.info.pop('released_uploads', ()):
+        delete_blob(key)
+
+def forget_released_uploads(session):
+    session.info.pop('released_uploads', None)
+
+def delete_uncommitted_uploads(session, transaction):
+    """Delete blobs stored by a transaction that was rolled back or closed
+    without a commit, unless another request committed a reference since"""
+    if transaction.parent is not None:
+        return
+    keys = session.info.pop('stored_uploads', None)
+    if not keys:
+        return
+    with db.engine.connect() as conn:
+        referenced = set(conn.scalars(db.select(StoredFile.key).where(StoredFile.key.in_(keys))))
+    for key in keys - referenced:
+        delete_blob(key)
+
+def discard_spools(exc):
+    # Stored spools were already moved away; this removes the rest
+    for spool in g.pop('upload_spools', ()):
+        spool.discard()
+
+def send_upload(key, private=False):
+    """Serve a stored file with caching and validators chosen from its name.
+
+    Content-hash names are their own strong ETag, so a matching
+    If-None-Match gets a 304 without touching the disk, and they are
+    cached as immutable, like other never-reused names. Other files get
+    werkzeug's ETag and must be revalidated. Byte ranges are answered by
+    werkzeug, or by the front proxy when UPLOAD_SENDFILE hands the file off
+    (X-Sendfile, or X-Accel-Redirect under X_ACCEL_REDIRECT_PREFIX).
+    private marks responses only the requesting browser may cache.
+    """
+    filename = key.rsplit('/', 1)[-1]
+    etag = filename if _content_hash_name.match(filename) else None
+    immutable = etag is not None or bool(_random_name.match(filename))
+
+    if etag is not None and etag in request.if_none_match:
+        response = current_app.response_class(status=304)
+        response.set_etag(etag)
+    elif current_app.config['UPLOAD_SENDFILE'] == 'x-accel-redirect':
+        path = safe_join(storage.root, *key.split('/'))
+        if path is None or not os.path.isfile(path):
+            abort(404)
+        response = current_app.response_class(mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+        response.headers['X-Accel-Redirect'] = current_app.config['X_ACCEL_REDIRECT_PREFIX'] + key
+        if etag is not None:
+            response.set_etag(etag)
+    else:
+        # Flask adds X-Sendfile itself when USE_X_SENDFILE is on
+        response = send_from_directory(storage.root, key, etag=etag or True)
+
+    if private:
+        response.cache_control.private = True
+    else:
+        response.cache_control.public = True
+    if immutable:
+        response.cache_control.no_cache = None
+        response.cache_control.max_age = IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response
+
+def init_storage(app):
+    storage.root = app.config['UPLOAD_FOLDER']
+    app.request_class = UploadRequest
+    app.teardown_request(discard_spools)
+    with app.app_context():
+        if not event.contains(db.session, 'after_commit', delete_released_uploads):
+            event.listen(db.session, 'after_commit', delete_released_uploads)
+            event.listen(db.session, 'after_rollback', forget_released_uploads)
+            event.listen(db.session, 'after_transaction_end', delete_uncommitted_uploads)
@@ -0,0 +1,132 @@
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from main import create_app
+from models import *
+
+PASSWORD = 'password1'
+
+def make_config(tmp_path, **overrides):
+    """A Config whose database, uploads and metrics all live under tmp_path"""
+    uploads = str(tmp_path / 'uploads')
+    values = {
+        'TESTING': True,
+        'SECRET_KEY': 'test',
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'test.db'}",
+        'UPLOAD_FOLDER': uploads,
+        'PROFILE_PIC_FOLDER': os.path.join(uploads, 'profile_pictures'),
+        'SERVICE_UPLOAD_FOLDER': os.path.join(uploads, 'services'),
+        'UPLOAD_TMP_FOLDER': os.path.join(uploads, '.tmp'),
+        'METRICS_DIR': str(tmp_path / 'metrics'),
+        'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:1000',  # fast; tests don't measure hashing
+        'PASSWORD_HASH_WORKERS': 0,
+        'SQL_ENFORCE_QUERY_BUDGETS': True,
+    }
+    values.update(overrides)
+    return type('TestConfig', (Config,), values)
+
+@pytest.fixture
+def make_app(tmp_path):
+    """Build an app on a fresh database; keyword arguments override config"""
+    def build(**overrides):
+        app = create_app(make_config(tmp_path, **overrides))
+        with app.app_context():
+            db.create_all()
+        return app
+    return build
+
+@pytest.fixture
+def app(make_app):
+    return make_app()
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture
+def count_queries(app):
+    """count_queries(fn) -> (fn's result, statements it sent to the database)"""
+    with app.app_context():
+        engine = db.engine
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    def run(fn):
+        statements.clear()
+        event.listen(engine, 'before_cursor_execute', record)
+        try:
+            result = fn()
+        finally:
+            event.remove(engine, 'before_cursor_execute', record)
+        return result, len(statements)
+    return run
+
+def login(client, email):
+    response = client.post('/api/signin', json={'email': email, 'password': PASSWORD})
+    assert response.status_code == 200, response.get_json()
+    return response
+
+def add_user(email, role='user', **fields):
+    model = Professional if role == 'professional' else User
+    user = model(username=email.split('@')[0], email=email, role=role, **fields)
+    user.set_password(PASSWORD)
+    db.session.add(user)
+    db.session.flush()
+    db.session.add(Address(
+        user_id=user.id, address_line1='1 Main St', city='Chennai', state='TN',
+        pincode='600001', phone_number='9000000000', is_default=True
+    ))
+    return user
+
+def add_service(name='Cleaning', pincodes=('600001',), time_required=60):
+    service = Service(
+        name=name, description=name, base_price=100, time_required=time_required,
+        service_area=','.join(pincodes)
+    )
+    db.session.add(service)
+    db.session.flush()
+    db.session.add_all([ServiceLocation(service_id=service.id, pin_code=pin) for pin in pincodes])
+    return service
+
+def add_requests(count, service, user, professional=None, status='pending', start=datetime(2030, 1, 1)):
+    """count requests for user, an hour apart, with a review on completed ones"""
+    rows = []
+    for i in range(count):
+        row = ServiceRequest(
+            service_id=service.id, user_id=user.id,
+            professional_id=professional.id if professional else None,
+            scheduled_date=start + timedelta(hours=i), request_date=start - timedelta(days=1, minutes=i),
+            status=status, location_pin='600001', total_amount=service.base_price, quantity=1
+        )
+        db.session.add(row)
+        db.session.flush()
+        if status == 'completed':
+            db.session.add(Review(
+                service_request_id=row.id, professional_id=professional.id, user_id=user.id,
+                rating=4, comment='ok'
+            ))
+        rows.append(row)
+    return rows
+
+def buy_now(client, service_id, address_id, scheduled_date=datetime(2031, 1, 1, 10)):
+    """Book one service through the checkout endpoint; returns the new request id"""
+    response = client.post('/api/service-requests', json={
+        'orderType': 'buy_now', 'serviceId': service_id, 'addressId': address_id,
+        'scheduledDate': scheduled_date.isoformat()
+    })
+    assert response.status_code == 201, response.get_json()
+    return response.get_json()['requests'][0]
+
+def default_address_id(email):
+    return db.session.query(Address.id).join(User, User.id == Address.user_id).filter(
+        User.email == email, Address.is_default == True
+    ).scalar()
@@ -0,0 +1,39 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from conftest import add_requests, add_service, add_user, login
+from models import *
+
+PROFESSIONALS = 8
+
+def test_one_professional_wins_an_accept_race(app):
+    with app.app_context():
+        service = add_service()
+        user = add_user('user@test')
+        for i in range(PROFESSIONALS):
+            add_user(f'pro{i}@test', role='professional', service_type=service.id, is_verified=True)
+        row, = add_requests(1, service, user)
+        db.session.commit()
+        request_id = row.id
+
+    clients = []
+    for i in range(PROFESSIONALS):
+        client = app.test_client()
+        login(client, f'pro{i}@test')
+        clients.append(client)
+
+    start = threading.Barrier(PROFESSIONALS)
+
+    def accept(client):
+        start.wait()
+        response = client.patch(f'/api/professional/service-requests/{request_id}', json={'action': 'accept'})
+        return response.status_code
+
+    with ThreadPoolExecutor(PROFESSIONALS) as pool:
+        statuses = sorted(pool.map(accept, clients))
+
+    assert statuses == [200] + [409] * (PROFESSIONALS - 1)
+    with app.app_context():
+        row = db.session.get(ServiceRequest, request_id)
+        assert row.status == 'accepted'
+        assert row.professional_id is not None
@@ -0,0 +1,49 @@
+import os
+import subprocess
+import sys
+
+from conftest import add_user, make_config
+from main import create_app
+from models import *
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def test_apps_get_their_own_config_and_database(tmp_path):
+    apps = []
+    for name, ttl in (('one', 10), ('two', 20)):
+        (tmp_path / name).mkdir()
+        app = create_app(make_config(tmp_path / name, CATALOG_CACHE_TTL=ttl))
+        with app.app_context():
+            db.create_all()
+        apps.append(app)
+    with apps[0].app_context():
+        add_user('only-in-one@test')
+        db.session.commit()
+
+    with apps[1].app_context():
+        assert User.query.count() == 0
+    with apps[0].app_context():
+        assert User.query.count() == 1
+    assert apps[0].config['CATALOG_CACHE_TTL'] == 10
+    assert apps[1].config['CATALOG_CACHE_TTL'] == 20
+    assert apps[0].url_map is not apps[1].url_map
+    assert 'api.signin' in {rule.endpoint for rule in apps[1].url_map.iter_rules()}
+
+def test_heavy_modules_are_imported_on_first_use(tmp_path):
+    script = (
+        "import sys\n"
+        "import main\n"
+        "assert 'api' not in sys.modules and 'models' not in sys.modules, 'main imports the routes'\n"
+        "app = main.create_app()\n"
+        "heavy = sorted(m for m in ('pandas', 'numpy', 'pyarrow', 'matplotlib') if m in sys.modules)\n"
+        "assert not heavy, heavy\n"
+    )
+    env = dict(
+        os.environ,
+        SECRET_KEY='test',
+        SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'cold.db'}",
+        METRICS_DIR=str(tmp_path / 'metrics'),
+        UPLOAD_FOLDER=str(tmp_path / 'uploads'),
+    )
+    result = subprocess.run([sys.executable, '-c', script], cwd=BACKEND, env=env, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
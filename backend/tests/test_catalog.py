@@ -0,0 +1,32 @@
+import pytest
+from conftest import add_service, add_user, login
+from catalog import LocalCacheBackend
+from models import *
+
+def test_set_keeps_values_without_a_ttl():
+    backend = LocalCacheBackend()
+    backend.set('key', 'value')
+    assert backend.get('key') == 'value'
+
+@pytest.mark.parametrize('ex', [0, -5])
+def test_set_with_no_time_left_does_not_cache(ex):
+    backend = LocalCacheBackend()
+    backend.set('key', 'old', ex=60)
+    backend.set('key', 'new', ex=ex)
+    assert backend.get('key') is None
+
+def test_zero_catalog_ttl_serves_fresh_catalogs(make_app):
+    app = make_app(CATALOG_CACHE_TTL=0)
+    with app.app_context():
+        add_service('Cleaning')
+        add_user('admin@test', role='admin')
+        db.session.commit()
+    client = app.test_client()
+    login(client, 'admin@test')
+    assert client.get('/api/services').get_json()[0]['name'] == 'Cleaning'
+
+    with app.app_context():
+        # Not through the API, so nothing invalidates the catalog
+        Service.query.update({'name': 'Deep cleaning'})
+        db.session.commit()
+    assert client.get('/api/services').get_json()[0]['name'] == 'Deep cleaning'
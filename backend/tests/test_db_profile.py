@@ -0,0 +1,34 @@
+from config import database_profile_options
+from models import *
+
+def pragma(app, name):
+    with app.app_context():
+        return db.session.execute(db.text(f'PRAGMA {name}')).scalar()
+
+def test_tuned_profile_applies_sqlite_pragmas_on_connect(make_app):
+    app = make_app(DB_PROFILE='tuned')
+    assert pragma(app, 'journal_mode') == 'wal'
+    assert pragma(app, 'synchronous') == 1  # NORMAL
+    assert pragma(app, 'busy_timeout') == 5000
+    assert pragma(app, 'cache_size') == -64 * 1024
+
+def test_default_profile_keeps_sqlite_defaults(make_app):
+    app = make_app(DB_PROFILE='default')
+    assert app.config['SQLITE_PRAGMAS'] == {}
+    assert pragma(app, 'journal_mode') == 'delete'
+
+def test_config_pragmas_override_the_profile(make_app):
+    app = make_app(DB_PROFILE='tuned', SQLITE_PRAGMAS={'busy_timeout': 250})
+    assert pragma(app, 'busy_timeout') == 250
+    assert pragma(app, 'journal_mode') == 'delete'
+
+def test_server_database_profile():
+    engine_options, pragmas = database_profile_options('postgresql://db/frenzy', 'tuned')
+    assert pragmas == {}
+    assert engine_options['pool_pre_ping'] is True
+    assert engine_options['pool_size'] == 10
+    assert engine_options['connect_args'] == {'options': '-c statement_timeout=30000'}
+
+def test_missing_uri_uses_server_defaults():
+    engine_options, pragmas = database_profile_options(None, 'tuned')
+    assert pragmas == {} and engine_options['connect_args'] == {}
@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta
+
+from conftest import add_service, add_user, buy_now, default_address_id, login
+from dispatch import DispatchIndex
+from models import *
+
+AREA = (1, '600001')
+
+def make_index(professionals, shortlist_size=2):
+    index = DispatchIndex(shortlist_size=shortlist_size)
+    index.load([
+        {'id': pro_id, 'service_id': AREA[0], 'pincode': AREA[1], 'rating': rating,
+         'is_available': is_available, 'load': load}
+        for pro_id, rating, is_available, load in professionals
+    ], [])
+    return index
+
+def offer(request_id):
+    return {'id': request_id}
+
+def test_unavailable_and_busy_professionals_rank_last():
+    index = make_index([(1, 5, False, 0), (2, 5, True, 3), (3, 3, True, 0), (4, 4, True, 0)])
+    index.add_request(*AREA, offer(10))
+    assert index.shortlist(10) == [4, 3]
+
+def test_outstanding_offers_spread_a_burst_over_the_area():
+    index = make_index([(pro_id, 5 - pro_id % 3, True, 0) for pro_id in range(1, 11)], shortlist_size=3)
+    for request_id in range(100, 200):
+        index.add_request(*AREA, offer(request_id))
+    counts = [len(index.offers_for(pro_id)) for pro_id in range(1, 11)]
+    assert sum(counts) == 300
+    assert max(counts) - min(counts) <= 1
+
+def test_withdrawn_offers_free_a_professional_up():
+    index = make_index([(1, 5, True, 0), (2, 4, True, 0), (3, 3, True, 0)])
+    index.add_request(*AREA, offer(10))
+    assert index.shortlist(10) == [1, 2]
+    index.add_request(*AREA, offer(11))
+    assert index.shortlist(11) == [3, 1]
+    assert index.remove_request(10) == [1, 2]
+    index.add_request(*AREA, offer(12))
+    assert index.shortlist(12) == [2, 1]
+
+def test_booked_requests_are_offered_in_turn(make_app):
+    app = make_app(DISPATCH_SHORTLIST_SIZE=2)
+    with app.app_context():
+        service = add_service()
+        add_user('user@test')
+        for i in range(4):
+            add_user(f'pro{i}@test', role='professional', service_type=service.id, is_verified=True)
+        db.session.commit()
+        service_id, address_id = service.id, default_address_id('user@test')
+
+    user = app.test_client()
+    login(user, 'user@test')
+    first = buy_now(user, service_id, address_id)
+    second = buy_now(user, service_id, address_id, datetime(2031, 1, 1, 10) + timedelta(days=1))
+
+    offered = {}
+    for i in range(4):
+        pro = app.test_client()
+        login(pro, f'pro{i}@test')
+        response = pro.get('/api/professional/service-requests')
+        assert response.status_code == 200
+        offered[i] = [row['id'] for row in response.get_json()]
+    # Each request went to two professionals, and nobody got both
+    assert sorted(offered.values()) == [[first], [first], [second], [second]]
@@ -0,0 +1,83 @@
+import json
+import os
+import re
+
+import pytest
+from conftest import add_service, add_user, buy_now, default_address_id, login
+from models import *
+from events import LocalBroker, event_hub, make_broker, subscriber_channels
+from metrics import METRICS
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def test_every_recorded_metric_is_registered():
+    used = set()
+    for name in os.listdir(BACKEND):
+        if name.endswith('.py'):
+            with open(os.path.join(BACKEND, name)) as f:
+                used |= set(re.findall(r"metrics\.(?:inc|set|observe|timer)\('(\w+)'", f.read()))
+    assert 'events_published_total' in used
+    assert used <= set(METRICS)
+
+def test_broker_is_local_unless_a_url_is_configured():
+    assert isinstance(make_broker(None, 10), LocalBroker)
+    assert make_broker('', 10).max_pending == 10
+
+@pytest.fixture
+def app(make_app):
+    return make_app(EVENTS_HEARTBEAT_SECONDS=1)
+
+@pytest.fixture
+def area(app):
+    """A customer, two professionals of the booked service and one of another"""
+    with app.app_context():
+        cleaning, plumbing = add_service('Cleaning'), add_service('Plumbing')
+        add_user('user@test')
+        for email, service in (('pro0@test', cleaning), ('pro1@test', cleaning), ('other@test', plumbing)):
+            add_user(email, role='professional', service_type=service.id)
+        db.session.commit()
+        users = {user.email: user for user in User.query}
+        return {
+            'service_id': cleaning.id,
+            'address_id': default_address_id('user@test'),
+            'channels': {email: subscriber_channels(user) for email, user in users.items()},
+        }
+
+def next_event(frames):
+    """The next event frame's data, skipping keep-alives; None if none came"""
+    for _ in range(3):
+        frame = next(frames)
+        if frame.startswith('id: '):
+            return json.loads(frame.split('data: ', 1)[1])
+    return None
+
+def test_new_request_reaches_customer_and_shortlist_only(app, area):
+    streams = {email: event_hub.open_stream(channels) for email, channels in area['channels'].items()}
+    try:
+        client = app.test_client()
+        login(client, 'user@test')
+        request_id = buy_now(client, area['service_id'], area['address_id'])
+
+        frames = {email: event_hub.stream(pubsub) for email, pubsub in streams.items()}
+        for stream in frames.values():
+            assert next(stream).startswith('retry: ')
+        for email in ('user@test', 'pro0@test', 'pro1@test'):
+            event = next_event(frames[email])
+            assert event['event'] == 'request.created'
+            assert event['request']['id'] == request_id
+        assert streams['other@test'].get_message(timeout=0.2) is None
+    finally:
+        for pubsub in streams.values():
+            event_hub.close_stream(pubsub)
+
+def test_event_metrics_are_exported(app, area):
+    client = app.test_client()
+    login(client, 'user@test')
+    buy_now(client, area['service_id'], area['address_id'])
+    pubsub = event_hub.open_stream(['admin'])
+    event_hub.close_stream(pubsub)
+
+    scrape = client.get('/metrics').get_data(as_text=True)
+    assert '# TYPE events_published_total counter' in scrape
+    assert 'events_published_total{event="created"}' in scrape
+    assert '# TYPE event_streams_opened_total counter' in scrape
@@ -0,0 +1,76 @@
+import csv
+import io
+from datetime import datetime
+
+import pytest
+from conftest import add_requests, add_service, add_user, login
+from models import *
+from exports import EXPORT_COLUMNS
+
+@pytest.fixture
+def app(make_app):
+    return make_app(EXPORT_CHUNK_ROWS=7)
+
+@pytest.fixture
+def admin(app):
+    """Admin client over 30 completed (reviewed) and 20 pending requests"""
+    with app.app_context():
+        service = add_service()
+        user = add_user('user@test')
+        pro = add_user('pro@test', role='professional', service_type=service.id)
+        add_requests(30, service, user, pro, 'completed')
+        add_requests(20, service, user, start=datetime(2031, 1, 1))
+        add_user('admin@test', role='admin')
+        db.session.commit()
+    client = app.test_client()
+    login(client, 'admin@test')
+    return client
+
+def read_csv(data):
+    return list(csv.DictReader(io.StringIO(data.decode())))
+
+def test_csv_is_streamed_in_chunks(admin):
+    response = admin.get('/api/admin/exports/service-requests', buffered=False)
+    assert response.status_code == 200
+    assert response.mimetype == 'text/csv'
+    chunks = list(response.response)
+    assert len(chunks) == 8  # 50 rows, 7 per chunk
+
+    rows = read_csv(b''.join(chunks))
+    assert list(rows[0]) == list(EXPORT_COLUMNS)
+    assert [int(row['id']) for row in rows] == list(range(1, 51))
+    completed = rows[0]
+    assert completed['service_name'] == 'Cleaning'
+    assert completed['professional_name'] == 'pro'
+    assert float(completed['rating']) == 4
+    assert rows[-1]['professional_name'] == ''
+
+def test_filters(admin):
+    response = admin.get('/api/admin/exports/service-requests?status=pending&scheduled_from=2031-01-01T05:00:00')
+    rows = read_csv(response.data)
+    assert len(rows) == 15
+    assert {row['status'] for row in rows} == {'pending'}
+    assert admin.get('/api/admin/exports/service-requests?service_id=x').status_code == 400
+
+def test_empty_export_still_has_a_header(admin):
+    response = admin.get('/api/admin/exports/service-requests?status=cancelled')
+    assert response.data.decode() == ','.join(EXPORT_COLUMNS) + '\n'
+
+def test_parquet_row_groups(admin):
+    pq = pytest.importorskip('pyarrow.parquet')
+    response = admin.get('/api/admin/exports/service-requests?format=parquet')
+    assert response.status_code == 200
+    parquet = pq.ParquetFile(io.BytesIO(response.data))
+    assert parquet.metadata.num_rows == 50
+    assert parquet.metadata.num_row_groups == 8
+    assert parquet.schema_arrow.names == list(EXPORT_COLUMNS)
+    table = parquet.read()
+    assert table.column('rating').to_pylist()[:30] == [4.0] * 30
+
+def test_cli_writes_the_same_rows(app, admin, tmp_path):
+    output = tmp_path / 'export.csv'
+    result = app.test_cli_runner().invoke(args=['export-requests', str(output), '--status', 'completed', '--chunk-rows', '4'])
+    assert result.exit_code == 0, result.output
+    rows = read_csv(output.read_bytes())
+    assert len(rows) == 30
+    assert rows == read_csv(admin.get('/api/admin/exports/service-requests?status=completed').data)
@@ -0,0 +1,63 @@
+import threading
+
+import pytest
+from conftest import PASSWORD, add_user, login
+from models import *
+from hashing import HashingBusy, PasswordHasher, password_hasher
+
+def test_process_pool_hashes_and_verifies():
+    hasher = PasswordHasher('pbkdf2:sha256:1000', max_workers=1, max_pending=2, timeout=30)
+    try:
+        password_hash = hasher.hash('secret')
+        assert password_hash.startswith('pbkdf2:sha256:1000$')
+        assert hasher.verify(password_hash, 'secret')
+        assert not hasher.verify(password_hash, 'wrong')
+    finally:
+        hasher.shutdown()
+
+def test_full_pool_raises_busy_instead_of_queueing():
+    hasher = PasswordHasher('pbkdf2:sha256:1000', max_workers=0, max_pending=1, timeout=0.1)
+    started, release = threading.Event(), threading.Event()
+
+    def slow(*args):
+        started.set()
+        release.wait(5)
+
+    holder = threading.Thread(target=hasher._run, args=(slow,))
+    holder.start()
+    try:
+        assert started.wait(5)
+        with pytest.raises(HashingBusy):
+            hasher.hash('secret')
+    finally:
+        release.set()
+        holder.join()
+    assert hasher.hash('secret')  # the slot is free again
+
+def test_login_rehashes_with_new_parameters(make_app):
+    app = make_app(PASSWORD_HASH_METHOD='pbkdf2:sha256:1000')
+    with app.app_context():
+        add_user('old@test')
+        db.session.commit()
+
+    app = make_app(PASSWORD_HASH_METHOD='pbkdf2:sha256:2000')
+    login(app.test_client(), 'old@test')
+    with app.app_context():
+        password_hash = User.query.filter_by(email='old@test').one().password_hash
+    assert password_hash.startswith('pbkdf2:sha256:2000$')
+    assert password_hasher.verify(password_hash, PASSWORD)
+
+def test_signin_answers_503_when_hashing_is_saturated(make_app):
+    app = make_app(PASSWORD_HASH_MAX_PENDING=1, PASSWORD_HASH_TIMEOUT=0)
+    with app.app_context():
+        add_user('busy@test')
+        db.session.commit()
+
+    slot = password_hasher._slots
+    slot.acquire()
+    try:
+        response = app.test_client().post('/api/signin', json={'email': 'busy@test', 'password': PASSWORD})
+    finally:
+        slot.release()
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
@@ -0,0 +1,63 @@
+import pytest
+from conftest import add_user, login
+from models import *
+
+ADDRESS = {
+    'address_line1': '2 Side St', 'address_line2': '', 'city': 'Chennai', 'state': 'TN',
+    'pincode': '600002', 'phone_number': '9000000001'
+}
+
+@pytest.fixture
+def user(app):
+    """A signed-in customer whose identity snapshot is cached"""
+    with app.app_context():
+        add_user('user@test')
+        add_user('admin@test', role='admin')
+        db.session.commit()
+    client = app.test_client()
+    login(client, 'user@test')
+    assert client.get('/api/addresses').status_code == 200
+    return client
+
+def block_elsewhere(app, email):
+    """Block a user the way another worker would: this process's cache isn't told"""
+    with app.app_context():
+        User.query.filter_by(email=email).update({'is_blocked': True})
+        db.session.commit()
+
+def test_cached_reads_need_no_identity_query(user, count_queries):
+    response, count = count_queries(lambda: user.get('/api/addresses'))
+    assert response.status_code == 200
+    assert count == 1  # the addresses themselves
+
+def test_block_from_another_worker_stops_writes_at_once(app, user):
+    block_elsewhere(app, 'user@test')
+    assert user.post('/api/addresses', json=ADDRESS).status_code == 401
+    with app.app_context():
+        assert Address.query.filter_by(pincode='600002').count() == 0
+
+def test_block_from_another_worker_shows_on_current_user(app, user):
+    block_elsewhere(app, 'user@test')
+    response = user.get('/api/current_user')
+    assert response.status_code == 403
+    assert 'blocked' in response.get_json()['message']
+
+def test_block_through_the_api(app, user):
+    admin = app.test_client()
+    login(admin, 'admin@test')
+    assert admin.post('/api/block-user', json={'email': 'user@test'}).get_json()['is_blocked'] is True
+    assert user.post('/api/addresses', json=ADDRESS).status_code == 401
+    assert user.get('/api/current_user').status_code == 403
+
+def test_admin_requests_reload_the_role(app, count_queries):
+    with app.app_context():
+        add_user('admin@test', role='admin')
+        db.session.commit()
+    admin = app.test_client()
+    login(admin, 'admin@test')
+    assert admin.get('/api/pending-professionals').status_code == 200
+
+    with app.app_context():
+        User.query.filter_by(email='admin@test').update({'role': 'user'})
+        db.session.commit()
+    assert admin.get('/api/pending-professionals').status_code == 403
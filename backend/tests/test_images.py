@@ -0,0 +1,22 @@
+import io
+import os
+
+from PIL import Image
+from images import IMAGE_FORMATS, IMAGE_SIZES, make_variants, variant_key
+from storage import storage
+
+def test_variants_are_rendered_in_the_upload_tmp_folder(make_app, tmp_path):
+    spool = tmp_path / 'spool'
+    app = make_app(UPLOAD_TMP_FOLDER=str(spool))
+    photo = io.BytesIO()
+    Image.new('RGB', (2000, 1000), 'teal').save(photo, 'PNG')
+    os.makedirs(storage.path('services'))
+    with open(storage.path('services/photo.png'), 'wb') as f:
+        f.write(photo.getvalue())
+
+    assert make_variants('services', 'photo.png') == len(IMAGE_SIZES) * len(IMAGE_FORMATS)
+    with Image.open(storage.path(variant_key('services', 'photo.png', 'card', 'webp'))) as card:
+        assert card.size == (480, 240)
+    # Every temp file was moved into storage, and none were written under the upload root
+    assert os.listdir(spool) == []
+    assert not os.path.exists(os.path.join(app.config['UPLOAD_FOLDER'], '.tmp'))
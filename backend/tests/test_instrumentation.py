@@ -0,0 +1,53 @@
+import pytest
+from conftest import add_user, login
+from models import *
+from instrumentation import QueryBudgetExceeded, fingerprint, query_budget, summarize_queries
+
+def test_fingerprint_ignores_literals_and_in_list_length():
+    assert fingerprint("SELECT * FROM users WHERE id = 5 AND email = 'a@b'") == \
+        'SELECT * FROM users WHERE id = ? AND email = ?'
+    assert fingerprint('SELECT id FROM users WHERE id IN (?, ?, ?)') == \
+        fingerprint('SELECT id FROM users WHERE id IN (?)')
+
+def test_summarize_flags_repeated_statements():
+    queries = [('SELECT * FROM users WHERE id = ?', 0.001)] * 5 + [('SELECT 1', 0.01)]
+    stats = summarize_queries(queries, n_plus_one_threshold=5)
+    assert stats['query_count'] == 6
+    assert stats['slowest'][0]['statement'] == 'SELECT 1'
+    assert stats['n_plus_one'] == [{'statement': 'SELECT * FROM users WHERE id = ?', 'count': 5}]
+
+@pytest.fixture
+def loop_app(app):
+    """app with a route that loads users one query at a time"""
+    @app.route('/test/user-loop')
+    @query_budget(2)
+    def user_loop():
+        for user_id in range(1, 7):
+            db.session.get(User, user_id)
+        return 'ok'
+
+    with app.app_context():
+        add_user('admin@test', role='admin')
+        db.session.commit()
+    return app
+
+def test_server_timing_header(app):
+    response = app.test_client().get('/api/categories/active')
+    assert response.status_code == 200
+    assert response.headers['Server-Timing'].startswith('db;dur=')
+    assert 'queries"' in response.headers['Server-Timing']
+
+def test_route_over_budget_fails_in_enforcing_mode(loop_app):
+    with pytest.raises(QueryBudgetExceeded, match='budget is 2'):
+        loop_app.test_client().get('/test/user-loop')
+
+def test_route_over_budget_is_reported_when_not_enforcing(loop_app):
+    loop_app.config['SQL_ENFORCE_QUERY_BUDGETS'] = False
+    assert loop_app.test_client().get('/test/user-loop').status_code == 200
+
+    client = loop_app.test_client()
+    login(client, 'admin@test')
+    route = client.get('/api/admin/sql-metrics').get_json()['user_loop']
+    assert route['max_queries'] >= 6
+    assert route['n_plus_one_requests'] >= 1
+    assert 'FROM users' in route['top_repeated'][0]['statement']
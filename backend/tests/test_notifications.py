@@ -0,0 +1,33 @@
+from datetime import datetime, timedelta
+
+from conftest import add_user, login
+from models import *
+
+def test_notification_pages_follow_created_at(app, client):
+    with app.app_context():
+        user = add_user('user@test')
+        start = datetime(2030, 1, 1)
+        # Ids out of step with the times, as when queued notifications land late
+        for hours in (3, 1, 4, 1, 5, 9, 2):
+            db.session.add(Notification(
+                recipient_id=user.id, type='alert', message=f'{hours}h', created_at=start + timedelta(hours=hours)
+            ))
+        db.session.commit()
+    login(client, 'user@test')
+
+    messages, cursor = [], None
+    while True:
+        response = client.get('/api/notifications', query_string={'limit': 2, 'before': cursor or ''})
+        assert response.status_code == 200
+        messages += [n['message'] for n in response.get_json()]
+        cursor = response.headers.get('X-Next-Cursor')
+        if cursor is None:
+            break
+    assert messages == ['9h', '5h', '4h', '3h', '2h', '1h', '1h']
+
+def test_notifications_reject_a_bad_cursor(app, client):
+    with app.app_context():
+        add_user('user@test')
+        db.session.commit()
+    login(client, 'user@test')
+    assert client.get('/api/notifications?before=12').status_code == 400
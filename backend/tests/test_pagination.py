@@ -0,0 +1,48 @@
+from datetime import datetime
+
+import pytest
+from conftest import add_requests, add_service, add_user, login
+from models import *
+
+@pytest.fixture
+def admin(app):
+    """An admin client and 5 requests, 2 of them saved without a request_date"""
+    with app.app_context():
+        service = add_service()
+        user = add_user('user@test')
+        add_user('admin@test', role='admin')
+        rows = add_requests(5, service, user)
+        for row in rows[1:3]:
+            row.request_date = None
+        db.session.commit()
+    client = app.test_client()
+    login(client, 'admin@test')
+    return client
+
+def test_admin_pages_reach_requests_without_a_request_date(admin):
+    ids, cursor = [], None
+    while True:
+        response = admin.get('/api/admin/service-requests', query_string={'limit': 2, 'cursor': cursor or ''})
+        assert response.status_code == 200
+        ids += [row['id'] for row in response.get_json()]
+        cursor = response.headers.get('X-Next-Cursor')
+        if cursor is None:
+            break
+    # Dated ones newest first, then the undated ones
+    assert ids == [1, 4, 5, 3, 2]
+
+def test_upgrade_db_dates_requests_before_the_rollup_backfill(app, admin):
+    with app.app_context():
+        row = db.session.get(ServiceRequest, 2)
+        row.status, row.accepted_at = 'accepted', datetime(2029, 12, 30)
+        DailyRollup.__table__.drop(db.engine)
+        db.session.commit()
+
+    result = app.test_cli_runner().invoke(args=['upgrade-db'])
+    assert result.exit_code == 0, result.output
+    assert 'service_requests: set request_date on 2 rows' in result.output
+    assert 'daily_rollups: backfilled' in result.output
+    with app.app_context():
+        assert ServiceRequest.query.filter(ServiceRequest.request_date.is_(None)).count() == 0
+        assert db.session.get(ServiceRequest, 2).request_date == datetime(2029, 12, 30)
+        assert db.session.get(ServiceRequest, 3).request_date == datetime(2030, 1, 1, 2)
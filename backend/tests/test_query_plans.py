@@ -0,0 +1,17 @@
+import pytest
+from sqlalchemy.dialects import sqlite
+from commands import hot_queries
+from models import *
+
+@pytest.mark.parametrize('name', list(hot_queries()))
+def test_hot_query_uses_an_index(app, name):
+    stmt = hot_queries()[name]
+    sql = str(stmt.compile(dialect=sqlite.dialect(), compile_kwargs={'literal_binds': True}))
+    with app.app_context(), db.engine.connect() as conn:
+        plan = [row[-1] for row in conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {sql}')]
+    assert not [step for step in plan if step.startswith('SCAN') and 'USING' not in step], plan
+
+def test_check_query_plans_command(app):
+    result = app.test_cli_runner().invoke(args=['check-query-plans'])
+    assert result.exit_code == 0, result.output
+    assert 'FAIL' not in result.output
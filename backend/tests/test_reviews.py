@@ -0,0 +1,51 @@
+from datetime import datetime
+
+import pytest
+from conftest import add_requests, add_service, add_user, login
+from models import *
+
+@pytest.fixture
+def done(app):
+    """A signed-in customer with one completed, not yet reviewed request"""
+    with app.app_context():
+        service = add_service()
+        user = add_user('user@test')
+        pro = add_user('pro@test', role='professional', service_type=service.id)
+        row, = add_requests(1, service, user, pro, 'accepted')
+        row.status = 'completed'
+        row.completion_date = datetime(2030, 1, 1, 2)
+        db.session.commit()
+        request_id = row.id
+    client = app.test_client()
+    login(client, 'user@test')
+    return client, request_id
+
+def aggregates(app):
+    with app.app_context():
+        pro = Professional.query.filter_by(email='pro@test').one()
+        return pro.review_count, pro.rating_sum, pro.rating
+
+@pytest.mark.parametrize('rating', [None, 0, 6, 'five', 4.5, True, [4]])
+def test_new_review_needs_a_whole_star_rating(app, done, rating):
+    client, request_id = done
+    response = client.post('/api/reviews', json={'request_id': request_id, 'rating': rating})
+    assert response.status_code == 400
+    assert aggregates(app) == (0, 0, 3)
+    with app.app_context():
+        assert Review.query.count() == 0
+
+def test_reviews_keep_the_aggregates_in_step(app, done):
+    client, request_id = done
+    response = client.post('/api/reviews', json={'request_id': request_id, 'rating': '4', 'comment': 'good'})
+    assert response.status_code == 201
+    assert aggregates(app) == (1, 4, 4.0)
+
+    review_id = client.get(f'/api/reviews?request_id={request_id}').get_json()['id']
+    assert client.put(f'/api/reviews/{review_id}', json={'rating': 2.0}).status_code == 200
+    assert aggregates(app) == (1, 2, 2.0)
+
+    # A bad edit leaves both the review and the aggregates alone
+    assert client.put(f'/api/reviews/{review_id}', json={'rating': 9}).status_code == 400
+    assert aggregates(app) == (1, 2, 2.0)
+    with app.app_context():
+        assert db.session.get(Review, review_id).rating == 2
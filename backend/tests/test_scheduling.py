@@ -0,0 +1,93 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+from conftest import add_requests, add_service, add_user, login
+from models import *
+from scheduling import Calendar, booking_end
+
+START = datetime(2030, 1, 1, 10)
+
+def test_booking_end_uses_time_required_times_quantity():
+    assert booking_end(START, 90, 2) == START + timedelta(minutes=180)
+    assert booking_end(START, None, None, default_minutes=45) == START + timedelta(minutes=45)
+
+def test_dense_calendar_matches_brute_force():
+    rng = random.Random(7)
+    calendar, bookings = Calendar(), []
+    for request_id in range(2000):
+        start = START + timedelta(minutes=rng.randrange(0, 60 * 24 * 30, 15))
+        end = start + timedelta(minutes=rng.choice((30, 60, 240, 600)))
+        calendar.add(start, end, request_id)
+        bookings.append((start, end, request_id))
+    for start, end, request_id in bookings[::3]:  # overlapping bookings stay indexed correctly
+        assert calendar.remove(start, request_id)
+    bookings = [booking for i, booking in enumerate(bookings) if i % 3]
+
+    for _ in range(500):
+        start = START + timedelta(minutes=rng.randrange(-600, 60 * 24 * 31, 5))
+        end = start + timedelta(minutes=rng.choice((15, 60, 180)))
+        clashes = [b_end for b_start, b_end, _ in bookings if b_start < end and b_end > start]
+        assert calendar.busy_until(start, end) == (max(clashes) if clashes else None)
+
+def test_next_free_skips_back_to_back_bookings():
+    calendar = Calendar()
+    for hour in range(3):
+        calendar.add(START + timedelta(hours=hour), START + timedelta(hours=hour + 1), hour)
+    assert calendar.next_free(START, timedelta(minutes=30)) == START + timedelta(hours=3)
+    assert calendar.next_free(START - timedelta(hours=1), timedelta(hours=1)) == START - timedelta(hours=1)
+
+@pytest.fixture
+def booked(app):
+    """Two professionals of a 60 minute service; pro0 is booked 10:00-11:00
+    and an open request starts at 10:30"""
+    with app.app_context():
+        service = add_service(time_required=60)
+        user = add_user('user@test')
+        pros = [
+            add_user(f'pro{i}@test', role='professional', service_type=service.id, rating=4 - i)
+            for i in range(2)
+        ]
+        taken, = add_requests(1, service, user, pros[0], 'accepted', start=START)
+        taken.scheduled_end = START + timedelta(hours=1)
+        clashing, = add_requests(1, service, user, start=START + timedelta(minutes=30))
+        clashing.scheduled_end = START + timedelta(minutes=90)
+        db.session.commit()
+        return {'service_id': service.id, 'clashing_id': clashing.id, 'pro_ids': [pro.id for pro in pros]}
+
+def test_accepting_an_overlapping_booking_is_a_conflict(app, booked):
+    client = app.test_client()
+    login(client, 'pro0@test')
+    response = client.patch(f"/api/professional/service-requests/{booked['clashing_id']}", json={'action': 'accept'})
+    assert response.status_code == 409
+    assert response.get_json()['conflicting_request']['scheduled_date'] == START.isoformat()
+
+    client = app.test_client()
+    login(client, 'pro1@test')
+    response = client.patch(f"/api/professional/service-requests/{booked['clashing_id']}", json={'action': 'accept'})
+    assert response.status_code == 200
+
+def test_available_professionals_leaves_out_booked_ones(app, booked):
+    client = app.test_client()
+    login(client, 'user@test')
+    query = f"service_id={booked['service_id']}&pincode=600001"
+    busy = client.get(f'/api/schedule/available-professionals?{query}&start=2030-01-01T10:30:00').get_json()
+    assert [pro['id'] for pro in busy['professionals']] == booked['pro_ids'][1:]
+    assert busy['end'] == '2030-01-01T11:30:00'
+
+    free = client.get(f'/api/schedule/available-professionals?{query}&start=2030-01-01T11:00:00').get_json()
+    # least loaded first: pro0 already has a booking
+    assert [pro['id'] for pro in free['professionals']] == booked['pro_ids'][::-1]
+
+def test_slot_suggestions_count_free_professionals(app, booked):
+    client = app.test_client()
+    login(client, 'user@test')
+    slots = client.get(
+        f"/api/schedule/suggestions?service_id={booked['service_id']}&pincode=600001"
+        '&after=2030-01-01T09:40:00&count=3'
+    ).get_json()
+    assert slots == [
+        {'start': '2030-01-01T10:00:00', 'end': '2030-01-01T11:00:00', 'free_professionals': 1},
+        {'start': '2030-01-01T10:30:00', 'end': '2030-01-01T11:30:00', 'free_professionals': 1},
+        {'start': '2030-01-01T11:00:00', 'end': '2030-01-01T12:00:00', 'free_professionals': 2},
+    ]
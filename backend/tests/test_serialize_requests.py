@@ -0,0 +1,78 @@
+import pytest
+from datetime import datetime, timedelta
+from conftest import add_requests, add_service, add_user, login
+from models import *
+from api import serialize_requests
+
+LIST_ENDPOINTS = [
+    ('professional', '/api/professional/accepted-requests', {'accepted'}),
+    ('professional', '/api/professional/completed-requests', {'completed'}),
+    ('user', '/api/user/current-requests', {'pending', 'accepted'}),
+    ('user', '/api/user/completed-requests', {'completed'}),
+]
+
+@pytest.fixture
+def accounts(app):
+    """A customer and a professional with 1 request per status, and another
+    pair with 50, so query counts can be compared across page sizes"""
+    with app.app_context():
+        service = add_service()
+        accounts = {}
+        for size in (1, 50):
+            user = add_user(f'user{size}@test')
+            pro = add_user(f'pro{size}@test', role='professional', service_type=service.id)
+            for day, status in enumerate(('pending', 'accepted', 'completed')):
+                add_requests(
+                    size, service, user, None if status == 'pending' else pro, status,
+                    start=datetime(2030, 1, 1) + timedelta(weeks=day)
+                )
+            accounts[size] = {'user': user.email, 'professional': pro.email}
+        add_user('admin@test', role='admin')
+        db.session.commit()
+    return accounts
+
+def queries_for(app, count_queries, email, url):
+    client = app.test_client()
+    login(client, email)
+    client.get(url)  # warm the identity cache, as any earlier request would
+    response, count = count_queries(lambda: client.get(url))
+    assert response.status_code == 200, response.get_json()
+    return response.get_json(), count
+
+@pytest.mark.parametrize('role,url,statuses', LIST_ENDPOINTS)
+def test_list_endpoint_queries_do_not_grow_with_rows(app, count_queries, accounts, role, url, statuses):
+    counts = {}
+    for size in (1, 50):
+        rows, counts[size] = queries_for(app, count_queries, accounts[size][role], url)
+        assert len(rows) == size * len(statuses)
+        assert {row['status'] for row in rows} == statuses
+    assert counts[1] == counts[50]
+
+def test_admin_page_queries_do_not_grow_with_page_size(app, count_queries, accounts):
+    counts = {}
+    for size in (1, 50):
+        rows, counts[size] = queries_for(app, count_queries, 'admin@test', f'/api/admin/service-requests?limit={size}')
+        assert len(rows) == size
+    assert counts[1] == counts[50]
+
+def test_serialize_requests_uses_fixed_number_of_queries(app, count_queries, accounts):
+    with app.app_context():
+        pro = User.query.filter_by(email=accounts[50]['professional']).one()
+        rows = ServiceRequest.query.filter_by(professional_id=pro.id).order_by(ServiceRequest.id).all()
+        counts = {}
+        for size in (1, 50):
+            result, counts[size] = count_queries(lambda: serialize_requests(rows[:size]))
+            assert len(result) == size
+        # services, professional names, default addresses, reviews
+        assert counts[1] == counts[50] == 4
+
+def test_serialize_requests_output(app, accounts):
+    with app.app_context():
+        pro = User.query.filter_by(email=accounts[1]['professional']).one()
+        row = ServiceRequest.query.filter_by(professional_id=pro.id, status='completed').one()
+        data = serialize_requests([row])[0]
+    assert data['service_name'] == 'Cleaning'
+    assert data['professional_name'] == 'pro1'
+    assert data['rating'] == 4
+    assert data['user_address'] == '1 Main St, Chennai, TN, 600001'
+    assert data['scheduled_date'] == '2030-01-15T00:00:00'
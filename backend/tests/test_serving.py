@@ -0,0 +1,66 @@
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+import pytest
+from conftest import make_config
+from main import create_app
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def test_health_and_readiness(client):
+    assert client.get('/healthz').get_json() == {'status': 'ok'}
+    assert client.get('/readyz').get_json() == {'status': 'ok', 'database': 'ok'}
+
+def test_not_ready_without_database(tmp_path):
+    missing = tmp_path / 'missing' / 'frenzy.db'  # its directory doesn't exist
+    app = create_app(make_config(tmp_path, SQLALCHEMY_DATABASE_URI=f'sqlite:///{missing}'))
+    response = app.test_client().get('/readyz')
+    assert response.status_code == 503
+    assert response.get_json()['database'] == 'unreachable'
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def get(url):
+    with urllib.request.urlopen(url, timeout=5) as response:
+        return response.status
+
+def test_gunicorn_serves_with_several_workers(tmp_path):
+    pytest.importorskip('gunicorn')
+    port = free_port()
+    env = dict(
+        os.environ,
+        GUNICORN_BIND=f'127.0.0.1:{port}',
+        GUNICORN_WORKERS='2',
+        GUNICORN_THREADS='2',
+        GUNICORN_ACCESS_LOG=os.devnull,
+        SECRET_KEY='test',
+        SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'serve.db'}",
+        METRICS_DIR=str(tmp_path / 'metrics'),
+        UPLOAD_FOLDER=str(tmp_path / 'uploads'),
+    )
+    log = tmp_path / 'gunicorn.log'
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:app'],
+        cwd=BACKEND, env=env, stdout=subprocess.DEVNULL, stderr=log.open('w')
+    )
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                assert get(f'http://127.0.0.1:{port}/healthz') == 200
+                break
+            except OSError:
+                if server.poll() is not None or time.monotonic() > deadline:
+                    pytest.fail(f'gunicorn did not start: {log.read_text()[-2000:]}')
+                time.sleep(0.2)
+        assert all(get(f'http://127.0.0.1:{port}/readyz') == 200 for _ in range(10))
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
@@ -0,0 +1,64 @@
+import hashlib
+import io
+import os
+
+import pytest
+from conftest import add_user, login
+from models import *
+from storage import store_upload
+from werkzeug.datastructures import FileStorage
+
+IMAGE = b'not really a png' * 100
+IMAGE_NAME = hashlib.sha256(IMAGE).hexdigest() + '.png'
+
+@pytest.fixture
+def admin(app):
+    with app.app_context():
+        add_user('admin@test', role='admin')
+        db.session.commit()
+    client = app.test_client()
+    login(client, 'admin@test')
+    return client
+
+def blob_path(app):
+    return os.path.join(app.config['SERVICE_UPLOAD_FOLDER'], IMAGE_NAME)
+
+def post_service(admin, **fields):
+    form = {'name': 'Cleaning', 'description': 'Cleaning', 'time_required': '60', 'base_price': '100'}
+    form.update(fields)
+    form = {name: value for name, value in form.items() if value is not None}
+    form['service_image'] = (io.BytesIO(IMAGE), 'photo.png')
+    return admin.post('/api/services', data=form, content_type='multipart/form-data')
+
+def test_a_created_service_keeps_its_image(app, admin):
+    assert post_service(admin).status_code == 201
+    assert os.path.exists(blob_path(app))
+    with app.app_context():
+        assert StoredFile.query.one().ref_count == 1
+
+def test_invalid_service_stores_no_image(app, admin):
+    assert post_service(admin, base_price=None).status_code == 400
+    assert not os.path.exists(blob_path(app))
+
+def test_rolled_back_service_leaves_no_image(app, admin):
+    assert post_service(admin, time_required='an hour').status_code == 500
+    assert not os.path.exists(blob_path(app))
+    with app.app_context():
+        assert StoredFile.query.count() == 0
+
+def store(app):
+    with app.test_request_context():
+        store_upload(FileStorage(io.BytesIO(IMAGE), 'photo.png'), 'services', 10 ** 6)
+        db.session.close()  # a request that returned without committing
+
+def test_uncommitted_upload_is_deleted_when_the_session_ends(app):
+    store(app)
+    assert not os.path.exists(blob_path(app))
+
+def test_uncommitted_upload_keeps_a_blob_others_reference(app):
+    with app.app_context():
+        # A reference whose blob went missing, or that another request committed meanwhile
+        db.session.add(StoredFile(key=f'services/{IMAGE_NAME}', sha256='-', size=len(IMAGE), ref_count=1))
+        db.session.commit()
+    store(app)
+    assert os.path.exists(blob_path(app))
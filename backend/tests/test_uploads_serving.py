@@ -0,0 +1,66 @@
+import hashlib
+import os
+
+import pytest
+from conftest import add_user, login
+from models import *
+
+PDF = b'%PDF-1.4\n' + bytes(range(256)) * 64
+
+@pytest.fixture
+def document(app):
+    """A content-addressed PDF in the upload folder; returns its name"""
+    name = hashlib.sha256(PDF).hexdigest() + '.pdf'
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    with open(os.path.join(app.config['UPLOAD_FOLDER'], name), 'wb') as f:
+        f.write(PDF)
+    with app.app_context():
+        add_user('admin@test', role='admin')
+        db.session.commit()
+    return name
+
+@pytest.fixture
+def admin(app, document):
+    client = app.test_client()
+    login(client, 'admin@test')
+    return client
+
+def test_content_hash_names_are_strong_etags_cached_forever(admin, document):
+    response = admin.get(f'/documents/{document}')
+    assert response.status_code == 200
+    assert response.data == PDF
+    assert response.get_etag() == (document, False)
+    assert response.cache_control.immutable
+    assert response.cache_control.private
+    assert response.cache_control.max_age == 365 * 24 * 3600
+
+def test_if_none_match_answers_304(admin, document, app):
+    os.remove(os.path.join(app.config['UPLOAD_FOLDER'], document))  # 304 must not need the file
+    response = admin.get(f'/documents/{document}', headers={'If-None-Match': f'"{document}"'})
+    assert response.status_code == 304
+    assert response.data == b''
+
+def test_byte_ranges(admin, document):
+    response = admin.get(f'/documents/{document}', headers={'Range': 'bytes=100-199'})
+    assert response.status_code == 206
+    assert response.data == PDF[100:200]
+    assert response.headers['Content-Range'] == f'bytes 100-199/{len(PDF)}'
+
+def test_other_names_are_revalidated(admin, app):
+    with open(os.path.join(app.config['UPLOAD_FOLDER'], 'manual.pdf'), 'wb') as f:
+        f.write(PDF)
+    response = admin.get('/documents/manual.pdf')
+    assert response.status_code == 200
+    assert response.cache_control.no_cache
+    assert not response.cache_control.immutable
+    etag = response.headers['ETag']
+    assert admin.get('/documents/manual.pdf', headers={'If-None-Match': etag}).status_code == 304
+
+def test_x_accel_redirect_hands_off_to_the_proxy(admin, document, app):
+    app.config['UPLOAD_SENDFILE'] = 'x-accel-redirect'
+    response = admin.get(f'/documents/{document}')
+    assert response.status_code == 200
+    assert response.data == b''
+    assert response.headers['X-Accel-Redirect'] == f'/_uploads/{document}'
+    assert response.mimetype == 'application/pdf'
+    assert admin.get('/documents/missing.pdf').status_code == 404
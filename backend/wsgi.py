@@ -0,0 +1,10 @@
+"""Production entry point.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Unlike `python main.py` this does not enable the debugger or create tables
+on import; run `flask upgrade-db` once before starting the server.
+"""
+from main import create_app
+
+app = create_app()
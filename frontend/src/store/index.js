@@ -49,7 +49,7 @@ export default createStore({
     isAdmin: state => state.user?.role === 'admin',
     currentUser: state => state.user,
     userImage: state => state.user?.image_file
-      ? `http://localhost:5000/profile_pictures/${state.user.image_file}`
-      : `http://localhost:5000/profile_pictures/profile.png`
+      ? `http://localhost:5000/profile_pictures/${state.user.image_file}?size=card`
+      : `http://localhost:5000/profile_pictures/profile.png?size=card`
   },
 });
\ No newline at end of file